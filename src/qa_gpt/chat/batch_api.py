@@ -0,0 +1,228 @@
+import asyncio
+import json
+import logging
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+import openai
+from pydantic import BaseModel
+
+from src.qa_gpt.chat.chat import async_client
+from src.qa_gpt.chat.llm_cache import llm_response_cache
+from src.qa_gpt.chat.model_routing import ModelRoute, model_routing_policy
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchRequestError(RuntimeError):
+    """A request of a batch job that returned no usable response."""
+
+
+@dataclass
+class BatchRequest:
+    """A structured chat request of a batch job."""
+
+    custom_id: str
+    messages: list[dict]
+    res_obj: type[BaseModel]
+    route_key: str | None = None  # Defaults to the name of the response class
+
+    def route(self, model: str | None = None) -> ModelRoute:
+        """Route of the request, with the model replaced if one is given."""
+        route = model_routing_policy.route(self.route_key or self.res_obj.__name__)
+        return ModelRoute(model, route.max_tokens) if model else route
+
+
+def _strict_schema(schema: dict) -> dict:
+    """Apply the rules of strict structured outputs to a JSON schema and its subschemas.
+
+    Every object forbids additional properties and requires all of its properties.
+    """
+    schema = dict(schema)
+    if schema.get("type") == "object" or "properties" in schema:
+        schema["additionalProperties"] = False
+        schema["properties"] = {
+            name: _strict_schema(subschema)
+            for name, subschema in schema.get("properties", {}).items()
+        }
+        schema["required"] = list(schema["properties"])
+    if "$defs" in schema:
+        schema["$defs"] = {name: _strict_schema(sub) for name, sub in schema["$defs"].items()}
+    if isinstance(schema.get("items"), dict):
+        schema["items"] = _strict_schema(schema["items"])
+    for key in ("anyOf", "allOf"):
+        if key in schema:
+            schema[key] = [_strict_schema(subschema) for subschema in schema[key]]
+    if "default" in schema and schema["default"] is None:
+        del schema["default"]
+    return schema
+
+
+def response_format(res_obj: type[BaseModel]) -> dict:
+    """Build the strict JSON schema response format of a structured request.
+
+    Args:
+        res_obj: The response class
+
+    Returns:
+        dict: The "response_format" of a chat completions request body
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": res_obj.__name__,
+            "schema": _strict_schema(res_obj.model_json_schema()),
+            "strict": True,
+        },
+    }
+
+
+def write_batch_input(
+    requests: list[BatchRequest], path: str | Path, model: str | None = None
+) -> Path:
+    """Serialize requests into the JSONL input file of a batch job.
+
+    Args:
+        requests: The requests, their custom IDs must be unique
+        path: Path of the JSONL file
+        model: Name of the model answering all requests, None uses the model of each route
+
+    Returns:
+        Path: The path of the written file
+    """
+    path = Path(path)
+    with open(path, "w", encoding="utf-8") as f:
+        for request in requests:
+            route = request.route(model)
+            line = {
+                "custom_id": request.custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {
+                    "model": route.model,
+                    "messages": request.messages,
+                    "response_format": response_format(request.res_obj),
+                    **route.params,
+                },
+            }
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return path
+
+
+def parse_batch_output(
+    output_text: str, requests: list[BatchRequest]
+) -> dict[str, BaseModel | Exception]:
+    """Parse the output and error files of a batch job into the responses of its requests.
+
+    Args:
+        output_text: Concatenated JSONL lines of the output and error files
+        requests: The requests of the batch job
+
+    Returns:
+        dict: Parsed response or error of each request by custom ID, requests missing from the
+            output get a BatchRequestError
+    """
+    requests_by_id = {request.custom_id: request for request in requests}
+    results: dict[str, BaseModel | Exception] = {}
+    for line in output_text.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        custom_id = entry.get("custom_id")
+        request = requests_by_id.get(custom_id)
+        if request is None:
+            continue
+        try:
+            response = entry.get("response") or {}
+            if entry.get("error") or response.get("status_code") != 200:
+                raise BatchRequestError(f"{entry.get('error') or response.get('body')}")
+            message = response["body"]["choices"][0]["message"]
+            if message.get("refusal"):
+                raise BatchRequestError(f"Refused: {message['refusal']}")
+            results[custom_id] = request.res_obj.model_validate_json(message["content"])
+        except Exception as e:
+            results[custom_id] = e if isinstance(e, BatchRequestError) else BatchRequestError(e)
+
+    for custom_id in requests_by_id:
+        results.setdefault(custom_id, BatchRequestError("Missing from the batch output"))
+    return results
+
+
+async def run_batch(
+    requests: list[BatchRequest],
+    client: openai.AsyncOpenAI | None = None,
+    model: str | None = None,
+    poll_seconds: float = 60,
+) -> dict[str, BaseModel | Exception]:
+    """Submit requests as a batch job, wait for it to finish and parse its results.
+
+    Batch jobs are cheaper and run under a separate quota, at the cost of finishing within the
+    completion window instead of right away. If the LLM response cache is enabled, successful
+    responses are also stored in it, so a later synchronous run of the same requests doesn't pay
+    for them again.
+
+    Args:
+        requests: The requests, their custom IDs must be unique
+        client: Client of an OpenAI-compatible API, defaults to the client of `chat`
+        model: Name of the model answering all requests, None uses the model of each route.
+            Structured output failures are not escalated, they are returned as errors.
+        poll_seconds: Seconds between status checks of the job
+
+    Returns:
+        dict: Parsed response or error of each request by custom ID
+
+    Raises:
+        BatchRequestError: If the job as a whole fails, expires or is cancelled
+    """
+    client = client or async_client
+    with tempfile.TemporaryDirectory() as folder:
+        input_path = write_batch_input(requests, Path(folder) / "batch_input.jsonl", model)
+        with open(input_path, "rb") as f:
+            input_file = await client.files.create(file=f, purpose="batch")
+
+    batch = await client.batches.create(
+        input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window="24h"
+    )
+    logger.info(f"Submitted batch {batch.id} of {len(requests)} requests")
+    while batch.status not in BATCH_FINAL_STATUSES:
+        await asyncio.sleep(poll_seconds)
+        batch = await client.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        if counts is not None:
+            logger.info(
+                f"Batch {batch.id} is {batch.status}: {counts.completed}/{counts.total} completed, "
+                f"{counts.failed} failed"
+            )
+
+    if batch.status != "completed":
+        raise BatchRequestError(f"Batch {batch.id} ended as {batch.status}: {batch.errors}")
+
+    output_text = ""
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id:
+            content = await client.files.content(file_id)
+            output_text += content.text.rstrip("\n") + "\n"
+
+    results = parse_batch_output(output_text, requests)
+    if llm_response_cache.enabled:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, _cache_results, requests, results, model)
+    return results
+
+
+def _cache_results(
+    requests: list[BatchRequest], results: dict[str, BaseModel | Exception], model: str | None
+) -> None:
+    """Store the successful responses of a batch job under the keys of their requests."""
+    for request in requests:
+        result = results[request.custom_id]
+        if not isinstance(result, Exception):
+            route = request.route(model)
+            key = llm_response_cache.make_key(
+                route.model, request.messages, request.res_obj, route.params
+            )
+            llm_response_cache.put(key, result)
@@ -1,66 +1,234 @@
+import asyncio
+import logging
 import os
 
 import openai
-from pydantic import BaseModel
+from openai.types.chat import ChatCompletionMessage
+from pydantic import BaseModel, ValidationError
 
+from src.qa_gpt.chat.llm_cache import llm_response_cache
+from src.qa_gpt.chat.llm_scheduler import llm_scheduler
+from src.qa_gpt.chat.model_routing import ModelRoute, model_routing_policy
 from src.qa_gpt.chat.private_keys import openapi_key
 from src.qa_gpt.chat.rate_limit_decorator import handle_openai_errors
 
 os.environ["OPENAI_API_KEY"] = openapi_key
+logger = logging.getLogger(__name__)
+
 sync_client = openai.OpenAI()
 async_client = openai.AsyncOpenAI()
 
 
+class StructuredOutputRefusal(ValueError):
+    """The model refused to produce the structured response."""
+
+
+# Failures of the model to produce the structured response, retrying the same model won't help
+STRUCTURED_OUTPUT_ERRORS = (
+    openai.LengthFinishReasonError,
+    openai.ContentFilterFinishReasonError,
+    ValidationError,
+    StructuredOutputRefusal,
+)
+
+
 def check_api():
     if len(os.environ["OPENAI_API_KEY"]) == 0:
         raise ValueError("OPENAI_API_KEY is not set properly, got empty")
 
 
+def _settle(tokens: int, response) -> None:
+    """Settle a scheduler reservation with the usage reported in a response."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        llm_scheduler.settle(tokens, None)
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    llm_scheduler.settle(
+        tokens,
+        usage.total_tokens,
+        prompt_tokens=usage.prompt_tokens,
+        cached_tokens=getattr(details, "cached_tokens", None),
+    )
+
+
 @handle_openai_errors()
-async def get_chat_gpt_response_async(messages):
+async def _request_chat_gpt_response_async(messages, route: ModelRoute):
     check_api()
-    MODEL = "gpt-4o-mini"
+    tokens = llm_scheduler.estimate_request_tokens(messages, max_completion_tokens=route.max_tokens)
+    await llm_scheduler.acquire(tokens)
     chat_completion = await async_client.chat.completions.create(
         messages=messages,
-        model=MODEL,
+        model=route.model,
+        **route.params,
     )
+    _settle(tokens, chat_completion)
     return chat_completion.choices[0].message
 
 
-@handle_openai_errors()
-async def get_chat_gpt_response_structure_async(messages: list, res_obj: BaseModel):
+@handle_openai_errors(no_retry=STRUCTURED_OUTPUT_ERRORS)
+async def _request_chat_gpt_response_structure_async(
+    messages: list, res_obj: BaseModel, route: ModelRoute
+):
     check_api()
-    MODEL = "gpt-4o-mini"
+    tokens = llm_scheduler.estimate_request_tokens(messages, res_obj, route.max_tokens)
+    await llm_scheduler.acquire(tokens)
 
     response = await async_client.beta.chat.completions.parse(
-        model=MODEL,
+        model=route.model,
         messages=messages,
         response_format=res_obj,
+        **route.params,
     )
+    _settle(tokens, response)
 
-    return response.choices[0].message.parsed
+    return _parsed(response)
 
 
 @handle_openai_errors()
-def get_chat_gpt_response(messages):
+def _request_chat_gpt_response(messages, route: ModelRoute):
     check_api()
-    MODEL = "gpt-4o-mini"
+    tokens = llm_scheduler.estimate_request_tokens(messages, max_completion_tokens=route.max_tokens)
+    llm_scheduler.acquire_sync(tokens)
     chat_completion = sync_client.chat.completions.create(
         messages=messages,
-        model=MODEL,
+        model=route.model,
+        **route.params,
     )
+    _settle(tokens, chat_completion)
     return chat_completion.choices[0].message
 
 
-@handle_openai_errors()
-def get_chat_gpt_response_structure(messages: list, res_obj: BaseModel):
+@handle_openai_errors(no_retry=STRUCTURED_OUTPUT_ERRORS)
+def _request_chat_gpt_response_structure(messages: list, res_obj: BaseModel, route: ModelRoute):
     check_api()
-    MODEL = "gpt-4o-mini"
+    tokens = llm_scheduler.estimate_request_tokens(messages, res_obj, route.max_tokens)
+    llm_scheduler.acquire_sync(tokens)
 
     response = sync_client.beta.chat.completions.parse(
-        model=MODEL,
+        model=route.model,
         messages=messages,
         response_format=res_obj,
+        **route.params,
     )
-
-    return response.choices[0].message.parsed
+    _settle(tokens, response)
+
+    return _parsed(response)
+
+
+def _parsed(response) -> BaseModel:
+    message = response.choices[0].message
+    if message.parsed is None:
+        raise StructuredOutputRefusal(message.refusal or "No structured response")
+    return message.parsed
+
+
+def _structure_route(res_obj: BaseModel, route_key: str | tuple[str, ...] | None) -> ModelRoute:
+    return model_routing_policy.route(route_key or res_obj.__name__)
+
+
+# The cache sits outside of the retries, a miss in replay mode must fail right away. Responses
+# are cached under the route of the first attempt, so an escalated response is reused as well.
+
+
+async def _cache_get_async(key: str, res_obj: type[BaseModel], use_cache: bool):
+    """Look up a cached response without blocking the event loop on the database."""
+    if not use_cache or not llm_response_cache.enabled:
+        return None
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, llm_response_cache.get, key, res_obj)
+
+
+async def _cache_put_async(key: str, response) -> None:
+    """Store a response without blocking the event loop on the database."""
+    if not llm_response_cache.enabled:
+        return
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, llm_response_cache.put, key, response)
+
+
+async def get_chat_gpt_response_async(
+    messages, route_key: str | None = None, use_cache: bool = True
+):
+    route = model_routing_policy.route(route_key)
+    key = llm_response_cache.make_key(route.model, messages, params=route.params)
+    message = await _cache_get_async(key, ChatCompletionMessage, use_cache)
+    if message is None:
+        message = await _request_chat_gpt_response_async(messages, route)
+        await _cache_put_async(key, message)
+    return message
+
+
+async def get_chat_gpt_response_structure_async(
+    messages: list,
+    res_obj: BaseModel,
+    route_key: str | tuple[str, ...] | None = None,
+    use_cache: bool = True,
+):
+    """Request a structured response from the model the routing policy picks.
+
+    Args:
+        messages: The chat messages
+        res_obj: The response class
+        route_key: Route key of the request, defaults to the name of the response class. A
+            tuple of keys routes a request combining several responses.
+        use_cache: Serve a cached response of the same request. If False, e.g. to regenerate a
+            result on purpose, the model is always asked and its response replaces the cached one.
+
+    Returns:
+        The parsed response. If the routed model fails to produce it, the request is retried
+        once with the stronger model of the route.
+    """
+    route = _structure_route(res_obj, route_key)
+    key = llm_response_cache.make_key(route.model, messages, res_obj, route.params)
+    parsed = await _cache_get_async(key, res_obj, use_cache)
+    if parsed is None:
+        try:
+            parsed = await _request_chat_gpt_response_structure_async(messages, res_obj, route)
+        except STRUCTURED_OUTPUT_ERRORS as e:
+            escalated = route.escalated()
+            if escalated is None:
+                raise
+            logger.warning(
+                f"{route.model} failed to produce {res_obj.__name__} ({type(e).__name__}), "
+                f"retrying with {escalated.model}"
+            )
+            parsed = await _request_chat_gpt_response_structure_async(messages, res_obj, escalated)
+        await _cache_put_async(key, parsed)
+    return parsed
+
+
+def get_chat_gpt_response(messages, route_key: str | None = None, use_cache: bool = True):
+    route = model_routing_policy.route(route_key)
+    key = llm_response_cache.make_key(route.model, messages, params=route.params)
+    message = llm_response_cache.get(key, ChatCompletionMessage) if use_cache else None
+    if message is None:
+        message = _request_chat_gpt_response(messages, route)
+        llm_response_cache.put(key, message)
+    return message
+
+
+def get_chat_gpt_response_structure(
+    messages: list,
+    res_obj: BaseModel,
+    route_key: str | tuple[str, ...] | None = None,
+    use_cache: bool = True,
+):
+    """Blocking version of `get_chat_gpt_response_structure_async`."""
+    route = _structure_route(res_obj, route_key)
+    key = llm_response_cache.make_key(route.model, messages, res_obj, route.params)
+    parsed = llm_response_cache.get(key, res_obj) if use_cache else None
+    if parsed is None:
+        try:
+            parsed = _request_chat_gpt_response_structure(messages, res_obj, route)
+        except STRUCTURED_OUTPUT_ERRORS as e:
+            escalated = route.escalated()
+            if escalated is None:
+                raise
+            logger.warning(
+                f"{route.model} failed to produce {res_obj.__name__} ({type(e).__name__}), "
+                f"retrying with {escalated.model}"
+            )
+            parsed = _request_chat_gpt_response_structure(messages, res_obj, escalated)
+        llm_response_cache.put(key, parsed)
+    return parsed
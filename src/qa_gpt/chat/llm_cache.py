@@ -0,0 +1,225 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import TypeVar
+
+from pydantic import BaseModel
+
+from src.qa_gpt.core.constant import (
+    LLM_CACHE_MAX_BYTES,
+    LLM_CACHE_MODE,
+    LLM_CACHE_PATH,
+    LLM_CACHE_TTL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+M = TypeVar("M", bound=BaseModel)
+
+CACHE_MODES = ("off", "read-write", "replay")
+
+
+class LLMCacheMiss(KeyError):
+    """Raised in replay mode for a request without a cached response."""
+
+
+class LLMResponseCache:
+    """Content-addressed SQLite cache of parsed LLM responses.
+
+    Responses are keyed by a hash of everything that determines them: the model, the messages,
+    the JSON schema of the response class and the sampling parameters. Entries expire after a
+    TTL, and the least recently used ones are evicted once the stored responses exceed the size
+    limit.
+
+    In replay mode the cache is opened read-only and a miss raises `LLMCacheMiss` instead of
+    falling through to the API, so a recorded pipeline run can be repeated offline.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = LLM_CACHE_PATH,
+        mode: str = LLM_CACHE_MODE,
+        ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+        max_bytes: int = LLM_CACHE_MAX_BYTES,
+        clock=time.time,
+    ) -> None:
+        """Initialize the cache, the database is opened on first use.
+
+        Args:
+            path: Path of the SQLite database
+            mode: "off", "read-write" or "replay"
+            ttl_seconds: Age after which an entry is no longer served
+            max_bytes: Largest total size of the stored responses
+            clock: Wall clock returning seconds, entries outlive the process
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode {mode!r}, expected one of {CACHE_MODES}")
+        self.path = Path(path)
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._connection: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def read_only(self) -> bool:
+        return self.mode == "replay"
+
+    def _connect(self) -> sqlite3.Connection | None:
+        if self._connection is not None:
+            return self._connection
+        if self.read_only:
+            if not self.path.exists():
+                return None
+            self._connection = sqlite3.connect(
+                f"{self.path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False
+            )
+            return self._connection
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self._connection.commit()
+        return self._connection
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: list[dict],
+        res_obj: type[BaseModel] | None = None,
+        params: dict | None = None,
+    ) -> str:
+        """Hash the inputs of a request into a cache key.
+
+        Args:
+            model: Name of the model
+            messages: The chat messages
+            res_obj: The structured response class, its JSON schema is part of the key
+            params: Sampling parameters of the request, e.g. the temperature
+
+        Returns:
+            str: Hex digest identifying the request
+        """
+        request = {
+            "model": model,
+            "messages": messages,
+            "schema": res_obj.model_json_schema() if res_obj is not None else None,
+            "params": params or {},
+        }
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, res_obj: type[M]) -> M | None:
+        """Get a cached response.
+
+        Args:
+            key: Key from `make_key`
+            res_obj: Class the response is parsed into
+
+        Returns:
+            The cached response, or None on a miss
+
+        Raises:
+            LLMCacheMiss: On a miss in replay mode
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            connection = self._connect()
+            row = None
+            if connection is not None:
+                row = connection.execute(
+                    "SELECT response, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            now = self._clock()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                row = None  # Expired, it is replaced on the next put or evicted
+            if row is None:
+                self.misses += 1
+                if self.read_only:
+                    raise LLMCacheMiss(f"No cached LLM response for request {key} in replay mode")
+                return None
+            self.hits += 1
+            if not self.read_only:
+                connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                connection.commit()
+        try:
+            return res_obj.model_validate_json(row[0])
+        except ValueError as e:
+            # The response class changed without changing its schema, treat it as a miss
+            logger.warning(f"Dropping unreadable cached LLM response {key}: {e}")
+            if self.read_only:
+                raise LLMCacheMiss(f"Cached LLM response {key} is unreadable") from e
+            return None
+
+    def put(self, key: str, response: BaseModel | None) -> None:
+        """Store a response and evict entries over the TTL and size limit.
+
+        Nothing is stored for a None response or in replay mode.
+        """
+        if not self.enabled or self.read_only or response is None:
+            return
+        data = response.model_dump_json()
+        size = len(data.encode("utf-8"))
+        with self._lock:
+            connection = self._connect()
+            now = self._clock()
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, data, size, now, now),
+            )
+            self._evict(connection, now)
+            connection.commit()
+
+    def _evict(self, connection: sqlite3.Connection, now: float) -> None:
+        connection.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale_keys = []
+        for key, size in connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            stale_keys.append((key,))
+            total -= size
+        connection.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+        logger.info(
+            f"Evicted {len(stale_keys)} LLM responses over the cache limit of {self.max_bytes} bytes"
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return 0
+            return connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+llm_response_cache = LLMResponseCache()
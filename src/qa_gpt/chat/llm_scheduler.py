@@ -0,0 +1,183 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from pydantic import BaseModel
+
+from src.qa_gpt.core.constant import (
+    LLM_MAX_COMPLETION_TOKENS,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE,
+)
+from src.qa_gpt.core.utils.token_utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and separators the API adds around each message
+
+
+class TokenBucket:
+    """Budget that refills continuously up to its capacity.
+
+    Reservations are deducted immediately and may drive the balance negative, the caller then
+    waits until the refill covers the deficit. Reservations are therefore served in the order
+    they were made without holding a lock while waiting.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float, clock=time.monotonic) -> None:
+        """Create a full bucket.
+
+        Args:
+            capacity: Largest balance, i.e. the burst the bucket allows
+            refill_per_second: Budget added per second
+            clock: Monotonic clock returning seconds
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._clock = clock
+        self._balance = capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._balance = min(
+            self.capacity, self._balance + (now - self._updated) * self.refill_per_second
+        )
+        self._updated = now
+
+    @property
+    def balance(self) -> float:
+        self._refill()
+        return self._balance
+
+    def reserve(self, amount: float) -> float:
+        """Deduct an amount and return the seconds until the balance covers it.
+
+        Amounts above the capacity are capped, otherwise they could never be served.
+        """
+        self._refill()
+        self._balance -= min(amount, self.capacity)
+        return max(0.0, -self._balance / self.refill_per_second)
+
+    def refund(self, amount: float) -> None:
+        """Return an unused part of a reservation, or deduct an overrun if negative."""
+        self._refill()
+        self._balance = min(self.capacity, self._balance + amount)
+
+
+class LLMScheduler:
+    """Start LLM requests as soon as the requests-per-minute and tokens-per-minute budgets allow.
+
+    Each request reserves its estimated prompt tokens plus the completion allowance, which
+    is how the API counts requests against the tokens-per-minute limit. The reservation is
+    settled with the actual usage once the response arrives.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        max_completion_tokens: int = LLM_MAX_COMPLETION_TOKENS,
+        clock=time.monotonic,
+    ) -> None:
+        """Initialize the scheduler with full budgets.
+
+        Args:
+            requests_per_minute: Requests-per-minute limit of the account
+            tokens_per_minute: Tokens-per-minute limit of the account
+            max_completion_tokens: Completion tokens reserved per request
+            clock: Monotonic clock returning seconds
+        """
+        self.max_completion_tokens = max_completion_tokens
+        self.request_bucket = TokenBucket(requests_per_minute, requests_per_minute / 60, clock)
+        self.token_bucket = TokenBucket(tokens_per_minute, tokens_per_minute / 60, clock)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.wait_seconds = 0.0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def estimate_request_tokens(
+        self,
+        messages: list[dict],
+        res_obj: type[BaseModel] | None = None,
+        max_completion_tokens: int | None = None,
+    ) -> int:
+        """Estimate the tokens a request counts against the budget.
+
+        Args:
+            messages: The chat messages
+            res_obj: The structured response class, whose JSON schema is part of the prompt
+            max_completion_tokens: Completion limit of the request, None reserves the default
+
+        Returns:
+            int: Estimated prompt tokens plus the completion allowance
+        """
+        prompt_tokens = sum(
+            estimate_tokens(str(message.get("content", ""))) + MESSAGE_OVERHEAD_TOKENS
+            for message in messages
+        )
+        if res_obj is not None:
+            prompt_tokens += estimate_tokens(json.dumps(res_obj.model_json_schema()))
+        return prompt_tokens + (max_completion_tokens or self.max_completion_tokens)
+
+    def reserve(self, tokens: int) -> float:
+        """Reserve a request of the given tokens and return the seconds to wait before it."""
+        with self._lock:
+            wait = max(self.request_bucket.reserve(1), self.token_bucket.reserve(tokens))
+            self.requests += 1
+            self.wait_seconds += wait
+            return wait
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait until a request of the given tokens fits the budgets.
+
+        Args:
+            tokens: Estimated tokens of the request
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, tokens: int) -> None:
+        """Blocking version of `acquire` for synchronous requests."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    @property
+    def cached_token_ratio(self) -> float:
+        """Share of the reported prompt tokens that the provider served from its prompt cache."""
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def settle(
+        self,
+        reserved_tokens: int,
+        used_tokens: int | None,
+        prompt_tokens: int | None = None,
+        cached_tokens: int | None = None,
+    ) -> None:
+        """Correct a reservation by the tokens the request actually used.
+
+        Args:
+            reserved_tokens: Tokens reserved by `acquire`
+            used_tokens: Total tokens reported by the API, None leaves the reservation as is
+            prompt_tokens: Prompt tokens reported by the API
+            cached_tokens: Prompt tokens the API served from its prompt cache
+        """
+        if used_tokens is None:
+            return
+        logger.info(
+            f"LLM request used {used_tokens} tokens, {reserved_tokens} were estimated including "
+            f"{self.max_completion_tokens} completion tokens, "
+            f"{cached_tokens or 0}/{prompt_tokens or 0} prompt tokens were cached"
+        )
+        with self._lock:
+            self.token_bucket.refund(min(reserved_tokens, self.token_bucket.capacity) - used_tokens)
+            self.prompt_tokens += prompt_tokens or 0
+            self.cached_tokens += cached_tokens or 0
+
+
+llm_scheduler = LLMScheduler()
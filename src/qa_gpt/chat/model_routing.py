@@ -0,0 +1,95 @@
+import json
+import logging
+from dataclasses import dataclass
+
+from src.qa_gpt.core.constant import LLM_MODEL_ROUTES, LLM_ROUTES_FILE
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """Model serving a kind of request, and the stronger model to retry it with."""
+
+    model: str
+    max_tokens: int | None = None  # Completion limit, None for the model's own limit
+    escalate_to: str | None = None  # Model retrying requests whose structured output failed
+
+    @property
+    def params(self) -> dict:
+        """Request parameters of the route besides the model."""
+        return {"max_completion_tokens": self.max_tokens} if self.max_tokens else {}
+
+    def escalated(self) -> "ModelRoute | None":
+        """Route of the retry with the stronger model, without a completion limit."""
+        return ModelRoute(self.escalate_to) if self.escalate_to else None
+
+
+class ModelRoutingPolicy:
+    """Pick the model of each LLM request by its route key.
+
+    Route keys are the names of response classes, e.g. "MetaDataSummary", optionally followed
+    by a field name, e.g. "MultipleChoiceQuestionSet.motivation" for the question set of a
+    summary field. A key falls back to its class name, then to the default route. A request
+    combining several responses, e.g. the question sets of several fields, is routed by the
+    tuple of their keys.
+    """
+
+    def __init__(self, routes: dict[str, ModelRoute], default: ModelRoute) -> None:
+        """Initialize the policy.
+
+        Args:
+            routes: Route of each route key
+            default: Route of requests without a matching key
+        """
+        self.routes = routes
+        self.default = default
+
+    @classmethod
+    def from_config(cls, config: dict[str, dict]) -> "ModelRoutingPolicy":
+        """Create a policy from route settings by key, see LLM_MODEL_ROUTES."""
+        routes = {key: ModelRoute(**settings) for key, settings in config.items()}
+        return cls(routes, routes.pop("default"))
+
+    @classmethod
+    def load(cls, routes_file: str | None = LLM_ROUTES_FILE) -> "ModelRoutingPolicy":
+        """Create the policy of LLM_MODEL_ROUTES, overridden by the entries of a JSON file."""
+        config = dict(LLM_MODEL_ROUTES)
+        if routes_file:
+            with open(routes_file, encoding="utf-8") as f:
+                config.update(json.load(f))
+            logger.info(f"Loaded LLM model routes from {routes_file}")
+        return cls.from_config(config)
+
+    def route(self, route_key: str | tuple[str, ...] | None) -> ModelRoute:
+        """Get the route of a request.
+
+        Args:
+            route_key: Route key of the request, None for the default route. A tuple of keys
+                routes a combined request: it gets the model of the first key and a completion
+                limit covering all of them.
+
+        Returns:
+            ModelRoute: The most specific matching route
+        """
+        if route_key is None:
+            return self.default
+        if isinstance(route_key, tuple):
+            return self._combined_route([self.route(key) for key in route_key])
+        if route_key in self.routes:
+            return self.routes[route_key]
+        return self.routes.get(route_key.split(".", 1)[0], self.default)
+
+    @staticmethod
+    def _combined_route(routes: list[ModelRoute]) -> ModelRoute:
+        """Route of a request combining the responses of several routes.
+
+        The completion limit is the sum of the limits of the parts, so each part keeps the room
+        it has in a request of its own. A part without a limit lifts it for the whole request.
+        """
+        limits = [route.max_tokens for route in routes]
+        max_tokens = sum(limits) if all(limits) else None
+        return ModelRoute(routes[0].model, max_tokens, routes[0].escalate_to)
+
+
+model_routing_policy = ModelRoutingPolicy.load()
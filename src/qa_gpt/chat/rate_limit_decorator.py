@@ -10,7 +10,7 @@ P = ParamSpec("P")
 
 
 def handle_openai_errors(
-    max_retries: int = 3, wait_time: int = 60
+    max_retries: int = 3, wait_time: int = 60, no_retry: tuple[type[Exception], ...] = ()
 ) -> Callable[[Callable[P, T]], Callable[P, T]]:
     """Decorator to handle any errors with retry logic.
 
@@ -21,6 +21,8 @@ def handle_openai_errors(
     Args:
         max_retries (int, optional): Maximum number of retry attempts. Defaults to 3.
         wait_time (int, optional): Time to wait between retries in seconds. Defaults to 60.
+        no_retry (tuple, optional): Error types raised right away, e.g. because retrying the
+            same request would fail the same way. Defaults to none.
 
     Returns:
         Callable: Decorated function with error handling
@@ -35,7 +37,7 @@ def handle_openai_errors(
                 try:
                     return await func(*args, **kwargs)
                 except Exception as e:
-                    if attempt == max_retries - 1:
+                    if attempt == max_retries - 1 or isinstance(e, no_retry):
                         raise e
                     error_type = type(e).__name__
                     print(
@@ -50,7 +52,7 @@ def handle_openai_errors(
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
-                    if attempt == max_retries - 1:
+                    if attempt == max_retries - 1 or isinstance(e, no_retry):
                         raise e
                     error_type = type(e).__name__
                     print(
@@ -1,2 +1,43 @@
+import os
+
 LOCAL_DB_FOLDER = "./local_db"
 MATERIAL_FOLDER = "./archived_materials"
+RAG_STATE_FOLDER = "./rag_state"
+RAG_INDEX_POOL_MAX_BYTES = 512 * 1024 * 1024
+RAG_RETRIEVAL_MAX_WORKERS = 4
+RAG_QUERY_CACHE_MAX_ENTRIES = 4096
+# FAISS index factory string of new RAG indexes, exact search by default
+RAG_INDEX_FACTORY = "Flat"
+ONNX_MODEL_FOLDER = "./onnx_models"
+# Sentence transformer model of RAG indexes built before any migration
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# Embedding backend used by RAGController: "torch", "onnx" or "onnx-int8"
+EMBEDDING_BACKEND = os.environ.get("QA_GPT_EMBEDDING_BACKEND", "torch")
+# Rate limits of the OpenAI account that LLM requests are scheduled against
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get("QA_GPT_LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = int(os.environ.get("QA_GPT_LLM_TOKENS_PER_MINUTE", "200000"))
+# Completion tokens reserved per request until its actual usage is known
+LLM_MAX_COMPLETION_TOKENS = 4096
+# LLM jobs running at once across all materials
+LLM_MAX_CONCURRENT_JOBS = int(os.environ.get("QA_GPT_LLM_MAX_CONCURRENT_JOBS", "8"))
+# Materials in flight at once during bulk generation, each holding its markdown in memory
+LLM_MAX_CONCURRENT_MATERIALS = int(os.environ.get("QA_GPT_LLM_MAX_CONCURRENT_MATERIALS", "4"))
+# Persistent cache of LLM responses: "off", "read-write", or "replay" to serve cached
+# responses only and fail on a miss, e.g. to run the pipeline offline. Off by default, so
+# generating a result again asks the model again.
+LLM_CACHE_MODE = os.environ.get("QA_GPT_LLM_CACHE_MODE", "off")
+LLM_CACHE_PATH = os.environ.get("QA_GPT_LLM_CACHE_PATH", f"{LOCAL_DB_FOLDER}/llm_cache.sqlite")
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("QA_GPT_LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Model and completion limit of LLM requests by route key: the response class name, optionally
+# followed by ".{field name}" for the question set of a summary field. Requests without a route
+# use "default". A JSON file of the same shape at QA_GPT_LLM_ROUTES_FILE overrides entries.
+LLM_MODEL_ROUTES = {
+    # Summaries restate the paper, so a smaller model writes them, retried with the question model
+    "default": {"model": "gpt-4.1-nano", "escalate_to": "gpt-4o-mini"},
+    # Metadata is copied from the first page, a short completion is enough
+    "MetaDataSummary": {"model": "gpt-4.1-nano", "max_tokens": 1024, "escalate_to": "gpt-4o-mini"},
+    # Questions and their distractors need reasoning over the paper
+    "MultipleChoiceQuestionSet": {"model": "gpt-4o-mini", "escalate_to": "gpt-4o"},
+}
+LLM_ROUTES_FILE = os.environ.get("QA_GPT_LLM_ROUTES_FILE")
@@ -2,6 +2,7 @@ import json
 import logging
 import pickle
 import shutil
+import time
 from abc import ABC, abstractmethod
 from dataclasses import asdict
 from pathlib import Path
@@ -119,6 +120,7 @@ class MaterialController:
         self.archive_path = Path(f"{MATERIAL_FOLDER}/{archive_name}")
         self.db_table_name = "material_table"
         self.db_mapping_table_name = "material_id_mapping_table"
+        self.db_failure_table_name = "generation_failure_table"
         self.material_folder_path.mkdir(exist_ok=True)
         self.archive_path.mkdir(exist_ok=True)
 
@@ -127,6 +129,8 @@ class MaterialController:
             self.db_controller.save_data({}, self.db_table_name)
         if self.db_controller.get_data(self.db_mapping_table_name) is None:
             self.db_controller.save_data({}, self.db_mapping_table_name)
+        if self.db_controller.get_data(self.db_failure_table_name) is None:
+            self.db_controller.save_data({}, self.db_failure_table_name)
 
     @staticmethod
     def remove_dot_from_file_name(file_path: Path) -> Path:
@@ -217,6 +221,40 @@ class MaterialController:
 
         return 0
 
+    def record_generation_failure(self, file_id: int, task_key: str, error: Exception) -> int:
+        """Record a failed generation of a material, e.g. "questions:StandardSummary_motivation".
+
+        The record persists across runs until the task succeeds, so reruns can retry the failed
+        tasks only.
+        """
+        target_path = self.db_controller.get_target_path(
+            [self.db_failure_table_name, str(file_id), task_key]
+        )
+        previous = self.db_controller.get_data(target_path)
+        failure = {
+            "error": f"{type(error).__name__}: {str(error)}",
+            "attempts": (previous["attempts"] if previous else 0) + 1,
+            "failed_at": time.time(),
+        }
+        self.db_controller.save_data(failure, target_path)
+
+        return 0
+
+    def clear_generation_failure(self, file_id: int, task_key: str) -> int:
+        """Remove the failure record of a generation task that succeeded."""
+        target_path = self.db_controller.get_target_path(
+            [self.db_failure_table_name, str(file_id), task_key]
+        )
+        if self.db_controller.get_data(target_path) is not None:
+            self.db_controller.delete_data(target_path)
+
+        return 0
+
+    def get_generation_failures(self, file_id: int) -> dict[str, dict]:
+        """Get the failure records of a material by task key."""
+        target_path = self.db_controller.get_target_path([self.db_failure_table_name, str(file_id)])
+        return self.db_controller.get_data(target_path) or {}
+
     def append_question_comment(self, file_id: int, comment: QuestionComment) -> int:
         """Add a QuestionComment to the material's metadata and persist to database.
 
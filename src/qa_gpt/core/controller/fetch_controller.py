@@ -1,21 +1,53 @@
+import asyncio
+import multiprocessing
+import os
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Any
 
+import faiss
+from pydantic import BaseModel
+
+from src.qa_gpt.chat.batch_api import BatchRequest, run_batch
+from src.qa_gpt.core.constant import LLM_MAX_CONCURRENT_MATERIALS
 from src.qa_gpt.core.controller.db_controller import (
     LocalDatabaseController,
     MaterialController,
 )
+from src.qa_gpt.core.controller.llm_job_queue import JobPriority
 from src.qa_gpt.core.controller.parsing_controller import ParsingController
-from src.qa_gpt.core.controller.qa_controller import QAController
+from src.qa_gpt.core.controller.qa_controller import QAController, question_route_key
 from src.qa_gpt.core.controller.rag_controller import RAGController
+from src.qa_gpt.core.controller.rag_migration_controller import RAGMigrationController
+from src.qa_gpt.core.objects.parsing import TextChunk, TextSection
+from src.qa_gpt.core.objects.questions import MultipleChoiceQuestionSet
 from src.qa_gpt.core.objects.summaries import (
     InnovationSummary,
     MetaDataSummary,
     StandardSummary,
     TechnicalSummary,
 )
+from src.qa_gpt.core.utils.chunking_utils import (
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_OVERLAP_TOKENS,
+    chunk_sections,
+    sentence_chunks,
+)
+from src.qa_gpt.core.utils.context_assembler import sentence_index_file_id
+from src.qa_gpt.core.utils.context_pack_utils import (
+    build_context_pack,
+    save_context_pack,
+)
+from src.qa_gpt.core.utils.dedup_utils import (
+    DEFAULT_DEDUP_THRESHOLD,
+    find_near_duplicates,
+)
 from src.qa_gpt.core.utils.fetch_utils import (
     _filter_material_table_by_file_id,
+    _question_task_key,
     _should_skip_field_processing,
+    _summary_task_key,
 )
 from src.qa_gpt.core.utils.pdf_processor import process_pdf_file
 
@@ -23,15 +55,32 @@ from src.qa_gpt.core.utils.pdf_processor import process_pdf_file
 class FetchController:
     """Controller for fetching and processing materials."""
 
-    def __init__(self):
-        """Initialize the fetch controller."""
+    def __init__(
+        self,
+        small_to_big: bool = False,
+        multiplex_questions: bool = False,
+        combine_summaries: bool = False,
+    ):
+        """Initialize the fetch controller.
+
+        Args:
+            small_to_big: Also build a sentence-level RAG index per material and generate from
+                sentence hits expanded to their surroundings instead of whole chunks.
+            multiplex_questions: Request the question sets of several fields of a summary in
+                one LLM call instead of one call per field.
+            combine_summaries: Request all missing summary types of a material in one LLM call
+                instead of one call per summary type.
+        """
         self.db_name = "my_local_db"
         self.archive_name = "my_archive"
         self.local_db_controller = LocalDatabaseController(db_name=self.db_name)
         self.material_controller = MaterialController(
             db_controller=self.local_db_controller, archive_name=self.archive_name
         )
-        self.qa_controller = QAController()
+        self.small_to_big = small_to_big
+        self.multiplex_questions = multiplex_questions
+        self.combine_summaries = combine_summaries
+        self.qa_controller = QAController(small_to_big=small_to_big)
         self.parsing_controller = ParsingController()
         self.summary_objects = [
             StandardSummary,
@@ -39,16 +88,30 @@ class FetchController:
             InnovationSummary,
             MetaDataSummary,
         ]
-
-    async def fetch_material_add_sets(self, file_id: str | None = None, process_all: bool = False):
+        self.chunk_max_tokens = DEFAULT_MAX_TOKENS
+        self.chunk_overlap_tokens = DEFAULT_OVERLAP_TOKENS
+        self.dedup_threshold = DEFAULT_DEDUP_THRESHOLD
+
+    async def fetch_material_add_sets(
+        self,
+        file_id: str | None = None,
+        process_all: bool = False,
+        priority: JobPriority | None = None,
+        only_failed: bool = False,
+    ):
         """Fetch material and add question sets to each material.
 
         Args:
             file_id: ID of a specific file to process. If None, will process all files.
             process_all: Must be set to True to process all files when file_id is None.
+            priority: Priority class of the LLM jobs. Defaults to REGENERATION when only failed
+                generations are retried, and to BACKFILL otherwise.
+            only_failed: Only retry the generations recorded as failed by previous runs
         """
         if file_id is None and not process_all:
             raise ValueError("Must set process_all=True to process all files when file_id is None")
+        if priority is None:
+            priority = JobPriority.REGENERATION if only_failed else JobPriority.BACKFILL
 
         # Fetch material folder first
         self.material_controller.fetch_material_folder(Path("./pdf_data"))
@@ -57,90 +120,113 @@ class FetchController:
         # Filter material table if specific file_id is provided
         material_table = _filter_material_table_by_file_id(material_table, file_id)
 
-        total_materials = len(material_table)
-        for material_idx, (file_id, file_meta) in enumerate(material_table.items(), 1):
-            print(f"\nProcessing material {material_idx}/{total_materials} (ID: {file_id})")
-            print(
-                f"Material {file_id} originally have {len(file_meta.mc_question_sets)} mc_questions sets."
-            )
+        await self._process_materials(
+            material_table, self._add_sets_to_material, priority, only_failed
+        )
 
-            # Get markdown context if available
-            markdown_context = ""
-            if file_meta["parsing_results"]["sections"] is not None:
-                markdown_path = Path("./markdown") / f"{file_meta['file_name']}_{file_id}.md"
-                if markdown_path.exists():
-                    with open(markdown_path, encoding="utf-8") as f:
-                        markdown_context = f.read()
-
-            # Prepare batch processing data
-            file_ids = []
-            field_names = []
-            field_values = []
-            prefixes = []
-            additional_contexts = []
-
-            for summary_idx, summary_object in enumerate(self.summary_objects, 1):
-                # Skip if summary type doesn't exist
-                summary_type = summary_object.__name__
-                if (
-                    summary_type not in file_meta.summaries
-                    or file_meta.summaries[summary_type] is None
-                ):
-                    print(f"Skipping {summary_type} as it doesn't exist.")
-                    continue
+    async def _process_materials(
+        self,
+        material_table: dict,
+        process_material: Callable[..., Any],
+        priority: JobPriority,
+        only_failed: bool,
+    ) -> None:
+        """Run a per-material coroutine over a material table with bounded concurrency.
+
+        Up to LLM_MAX_CONCURRENT_MATERIALS workers take the next material once their current
+        one is done, so only those materials hold their markdown and pending jobs while the
+        LLM job queue interleaves their jobs. A failing material doesn't stop the others.
+        """
+        total_materials = len(material_table)
+        materials = enumerate(material_table.items(), 1)
 
-                print(
-                    f"\nProcessing summary {summary_idx}/{len(self.summary_objects )}: {summary_type}"
-                )
-                # Get the summary object
-                summary = file_meta.summaries[summary_type]
-                summary_dict = summary.model_dump()
-
-                # Get questions for each top-level attribute
-                total_fields = len(summary_dict)
-                excluded_fields = set(summary_object.excluded_fields())
-                for field_idx, (field_name, field_value) in enumerate(summary_dict.items(), 1):
-                    # Create prefix for the question set
-                    prefix = f"{summary_type}_{field_name}"
-
-                    should_skip, reason = _should_skip_field_processing(
-                        field_name, excluded_fields, file_meta, prefix, field_idx, total_fields
+        async def worker() -> None:
+            for material_idx, (file_id, file_meta) in materials:
+                try:
+                    await process_material(
+                        file_id, file_meta, material_idx, total_materials, priority, only_failed
                     )
-                    if should_skip:
-                        print(reason)
-                        continue
-
-                    print(f"Processing field {field_idx}/{total_fields}: {field_name}")
-                    file_ids.append(file_id)
-                    field_names.append(field_name)
-                    field_values.append(field_value)
-                    prefixes.append(prefix)
-                    additional_contexts.append(markdown_context)
-
-            # Process all questions in batch
-            if file_ids:
-                question_sets = await self.qa_controller.get_questions_batch(
-                    file_ids, field_names, field_values, additional_contexts
+                except Exception as e:
+                    print(f"Error processing {file_id}: {str(e)}")
+
+        await asyncio.gather(
+            *(worker() for _ in range(min(LLM_MAX_CONCURRENT_MATERIALS, total_materials)))
+        )
+
+    async def _add_sets_to_material(
+        self,
+        file_id: str,
+        file_meta,
+        material_idx: int,
+        total_materials: int,
+        priority: JobPriority,
+        only_failed: bool = False,
+    ) -> None:
+        """Add the missing question sets of a single material.
+
+        Each question set is stored as soon as its request succeeds. Failed requests are
+        recorded in the failure table instead of failing the others.
+        """
+        print(f"\nProcessing material {material_idx}/{total_materials} (ID: {file_id})")
+        print(
+            f"Material {file_id} originally have {len(file_meta.mc_question_sets)} mc_questions sets."
+        )
+
+        missing_fields = self._missing_question_fields(file_meta)
+        if only_failed:
+            failures = self.material_controller.get_generation_failures(file_id)
+            missing_fields = [
+                field for field in missing_fields if _question_task_key(field[3]) in failures
+            ]
+
+        # Process all questions in batch
+        if missing_fields:
+            summary_types, field_names, field_values, prefixes = map(list, zip(*missing_fields))
+            markdown_context = self._read_markdown_context(file_id, file_meta)
+
+            def store_question_set(position: int, question_set) -> None:
+                self._store_result(
+                    file_id,
+                    _question_task_key(prefixes[position]),
+                    question_set,
+                    lambda: self.material_controller.append_mc_question_set(
+                        file_id, question_set, prefixes[position]
+                    ),
+                    f"question set for {prefixes[position]}",
                 )
-                for prefix, question_set in zip(prefixes, question_sets):
-                    self.material_controller.append_mc_question_set(file_id, question_set, prefix)
-                    print(f"Added question set for {prefix}")
 
-            print(
-                f"\nCompleted processing material {material_idx}/{total_materials} (ID: {file_id})"
+            await self.qa_controller.get_questions_batch(
+                [file_id] * len(missing_fields),
+                field_names,
+                field_values,
+                [markdown_context] * len(missing_fields),
+                priority,
+                groups=summary_types if self.multiplex_questions else None,
+                on_result=store_question_set,
             )
 
+        print(f"\nCompleted processing material {material_idx}/{total_materials} (ID: {file_id})")
+
     async def fetch_material_add_summary(
-        self, file_id: str | None = None, process_all: bool = False
+        self,
+        file_id: str | None = None,
+        process_all: bool = False,
+        priority: JobPriority | None = None,
+        only_failed: bool = False,
     ):
         """Fetch material and add summary to each material.
 
         Args:
             file_id: ID of a specific file to process. If None, will process all files.
             process_all: Must be set to True to process all files when file_id is None.
+            priority: Priority class of the LLM jobs. Defaults to REGENERATION when only failed
+                generations are retried, and to BACKFILL otherwise.
+            only_failed: Only retry the generations recorded as failed by previous runs
         """
         if file_id is None and not process_all:
             raise ValueError("Must set process_all=True to process all files when file_id is None")
+        if priority is None:
+            priority = JobPriority.REGENERATION if only_failed else JobPriority.BACKFILL
 
         # Fetch material folder first
         self.material_controller.fetch_material_folder(Path("./pdf_data"))
@@ -149,54 +235,231 @@ class FetchController:
         # Filter material table if specific file_id is provided
         material_table = _filter_material_table_by_file_id(material_table, file_id)
 
-        total_materials = len(material_table)
-        for material_idx, (file_id, file_meta) in enumerate(material_table.items(), 1):
-            print(f"\nProcessing material {material_idx}/{total_materials} (ID: {file_id})")
+        await self._process_materials(
+            material_table, self._add_summary_to_material, priority, only_failed
+        )
 
-            # Get markdown context if available
-            markdown_context = ""
-            if file_meta["parsing_results"]["sections"] is not None:
-                markdown_path = Path("./markdown") / f"{file_meta['file_name']}_{file_id}.md"
-                if markdown_path.exists():
-                    with open(markdown_path, encoding="utf-8") as f:
-                        markdown_context = f.read()
-
-            # Prepare batch processing data
-            file_ids = []
-            summary_classes = []
-            summary_types = []
-            additional_contexts = []
-
-            for summary_idx, summary_object in enumerate(self.summary_objects, 1):
-                # Skip if summary type already exists
-                summary_type = summary_object.__name__
-                if (
-                    summary_type in file_meta.summaries
-                    and file_meta.summaries[summary_type] is not None
-                ):
-                    print(f"Skipping {summary_type} as it already exists.")
+    async def _add_summary_to_material(
+        self,
+        file_id: str,
+        file_meta,
+        material_idx: int,
+        total_materials: int,
+        priority: JobPriority,
+        only_failed: bool = False,
+    ) -> None:
+        """Add the missing summaries of a single material.
+
+        Each summary is stored as soon as its request succeeds. Failed requests are recorded in
+        the failure table instead of failing the others.
+        """
+        print(f"\nProcessing material {material_idx}/{total_materials} (ID: {file_id})")
+
+        summary_classes = self._missing_summary_classes(file_meta)
+        if only_failed:
+            failures = self.material_controller.get_generation_failures(file_id)
+            summary_classes = [
+                summary_class
+                for summary_class in summary_classes
+                if _summary_task_key(summary_class.__name__) in failures
+            ]
+
+        # Process all summaries in batch
+        if len(summary_classes) > 0:
+            markdown_context = self._read_markdown_context(file_id, file_meta)
+
+            def store_summary(position: int, summary) -> None:
+                summary_type = summary_classes[position].__name__
+                self._store_result(
+                    file_id,
+                    _summary_task_key(summary_type),
+                    summary,
+                    lambda: self.material_controller.append_summary(file_id, summary),
+                    f"summary for {summary_type}",
+                )
+
+            await self.qa_controller.get_summaries_batch(
+                [file_id] * len(summary_classes),
+                summary_classes,
+                [markdown_context] * len(summary_classes),
+                priority,
+                combine=self.combine_summaries,
+                on_result=store_summary,
+            )
+
+        print(f"\nCompleted processing material {material_idx}/{total_materials} (ID: {file_id})")
+
+    def _store_result(
+        self, file_id: str, task_key: str, result, append: Callable[[], Any], description: str
+    ) -> None:
+        """Persist a generated result right away, or record its failure for a later retry."""
+        if not isinstance(result, Exception):
+            try:
+                append()
+                self.material_controller.clear_generation_failure(file_id, task_key)
+                print(f"Added {description}")
+                return
+            except Exception as e:
+                result = e
+        self.material_controller.record_generation_failure(file_id, task_key, result)
+        print(f"Failed to generate {description}: {str(result)}")
+
+    def _read_markdown_context(self, file_id: str, file_meta) -> str:
+        """Read the parsed markdown of a material, empty if it isn't available."""
+        if file_meta["parsing_results"]["sections"] is None:
+            return ""
+        markdown_path = Path("./markdown") / f"{file_meta['file_name']}_{file_id}.md"
+        if not markdown_path.exists():
+            return ""
+        with open(markdown_path, encoding="utf-8") as f:
+            return f.read()
+
+    def _missing_summary_classes(self, file_meta) -> list[type[BaseModel]]:
+        """Summary classes of which a material has no summary yet."""
+        summary_classes = []
+        for summary_idx, summary_object in enumerate(self.summary_objects, 1):
+            # Skip if summary type already exists
+            summary_type = summary_object.__name__
+            if (
+                summary_type in file_meta.summaries
+                and file_meta.summaries[summary_type] is not None
+            ):
+                print(f"Skipping {summary_type} as it already exists.")
+                continue
+
+            print(f"Processing summary {summary_idx}/{len(self.summary_objects )}: {summary_type}")
+            summary_classes.append(summary_object)
+        return summary_classes
+
+    def _missing_question_fields(self, file_meta) -> list[tuple[str, str, Any, str]]:
+        """Summary fields of a material without a question set yet.
+
+        Returns:
+            list: (summary type, field name, field value, question set prefix) of each field
+        """
+        missing_fields = []
+        for summary_idx, summary_object in enumerate(self.summary_objects, 1):
+            # Skip if summary type doesn't exist
+            summary_type = summary_object.__name__
+            if summary_type not in file_meta.summaries or file_meta.summaries[summary_type] is None:
+                print(f"Skipping {summary_type} as it doesn't exist.")
+                continue
+
+            print(
+                f"\nProcessing summary {summary_idx}/{len(self.summary_objects )}: {summary_type}"
+            )
+            # Get the summary object
+            summary = file_meta.summaries[summary_type]
+            summary_dict = summary.model_dump()
+
+            # Get questions for each top-level attribute
+            total_fields = len(summary_dict)
+            excluded_fields = set(summary_object.excluded_fields())
+            for field_idx, (field_name, field_value) in enumerate(summary_dict.items(), 1):
+                # Create prefix for the question set
+                prefix = f"{summary_type}_{field_name}"
+
+                should_skip, reason = _should_skip_field_processing(
+                    field_name, excluded_fields, file_meta, prefix, field_idx, total_fields
+                )
+                if should_skip:
+                    print(reason)
                     continue
 
-                print(
-                    f"Processing summary {summary_idx}/{len(self.summary_objects )}: {summary_type}"
+                print(f"Processing field {field_idx}/{total_fields}: {field_name}")
+                missing_fields.append((summary_type, field_name, field_value, prefix))
+        return missing_fields
+
+    async def fetch_material_batch(
+        self,
+        file_id: str | None = None,
+        process_all: bool = False,
+        poll_seconds: float = 60,
+        client=None,
+    ):
+        """Generate the missing summaries and question sets of materials in one batch job.
+
+        Instead of one request at a time, all pending requests are submitted to the batch API,
+        which is cheaper and has its own quota but may take up to its completion window. The
+        job is polled until it finishes, then the results are added to the material table.
+        Question sets are requested for the summaries that exist at submission, run it again
+        to add the question sets of the summaries it generated. Requests that failed are
+        recorded in the failure table and picked up by the next run.
+
+        Args:
+            file_id: ID of a specific file to process. If None, will process all files.
+            process_all: Must be set to True to process all files when file_id is None.
+            poll_seconds: Seconds between status checks of the batch job
+            client: Client of an OpenAI-compatible API, defaults to the client of `chat`
+        """
+        if file_id is None and not process_all:
+            raise ValueError("Must set process_all=True to process all files when file_id is None")
+
+        # Fetch material folder first
+        self.material_controller.fetch_material_folder(Path("./pdf_data"))
+        material_table = self.material_controller.get_material_table()
+
+        # Filter material table if specific file_id is provided
+        material_table = _filter_material_table_by_file_id(material_table, file_id)
+
+        # Build the messages of every pending request, results are mapped back by custom ID
+        requests = []
+        targets = {}
+        for file_id, file_meta in material_table.items():
+            markdown_context = self._read_markdown_context(file_id, file_meta)
+            for summary_class in self._missing_summary_classes(file_meta):
+                custom_id = f"{file_id}:summary:{summary_class.__name__}"
+                messages = await self.qa_controller.build_summary_messages(
+                    file_id, summary_class, markdown_context
+                )
+                requests.append(BatchRequest(custom_id, messages, summary_class))
+                targets[custom_id] = (file_id, summary_class.__name__, None)
+            for _, field_name, field_value, prefix in self._missing_question_fields(file_meta):
+                custom_id = f"{file_id}:questions:{prefix}"
+                messages = await self.qa_controller.build_question_messages(
+                    file_id, field_name, field_value, markdown_context
+                )
+                requests.append(
+                    BatchRequest(
+                        custom_id,
+                        messages,
+                        MultipleChoiceQuestionSet,
+                        route_key=question_route_key(field_name),
+                    )
+                )
+                targets[custom_id] = (file_id, None, prefix)
+
+        if not requests:
+            print("\nNo pending summaries or question sets to batch")
+            return
+
+        print(f"\nSubmitting batch of {len(requests)} requests")
+        results = await run_batch(requests, client=client, poll_seconds=poll_seconds)
+
+        failed = 0
+        for custom_id, result in results.items():
+            file_id, summary_type, prefix = targets[custom_id]
+            failed += isinstance(result, Exception)
+            if prefix is None:
+                self._store_result(
+                    file_id,
+                    _summary_task_key(summary_type),
+                    result,
+                    lambda: self.material_controller.append_summary(file_id, result),
+                    f"summary for {summary_type} of {file_id}",
                 )
-                file_ids.append(file_id)
-                summary_classes.append(summary_object)
-                summary_types.append(summary_type)
-                additional_contexts.append(markdown_context)
-
-            # Process all summaries in batch
-            if len(file_ids) > 0:
-                summaries = await self.qa_controller.get_summaries_batch(
-                    file_ids, summary_classes, additional_contexts
+            else:
+                self._store_result(
+                    file_id,
+                    _question_task_key(prefix),
+                    result,
+                    lambda: self.material_controller.append_mc_question_set(
+                        file_id, result, prefix
+                    ),
+                    f"question set for {prefix} of {file_id}",
                 )
-                for summary_type, summary in zip(summary_types, summaries):
-                    self.material_controller.append_summary(file_id, summary)
-                    print(f"Added summary for {summary_type}")
 
-            print(
-                f"\nCompleted processing material {material_idx}/{total_materials} (ID: {file_id})"
-            )
+        print(f"\nCompleted batch of {len(requests)} requests, {failed} failed")
 
     def output_question_data(self, file_id: str | None = None, process_all: bool = False):
         """Output question data to a folder.
@@ -282,12 +545,25 @@ class FetchController:
 
         print(f"\nCompleted processing {total_materials} materials")
 
-    async def build_rag_index(self, file_id: str | None = None, process_all: bool = False):
+    def _save_rag_state(self, file_id: str, file_meta, state_path: Path) -> None:
+        """Point the file meta of a material to its RAG state and persist it."""
+        file_meta.rag_state = state_path
+
+        target_path = self.material_controller.db_controller.get_target_path(
+            [self.material_controller.db_table_name, str(file_id)]
+        )
+        self.material_controller.db_controller.save_data(file_meta, target_path)
+
+    async def build_rag_index(
+        self, file_id: str | None = None, process_all: bool = False, num_workers: int = 1
+    ):
         """Build RAG index for parsed sections of materials.
 
         Args:
             file_id: ID of a specific file to process. If None, will process all files.
             process_all: Must be set to True to process all files when file_id is None.
+            num_workers: Number of worker processes embedding materials in parallel, each with
+                its own model instance. 1 builds all indexes in the current process.
         """
         if file_id is None and not process_all:
             raise ValueError("Must set process_all=True to process all files when file_id is None")
@@ -300,6 +576,7 @@ class FetchController:
         material_table = _filter_material_table_by_file_id(material_table, file_id)
 
         total_materials = len(material_table)
+        pending_materials = []
         for material_idx, (file_id, file_meta) in enumerate(material_table.items(), 1):
             print(f"\nProcessing material RAG {material_idx}/{total_materials} (ID: {file_id})")
 
@@ -313,33 +590,252 @@ class FetchController:
                 print(f"Skipping {file_id} as RAG state already exists.")
                 continue
 
+            if num_workers > 1:
+                pending_materials.append((file_id, file_meta))
+                continue
+
+            state_path = None
             try:
-                # Initialize RAG controller
-                rag_controller = RAGController(file_id=file_id)
+                state_path = build_material_rag_index(
+                    file_id,
+                    file_meta["parsing_results"]["sections"],
+                    self.chunk_max_tokens,
+                    self.chunk_overlap_tokens,
+                    self.summary_objects,
+                    self.small_to_big,
+                    self.dedup_threshold,
+                )
+                self._save_rag_state(file_id, file_meta, state_path)
+                print(f"Added RAG index for material {file_id}")
+            except Exception as e:
+                print(f"Error processing {file_id}: {str(e)}")
+                # Clean up the state file if the material table could not be updated
+                if state_path is not None and state_path.exists():
+                    state_path.unlink()
+                continue
+
+        if pending_materials:
+            await self._build_rag_index_parallel(pending_materials, num_workers)
 
-                # Add sections to RAG index
-                sections = file_meta["parsing_results"]["sections"]
-                texts = [str(section) for section in sections]
-                rag_controller.add_texts(texts)
+        print(f"\nCompleted processing {total_materials} materials")
 
-                # Save RAG state
-                rag_controller.save_state(rag_controller.state_path)
+    async def _build_rag_index_parallel(self, materials: list[tuple], num_workers: int) -> None:
+        """Build the RAG indexes of materials in a pool of worker processes.
 
-                # Update file meta with RAG state path
-                file_meta.rag_state = rag_controller.state_path
+        Workers chunk, embed and persist the per-material indexes. The material table is only
+        updated here in the main process, as each material completes.
+        """
+        loop = asyncio.get_running_loop()
+        threads_per_worker = max(1, (os.cpu_count() or 1) // num_workers)
+        executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_rag_build_worker,
+            initargs=(threads_per_worker,),
+        )
 
-                # Save updated file meta
-                target_path = self.material_controller.db_controller.get_target_path(
-                    [self.material_controller.db_table_name, str(file_id)]
+        async def build(file_id: str, file_meta) -> tuple:
+            try:
+                state_path = await loop.run_in_executor(
+                    executor,
+                    build_material_rag_index,
+                    file_id,
+                    file_meta["parsing_results"]["sections"],
+                    self.chunk_max_tokens,
+                    self.chunk_overlap_tokens,
+                    self.summary_objects,
+                    self.small_to_big,
+                    self.dedup_threshold,
                 )
-                self.material_controller.db_controller.save_data(file_meta, target_path)
+                return file_id, file_meta, state_path, None
+            except Exception as e:
+                return file_id, file_meta, None, e
+
+        print(f"\nBuilding {len(materials)} RAG indexes with {num_workers} workers")
+        with executor:
+            tasks = [build(file_id, file_meta) for file_id, file_meta in materials]
+            for completed_idx, task in enumerate(asyncio.as_completed(tasks), 1):
+                file_id, file_meta, state_path, error = await task
+                if error is not None:
+                    print(f"Error processing {file_id}: {str(error)}")
+                    continue
 
-                print(f"Added RAG index for material {file_id}")
+                try:
+                    self._save_rag_state(file_id, file_meta, state_path)
+                except Exception as e:
+                    print(f"Error processing {file_id}: {str(e)}")
+                    # Clean up the state file if the material table could not be updated
+                    if state_path is not None and state_path.exists():
+                        state_path.unlink()
+                    continue
+                print(f"Added RAG index for material {file_id} ({completed_idx}/{len(materials)})")
+
+    async def migrate_rag_indexes(
+        self,
+        target_model_name: str,
+        file_id: str | None = None,
+        process_all: bool = False,
+        max_texts_per_second: float | None = None,
+    ):
+        """Re-embed the RAG indexes of materials with another embedding model.
+
+        Indexes keep serving queries while they are re-embedded in the background. Each one is
+        switched to the target model as soon as its new generation is complete.
+
+        Args:
+            target_model_name: Name of the sentence transformer model to migrate to
+            file_id: ID of a specific file to process. If None, will process all files.
+            process_all: Must be set to True to process all files when file_id is None.
+            max_texts_per_second: Rate limit of re-embedded texts, None for no limit
+        """
+        if file_id is None and not process_all:
+            raise ValueError("Must set process_all=True to process all files when file_id is None")
+
+        material_table = self.material_controller.get_material_table()
+
+        # Filter material table if specific file_id is provided
+        material_table = _filter_material_table_by_file_id(material_table, file_id)
+
+        migration_controller = RAGMigrationController(
+            target_model_name,
+            max_texts_per_second=max_texts_per_second,
+            summary_classes=self.summary_objects,
+        )
+        total_materials = len(material_table)
+        for material_idx, (file_id, file_meta) in enumerate(material_table.items(), 1):
+            print(f"\nMigrating material RAG {material_idx}/{total_materials} (ID: {file_id})")
+
+            # Skip if RAG state doesn't exist
+            if file_meta.rag_state is None or not file_meta.rag_state.exists():
+                print(f"Skipping {file_id} as RAG state doesn't exist.")
+                continue
+
+            try:
+                # Migrate the sentence index first, the chunk index marks the material done
+                sentence_file_id = sentence_index_file_id(file_id)
+                if migration_controller.has_index(sentence_file_id):
+                    await migration_controller.amigrate_file(sentence_file_id)
+
+                state_path = await migration_controller.amigrate_file(file_id)
+                if state_path is None:
+                    print(f"Skipping {file_id} as it already uses {target_model_name}.")
+                    continue
+
+                self._save_rag_state(file_id, file_meta, state_path)
+                print(f"Migrated RAG index for material {file_id}")
             except Exception as e:
-                print(f"Error processing {file_id}: {str(e)}")
-                # Clean up any partially created state file
-                if "rag_controller" in locals() and rag_controller.state_path.exists():
-                    rag_controller.state_path.unlink()
+                print(f"Error migrating {file_id}: {str(e)}")
                 continue
 
-        print(f"\nCompleted processing {total_materials} materials")
+        print(f"\nCompleted migrating {total_materials} materials")
+
+
+def _init_rag_build_worker(num_threads: int) -> None:
+    """Share the CPU between worker processes instead of oversubscribing it."""
+    faiss.omp_set_num_threads(num_threads)
+    try:
+        import torch
+
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+
+def _collapse_near_duplicates(
+    chunks: list[TextChunk], metadatas: list[dict], threshold: float
+) -> tuple[list[TextChunk], list[dict]]:
+    """Drop chunks that near-duplicate an earlier chunk, e.g. repeated headers or boilerplate.
+
+    The parent pointers of the dropped chunks are recorded under "duplicates" in the metadata of
+    the kept chunk, so a hit on it can still be traced back to every section it stands for.
+    """
+    representatives = find_near_duplicates([chunk.text for chunk in chunks], threshold)
+
+    kept_positions = []
+    for position, representative in enumerate(representatives):
+        if representative == position:
+            kept_positions.append(position)
+        else:
+            metadatas[representative].setdefault("duplicates", []).append(metadatas[position])
+
+    if len(kept_positions) < len(chunks):
+        print(f"Collapsed {len(chunks) - len(kept_positions)} near-duplicate chunks")
+    return [chunks[i] for i in kept_positions], [metadatas[i] for i in kept_positions]
+
+
+def build_material_rag_index(
+    file_id: str,
+    sections: list[TextSection],
+    chunk_max_tokens: int = DEFAULT_MAX_TOKENS,
+    chunk_overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+    summary_classes: list[type[BaseModel]] = (),
+    build_sentence_index: bool = False,
+    dedup_threshold: float | None = DEFAULT_DEDUP_THRESHOLD,
+) -> Path:
+    """Chunk, embed and persist the RAG index of a single material.
+
+    This runs in the main process or in a build worker process, so it only touches the RAG
+    state files of the material and never the material table.
+
+    Args:
+        file_id: ID of the material
+        sections: Parsed sections of the material
+        chunk_max_tokens: Maximum estimated tokens per chunk
+        chunk_overlap_tokens: Number of tokens shared by consecutive chunks
+        summary_classes: Summary classes whose retrieval context is precomputed into the
+            context pack of the material
+        build_sentence_index: Also build the sentence-level index for small-to-big retrieval
+        dedup_threshold: Minimum shingle Jaccard similarity of chunks collapsed into one indexed
+            chunk. None indexes every chunk.
+
+    Returns:
+        Path: The path of the saved RAG state
+    """
+    rag_controller = RAGController(file_id=file_id)
+    try:
+        # Split sections into token-bounded chunks and add them to RAG index
+        chunks = chunk_sections(
+            sections, max_tokens=chunk_max_tokens, overlap_tokens=chunk_overlap_tokens
+        )
+        metadatas = [chunk.parent_pointer() for chunk in chunks]
+        if dedup_threshold is not None:
+            chunks, metadatas = _collapse_near_duplicates(chunks, metadatas, dedup_threshold)
+        with rag_controller.bulk():
+            rag_controller.add_texts(
+                [str(chunk) for chunk in chunks],
+                metadatas=metadatas,
+            )
+
+        # Save RAG state
+        rag_controller.save_state(rag_controller.state_path)
+    except Exception:
+        # Clean up any partially created state file
+        if rag_controller.state_path.exists():
+            rag_controller.state_path.unlink()
+        raise
+
+    # Precompute the context of the summary queries, so generation reads it without loading the
+    # embedding model and the index. Without a pack, QAController retrieves the context itself.
+    try:
+        context_pack = build_context_pack(rag_controller, summary_classes)
+        save_context_pack(context_pack, rag_controller.context_pack_path)
+    except Exception as e:
+        print(f"Failed to build context pack for {file_id}: {str(e)}")
+
+    # Index single sentences whose hits QAController expands within their parent section. Without
+    # this index, QAController retrieves whole chunks.
+    if build_sentence_index:
+        sentence_controller = RAGController(file_id=sentence_index_file_id(file_id))
+        try:
+            sentences = sentence_chunks(sections)
+            with sentence_controller.bulk():
+                sentence_controller.add_texts(
+                    [sentence.text for sentence in sentences],
+                    metadatas=[sentence.parent_pointer() for sentence in sentences],
+                )
+            sentence_controller.save_state(sentence_controller.state_path)
+        except Exception as e:
+            print(f"Failed to build sentence index for {file_id}: {str(e)}")
+            sentence_controller.state_path.unlink(missing_ok=True)
+
+    return rag_controller.state_path
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from collections.abc import Awaitable, Callable, Hashable
+from enum import IntEnum
+from typing import TypeVar
+
+from src.qa_gpt.core.constant import LLM_MAX_CONCURRENT_JOBS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class JobPriority(IntEnum):
+    """Priority classes of LLM jobs, lower values start first."""
+
+    INTERACTIVE = 0  # A user is waiting, e.g. on an uploaded file
+    REGENERATION = 1  # Redoing results of a material, e.g. retrying failed generations
+    BACKFILL = 2  # Bulk processing of the material table
+
+
+class LLMJobQueue:
+    """Process-wide queue that runs LLM jobs under a concurrency cap.
+
+    Waiting jobs start in priority order. Within a priority class, materials take turns so a
+    material with many jobs doesn't hold back the others, and jobs of a material start in
+    submission order.
+
+    Jobs may come from several event loops at once, e.g. one `asyncio.run` per UI session
+    thread. The queue state is guarded by a lock and each job is started on its own loop.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENT_JOBS) -> None:
+        """Initialize the queue.
+
+        Args:
+            max_concurrency: Maximum number of jobs running at once
+        """
+        self.max_concurrency = max_concurrency
+        self.running = 0
+        self._lock = threading.Lock()
+        # Waiting jobs by priority, then by material in turn order, as (loop, start future)
+        self._waiting: dict[
+            JobPriority,
+            OrderedDict[Hashable, deque[tuple[asyncio.AbstractEventLoop, asyncio.Future]]],
+        ] = {priority: OrderedDict() for priority in JobPriority}
+
+    @property
+    def num_waiting(self) -> int:
+        with self._lock:
+            return sum(
+                len(jobs) for materials in self._waiting.values() for jobs in materials.values()
+            )
+
+    def _next_job(self) -> tuple[asyncio.AbstractEventLoop, asyncio.Future] | None:
+        """Pop the next waiting job, rotating its material to the end of its class."""
+        for priority in JobPriority:
+            materials = self._waiting[priority]
+            while materials:
+                material_id, jobs = materials.popitem(last=False)
+                loop, start = jobs.popleft()
+                if jobs:
+                    materials[material_id] = jobs
+                # Skip jobs cancelled while waiting and jobs of finished loops
+                if not start.done() and not loop.is_closed():
+                    return loop, start
+        return None
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiting jobs, called with the lock held."""
+        while self.running < self.max_concurrency:
+            job = self._next_job()
+            if job is None:
+                return
+            loop, start = job
+            self.running += 1
+            try:
+                loop.call_soon_threadsafe(self._start, start)
+            except RuntimeError:
+                self.running -= 1  # The loop closed after the check
+
+    def _start(self, start: asyncio.Future) -> None:
+        """Start a job on its own loop, or pass its slot on if it was cancelled meanwhile."""
+        if start.done():
+            self._release()
+        else:
+            start.set_result(None)
+
+    def _release(self) -> None:
+        with self._lock:
+            self.running -= 1
+            self._dispatch()
+
+    async def run(
+        self,
+        job: Callable[[], Awaitable[T]],
+        priority: JobPriority = JobPriority.BACKFILL,
+        material_id: Hashable = None,
+    ) -> T:
+        """Run a job once a slot is free and no job ahead of it is waiting.
+
+        Args:
+            job: Callable creating the coroutine of the job, called when the job starts
+            priority: Priority class of the job
+            material_id: Material the job belongs to, jobs of different materials take turns
+
+        Returns:
+            The result of the job
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.create_future()
+        with self._lock:
+            self._waiting[priority].setdefault(material_id, deque()).append((loop, start))
+            self._dispatch()
+        try:
+            await start
+        except asyncio.CancelledError:
+            if start.done() and not start.cancelled():
+                # Cancelled after it was granted a slot, pass the slot on
+                self._release()
+            raise
+
+        try:
+            return await job()
+        finally:
+            self._release()
+
+
+llm_job_queue = LLMJobQueue()
@@ -1,15 +1,47 @@
 import asyncio
+import functools
 from abc import ABC, abstractmethod
+from collections.abc import Awaitable, Callable, Hashable
 from typing import Any, TypeVar
 
 from pydantic import BaseModel
 
 from src.qa_gpt.chat.chat import get_chat_gpt_response_structure_async
+from src.qa_gpt.core.controller.llm_job_queue import JobPriority, llm_job_queue
 from src.qa_gpt.core.controller.rag_controller import RAGController
-from src.qa_gpt.core.objects.questions import MultipleChoiceQuestionSet
+from src.qa_gpt.core.objects.questions import (
+    MultipleChoiceQuestionSet,
+    multiplexed_question_set_model,
+)
+from src.qa_gpt.core.objects.summaries import (
+    combined_summary_model,
+    combined_summary_prompt,
+)
+from src.qa_gpt.core.utils.context_assembler import (
+    FIELD_CONTEXT_TOKENS,
+    FIELD_SENTENCE_K,
+    SUMMARY_CONTEXT_TOKENS,
+    SUMMARY_SENTENCE_K,
+)
+from src.qa_gpt.core.utils.context_pack_utils import (
+    FIELD_CONTEXT_K,
+    SUMMARY_CONTEXT_K,
+    get_packed_context,
+    summary_context_query,
+)
+from src.qa_gpt.core.utils.prompt_budget import (
+    FIELD_PROMPT_TOKENS,
+    PAPER_CONTEXT_TOKENS,
+    SUMMARY_PROMPT_TOKENS,
+    PromptPart,
+    fit_prompt_parts,
+)
 
 T = TypeVar("T", bound=BaseModel)
 
+# Question sets requested in one call, more would crowd the completion token limit
+MAX_MULTIPLEXED_FIELDS = 4
+
 
 class BaseQAController(ABC):
     @abstractmethod
@@ -51,7 +83,10 @@ class BaseQAController(ABC):
         file_ids: list[str],
         summary_classes: list[type[T]],
         additional_contexts: list[str] = None,
-    ) -> list[T]:
+        priority: JobPriority = JobPriority.BACKFILL,
+        combine: bool = False,
+        on_result: Callable[[int, Any], None] | None = None,
+    ) -> list[T | Exception]:
         pass
 
     @abstractmethod
@@ -61,12 +96,23 @@ class BaseQAController(ABC):
         field_names: list[str],
         field_values: list[Any],
         additional_contexts: list[str] = None,
-    ) -> list[MultipleChoiceQuestionSet]:
+        priority: JobPriority = JobPriority.BACKFILL,
+        groups: list[Hashable] | None = None,
+        on_result: Callable[[int, Any], None] | None = None,
+    ) -> list[MultipleChoiceQuestionSet | Exception]:
         pass
 
 
 class QAController(BaseQAController):
-    def __init__(self) -> None:
+    def __init__(self, small_to_big: bool = False) -> None:
+        """Initialize the QA controller.
+
+        Args:
+            small_to_big: Build the material context from sentence hits expanded to their
+                surroundings within a token budget instead of whole chunks. Materials without a
+                sentence index fall back to chunks.
+        """
+        self.small_to_big = small_to_big
         self.preprocess_controller = PreprocessController()
         self.user_input_temp = {"role": "user", "content": "how can I solve 8x + 7 = -23"}
         self.summary_message_temp = {
@@ -144,24 +190,73 @@ Choice:
             """,
         }
 
+    async def get_material_text(
+        self, file_id: str, query: str, k: int, sentence_k: int, token_budget: int
+    ) -> str:
+        """Get the material context relevant to a query.
+
+        Args:
+            file_id (str): ID of the file to retrieve from
+            query (str): The retrieval query
+            k (int): Number of chunks to retrieve
+            sentence_k (int): Number of sentences to retrieve in small-to-big mode
+            token_budget (int): Token budget of the context in small-to-big mode
+
+        Returns:
+            str: The material context
+        """
+        if self.small_to_big:
+            try:
+                return await RAGController.aretrieve_context(
+                    file_id, query, sentence_k, token_budget
+                )
+            except ValueError:
+                pass  # No sentence index, fall back to chunks
+
+        # Read the context precomputed at index-build time, or retrieve it without blocking
+        # other requests on the event loop
+        relevant_content = get_packed_context(file_id, query, k=k)
+        if relevant_content is None:
+            relevant_content = await RAGController.aretrieve(file_id, query, k=k)
+        return "\n".join([text for text, _ in relevant_content])
+
     async def get_summary(
         self, file_id: str, summary_class: type[T], additional_context: str = ""
     ) -> T:
-        rag_controller = RAGController.from_file_id(file_id)
-        # Get relevant content using search_text
-        summary_keywords_str = ", ".join(summary_class.get_rag_key_words())
-        relevant_content = rag_controller.search_text(summary_keywords_str, k=5)
-        material_text = "\n".join([text for text, _ in relevant_content])
+        messages = await self.build_summary_messages(file_id, summary_class, additional_context)
+        result = await get_chat_gpt_response_structure_async(messages, res_obj=summary_class)
+        return result
+
+    async def build_summary_messages(
+        self, file_id: str, summary_class: type[BaseModel], additional_context: str = ""
+    ) -> list[dict]:
+        """Build the chat messages requesting a summary, see `get_summary`."""
+        summary_keywords_str = summary_context_query(summary_class)
+        material_text = await self.get_material_text(
+            file_id,
+            summary_keywords_str,
+            k=SUMMARY_CONTEXT_K,
+            sentence_k=SUMMARY_SENTENCE_K,
+            token_budget=SUMMARY_CONTEXT_TOKENS,
+        )
 
+        # The additional context is the whole paper, so it only fills the budget left by the
+        # retrieved clips
+        parts = fit_prompt_parts(
+            [
+                PromptPart("material", material_text),
+                PromptPart("additional_context", additional_context),
+            ],
+            SUMMARY_PROMPT_TOKENS,
+            request_name=f"{summary_class.__name__} summary of {file_id}",
+        )
         user_input = self.user_input_temp.copy()
-        context = f"{material_text}\n\nAdditional Context:\n{additional_context}"
+        context = f"{parts['material']}\n\nAdditional Context:\n{parts['additional_context']}"
         user_input.update({"content": context})
         sys_summary_message = self.summary_message_temp.copy()
         sys_summary_message.update({"content": summary_class.prompt()})
 
-        messages = [sys_summary_message, user_input]
-        result = await get_chat_gpt_response_structure_async(messages, res_obj=summary_class)
-        return result
+        return [sys_summary_message, user_input]
 
     async def get_questions(
         self, file_id: str, field_name: str, field_value: any, additional_context: str = ""
@@ -177,22 +272,147 @@ Choice:
         Returns:
             MultipleChoiceQuestionSet: A set of questions for the specified field
         """
+        messages = await self.build_question_messages(
+            file_id, field_name, field_value, additional_context
+        )
+        return await get_chat_gpt_response_structure_async(
+            messages,
+            res_obj=MultipleChoiceQuestionSet,
+            route_key=question_route_key(field_name),
+        )
+
+    async def build_question_messages(
+        self, file_id: str, field_name: str, field_value: Any, additional_context: str = ""
+    ) -> list[dict]:
+        """Build the chat messages requesting the question set of a field, see `get_questions`."""
         # Create a new RAGController instance for get_material_clips_for_topic
         # material_clips_for_topic = await self.get_material_clips_for_topic(file_id, field_value)
 
-        # Create a new RAGController instance for the main question generation
-        rag_controller = RAGController.from_file_id(file_id)
-        relevant_content = rag_controller.search_text(
-            field_name, k=2
-        )  # Use smaller number to focus on a precise field
-        material_text = "\n".join([text for text, _ in relevant_content])
+        # Use smaller k to focus on a precise field
+        material_text = await self.get_material_text(
+            file_id,
+            field_name,
+            k=FIELD_CONTEXT_K,
+            sentence_k=FIELD_SENTENCE_K,
+            token_budget=FIELD_CONTEXT_TOKENS,
+        )
+
+        parts = fit_prompt_parts(
+            [
+                PromptPart("field_value", str(field_value)),
+                PromptPart("material", material_text),
+            ],
+            FIELD_PROMPT_TOKENS,
+            request_name=f"{field_name} questions of {file_id}",
+        )
+        field_input = self.user_input_temp.copy()
+        context = f"Material: \n\n{field_name.replace('_', ' ').title()}:\n{parts['field_value']}\n\nAdditional Context:\n{parts['material']}"
+        field_input.update({"content": context})
+        return [
+            self.question_message_temp.copy(),
+            *self._paper_context_messages(file_id, additional_context),
+            field_input,
+        ]
+
+    def _paper_context_messages(self, file_id: str, additional_context: str) -> list[dict]:
+        """Messages of the paper context shared by all question requests of a material.
+
+        The paper is fitted to its own fixed budget and sent right after the static system
+        prompt, so the single question requests of a material start with the same bytes and the
+        provider can serve that prefix from its prompt cache. Field-specific parts go after it.
+        Multiplexed requests send another response schema, which the provider puts ahead of the
+        messages, so they don't share the cached prefix of single requests.
+        """
+        if not additional_context:
+            return []
+        parts = fit_prompt_parts(
+            [PromptPart("additional_context", additional_context)],
+            PAPER_CONTEXT_TOKENS,
+            request_name=f"paper context of {file_id}",
+        )
+        paper_input = self.user_input_temp.copy()
+        paper_input.update({"content": f"Paper Context:\n{parts['additional_context']}"})
+        return [paper_input]
+
+    async def get_summaries_combined(
+        self,
+        file_id: str,
+        summary_classes: list[type[BaseModel]],
+        additional_context: str = "",
+    ) -> list[BaseModel]:
+        """Generate several summary types of a file in a single request.
+
+        The response is a composite of the summary classes, so each summary comes back as an
+        instance of its own class. The additional context is sent once for all summaries.
+
+        Args:
+            file_id (str): ID of the file to summarize
+            summary_classes (list[type[BaseModel]]): The summary classes to generate
+            additional_context (str): Additional context from markdown file, defaults to empty string
 
+        Returns:
+            list[BaseModel]: The summary of each class, in class order
+        """
+        material_texts = [
+            await self.get_material_text(
+                file_id,
+                summary_context_query(summary_class),
+                k=SUMMARY_CONTEXT_K,
+                sentence_k=SUMMARY_SENTENCE_K,
+                token_budget=SUMMARY_CONTEXT_TOKENS,
+            )
+            for summary_class in summary_classes
+        ]
+
+        # Every summary type adds its clips to the budget, the paper is only sent once
+        parts = fit_prompt_parts(
+            [PromptPart(f"material_{i}", text) for i, text in enumerate(material_texts)]
+            + [PromptPart("additional_context", additional_context)],
+            SUMMARY_PROMPT_TOKENS + SUMMARY_CONTEXT_TOKENS * (len(summary_classes) - 1),
+            request_name=f"combined summary of {file_id}",
+        )
+        material = "\n".join(parts[f"material_{i}"] for i in range(len(summary_classes)))
         user_input = self.user_input_temp.copy()
-        context = f"Material: \n\n{field_name.replace('_', ' ').title()}:\n{field_value}\n\nAdditional Context:\n{material_text}\n\n Additional; Context:\n{additional_context}"
+        context = f"{material}\n\nAdditional Context:\n{parts['additional_context']}"
         user_input.update({"content": context})
-        messages = [self.question_message_temp.copy(), user_input]
-        return await get_chat_gpt_response_structure_async(
-            messages, res_obj=MultipleChoiceQuestionSet
+        sys_summary_message = self.summary_message_temp.copy()
+        sys_summary_message.update({"content": combined_summary_prompt(tuple(summary_classes))})
+
+        messages = [sys_summary_message, user_input]
+        # Each summary type keeps the completion limit of its own route
+        result = await get_chat_gpt_response_structure_async(
+            messages,
+            res_obj=combined_summary_model(tuple(summary_classes)),
+            route_key=tuple(summary_class.__name__ for summary_class in summary_classes),
+        )
+        return [getattr(result, summary_class.__name__) for summary_class in summary_classes]
+
+    async def _get_summary_group(
+        self, file_id: str, summary_classes: list[type[T]], additional_context: str
+    ) -> list[T | Exception]:
+        """Generate the summaries of a file in one request, one summary at a time on failure.
+
+        Returns:
+            list: The summary of each class, or the error of its request
+        """
+        if len(summary_classes) > 1:
+            try:
+                return await self.get_summaries_combined(
+                    file_id, summary_classes, additional_context
+                )
+            except Exception as e:
+                print(
+                    f"Combined summary of {file_id} failed, falling back to single summaries: "
+                    f"{str(e)}"
+                )
+        return list(
+            await asyncio.gather(
+                *(
+                    self.get_summary(file_id, summary_class, additional_context)
+                    for summary_class in summary_classes
+                ),
+                return_exceptions=True,
+            )
         )
 
     async def get_summaries_batch(
@@ -200,16 +420,151 @@ Choice:
         file_ids: list[str],
         summary_classes: list[type[T]],
         additional_contexts: list[str] = None,
-    ) -> list[T]:
-        tasks = []
+        priority: JobPriority = JobPriority.BACKFILL,
+        combine: bool = False,
+        on_result: Callable[[int, Any], None] | None = None,
+    ) -> list[T | Exception]:
+        """Generate summaries, one request per summary or per file.
+
+        A failed request doesn't affect the others, its summaries get the error as result.
+
+        Args:
+            file_ids (list[str]): ID of the file of each summary
+            summary_classes (list[type[T]]): Class of each summary
+            additional_contexts (list[str]): Additional context of each summary
+            priority (JobPriority): Priority class of the LLM jobs
+            combine (bool): Request all summaries of a file together as one composite response
+            on_result (Callable): Called with the input position and the summary or error of
+                each summary as soon as its request finishes, e.g. to persist it right away
+
+        Returns:
+            list: The summary or error of each summary, in input order
+        """
         if additional_contexts is None:
             additional_contexts = [""] * len(file_ids)
-        for file_id, summary_class, additional_context in zip(
-            file_ids, summary_classes, additional_contexts
-        ):
-            tasks.append(self.get_summary(file_id, summary_class, additional_context))
-            await asyncio.sleep(3)  # Add 3 seconds delay between calls
-        return await asyncio.gather(*tasks)
+
+        positions_by_group = {}
+        for position, file_id in enumerate(file_ids):
+            group = file_id if combine else position
+            positions_by_group.setdefault(group, []).append(position)
+
+        results = [None] * len(file_ids)
+        tasks = []
+        for positions in positions_by_group.values():
+            file_id = file_ids[positions[0]]
+            job = functools.partial(
+                self._get_summary_group,
+                file_id,
+                [summary_classes[i] for i in positions],
+                additional_contexts[positions[0]],
+            )
+            tasks.append(
+                _run_group(
+                    llm_job_queue.run(job, priority, material_id=file_id),
+                    positions,
+                    results,
+                    on_result,
+                )
+            )
+        # Jobs share the concurrency cap of the job queue with other materials, their requests
+        # are paced by the LLM scheduler against the account's rate limits
+        await asyncio.gather(*tasks)
+        return results
+
+    async def get_questions_multiplexed(
+        self,
+        file_id: str,
+        field_names: list[str],
+        field_values: list[Any],
+        additional_context: str = "",
+    ) -> list[MultipleChoiceQuestionSet]:
+        """Generate the question sets of several fields of a file in a single request.
+
+        The system prompt and the paper context are sent once for all fields instead of once
+        per field.
+
+        Args:
+            file_id (str): ID of the file to generate questions from
+            field_names (list[str]): Names of the fields to generate questions for
+            field_values (list[Any]): Values of the fields
+            additional_context (str): Additional context from markdown file, defaults to empty string
+
+        Returns:
+            list[MultipleChoiceQuestionSet]: The question set of each field, in field order
+        """
+        material_texts = [
+            await self.get_material_text(
+                file_id,
+                field_name,
+                k=FIELD_CONTEXT_K,
+                sentence_k=FIELD_SENTENCE_K,
+                token_budget=FIELD_CONTEXT_TOKENS,
+            )
+            for field_name in field_names
+        ]
+
+        parts = fit_prompt_parts(
+            [PromptPart(f"field_value_{i}", str(value)) for i, value in enumerate(field_values)]
+            + [PromptPart(f"material_{i}", text) for i, text in enumerate(material_texts)],
+            FIELD_PROMPT_TOKENS * len(field_names),
+            request_name=f"{', '.join(field_names)} questions of {file_id}",
+        )
+        field_contexts = "\n\n".join(
+            f"{field_name.replace('_', ' ').title()}:\n{parts[f'field_value_{i}']}\n\nAdditional Context:\n{parts[f'material_{i}']}"
+            for i, field_name in enumerate(field_names)
+        )
+        field_input = self.user_input_temp.copy()
+        context = (
+            f"Material: \n\n{field_contexts}"
+            f"\n\nCreate a separate question set for each of these fields: {', '.join(field_names)}. "
+            "Base each question set only on its own field and material clips."
+        )
+        field_input.update({"content": context})
+        messages = [
+            self.question_message_temp.copy(),
+            *self._paper_context_messages(file_id, additional_context),
+            field_input,
+        ]
+        # Routed like single question sets, field routes don't apply to a group of fields, with
+        # the completion limit of a question set for each field
+        result = await get_chat_gpt_response_structure_async(
+            messages,
+            res_obj=multiplexed_question_set_model(tuple(field_names)),
+            route_key=(MultipleChoiceQuestionSet.__name__,) * len(field_names),
+        )
+        return [getattr(result, field_name) for field_name in field_names]
+
+    async def _get_question_group(
+        self,
+        file_id: str,
+        field_names: list[str],
+        field_values: list[Any],
+        additional_context: str,
+    ) -> list[MultipleChoiceQuestionSet | Exception]:
+        """Generate the question sets of a group of fields, one field at a time on failure.
+
+        Returns:
+            list: The question set of each field, or the error of its request
+        """
+        if len(field_names) > 1:
+            try:
+                return await self.get_questions_multiplexed(
+                    file_id, field_names, field_values, additional_context
+                )
+            except Exception as e:
+                print(
+                    f"Multiplexed questions for {field_names} of {file_id} failed, "
+                    f"falling back to single fields: {str(e)}"
+                )
+        return list(
+            await asyncio.gather(
+                *(
+                    self.get_questions(file_id, field_name, field_value, additional_context)
+                    for field_name, field_value in zip(field_names, field_values)
+                ),
+                return_exceptions=True,
+            )
+        )
 
     async def get_questions_batch(
         self,
@@ -217,16 +572,92 @@ Choice:
         field_names: list[str],
         field_values: list[Any],
         additional_contexts: list[str] = None,
-    ) -> list[MultipleChoiceQuestionSet]:
-        tasks = []
+        priority: JobPriority = JobPriority.BACKFILL,
+        groups: list[Hashable] | None = None,
+        on_result: Callable[[int, Any], None] | None = None,
+    ) -> list[MultipleChoiceQuestionSet | Exception]:
+        """Generate the question sets of fields, one request per field or per group of fields.
+
+        A failed request doesn't affect the others, its fields get the error as result.
+
+        Args:
+            file_ids (list[str]): ID of the file of each field
+            field_names (list[str]): Name of each field
+            field_values (list[Any]): Value of each field
+            additional_contexts (list[str]): Additional context of each field
+            priority (JobPriority): Priority class of the LLM jobs
+            groups (list[Hashable]): Group of each field, e.g. its summary type. Fields of the
+                same file and group are requested together, up to MAX_MULTIPLEXED_FIELDS per
+                request. None requests each field on its own.
+            on_result (Callable): Called with the input position and the question set or error
+                of each field as soon as its request finishes, e.g. to persist it right away
+
+        Returns:
+            list: The question set or error of each field, in input order
+        """
         if additional_contexts is None:
             additional_contexts = [""] * len(file_ids)
-        for file_id, field_name, field_value, additional_context in zip(
-            file_ids, field_names, field_values, additional_contexts
-        ):
-            tasks.append(self.get_questions(file_id, field_name, field_value, additional_context))
-            await asyncio.sleep(3)  # Add 3 seconds delay between calls
-        return await asyncio.gather(*tasks)
+        if groups is None:
+            groups = list(range(len(file_ids)))  # Every field is a group of its own
+
+        positions_by_group = {}
+        for position, (file_id, group) in enumerate(zip(file_ids, groups)):
+            positions_by_group.setdefault((file_id, group), []).append(position)
+
+        results = [None] * len(file_ids)
+        tasks = []
+        for (file_id, _), positions in positions_by_group.items():
+            for start in range(0, len(positions), MAX_MULTIPLEXED_FIELDS):
+                chunk = positions[start : start + MAX_MULTIPLEXED_FIELDS]
+                job = functools.partial(
+                    self._get_question_group,
+                    file_id,
+                    [field_names[i] for i in chunk],
+                    [field_values[i] for i in chunk],
+                    additional_contexts[chunk[0]],
+                )
+                tasks.append(
+                    _run_group(
+                        llm_job_queue.run(job, priority, material_id=file_id),
+                        chunk,
+                        results,
+                        on_result,
+                    )
+                )
+        # Jobs share the concurrency cap of the job queue with other materials, their requests
+        # are paced by the LLM scheduler against the account's rate limits
+        await asyncio.gather(*tasks)
+        return results
+
+
+def question_route_key(field_name: str) -> str:
+    """Route key of the question set of a summary field, see ModelRoutingPolicy."""
+    return f"{MultipleChoiceQuestionSet.__name__}.{field_name}"
+
+
+async def _run_group(
+    group_job: Awaitable[list],
+    positions: list[int],
+    results: list,
+    on_result: Callable[[int, Any], None] | None,
+) -> None:
+    """Await the job of a request group and hand out its results by input position.
+
+    An error of the job as a whole becomes the result of every position of the group, and so
+    does an error of `on_result` for its position.
+    """
+    try:
+        group_results = await group_job
+    except Exception as e:
+        group_results = [e] * len(positions)
+    for position, result in zip(positions, group_results):
+        results[position] = result
+        if on_result is not None:
+            try:
+                on_result(position, result)
+            except Exception as e:
+                print(f"Failed to handle result {position}: {str(e)}")
+                results[position] = e
 
 
 class PreprocessController:
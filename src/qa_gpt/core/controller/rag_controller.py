@@ -1,54 +1,213 @@
+import asyncio
+import functools
 import logging
+import numbers
+import os
 import pickle
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from src.qa_gpt.core.constant import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL,
+    RAG_INDEX_FACTORY,
+    RAG_RETRIEVAL_MAX_WORKERS,
+    RAG_STATE_FOLDER,
+)
+from src.qa_gpt.core.controller.rag_index_pool import rag_index_pool
+from src.qa_gpt.core.controller.rag_query_cache import rag_query_cache
+from src.qa_gpt.core.controller.rag_text_store import MetadataStore, TextStore
+from src.qa_gpt.core.utils.context_assembler import (
+    assemble_context,
+    sentence_index_file_id,
+)
+from src.qa_gpt.core.utils.context_pack_utils import context_pack_path
+from src.qa_gpt.core.utils.embedding_backends import (
+    EmbeddingBackend,
+    get_embedding_backend,
+)
+from src.qa_gpt.core.utils.encoding_scheduler import encode_scheduled
+from src.qa_gpt.core.utils.rag_pointer_utils import (
+    current_generation,
+    generation_storage_id,
+    rag_file_lock,
+    read_rag_pointer,
+    resolve_storage_id,
+)
 
 logger = logging.getLogger(__name__)
 
+# Stable IDs are non-negative and fit the signed 64-bit labels of FAISS
+MAX_STABLE_ID = 2**63 - 1
+
+# Loading indexes, encoding queries and FAISS searches are CPU/disk bound. They run in this
+# bounded pool so coroutines awaiting them don't block the event loop, and torch and FAISS
+# release the GIL while they work.
+_retrieval_executor = ThreadPoolExecutor(
+    max_workers=RAG_RETRIEVAL_MAX_WORKERS, thread_name_prefix="rag-retrieval"
+)
+
+
+async def run_in_retrieval_executor(func, *args, **kwargs):
+    """Run a blocking retrieval call in the bounded retrieval thread pool.
+
+    Args:
+        func: The blocking callable
+        *args: Positional arguments of the callable
+        **kwargs: Keyword arguments of the callable
+
+    Returns:
+        The return value of the callable
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_retrieval_executor, functools.partial(func, *args, **kwargs))
+
+
+def state_journal_path(state_path: str | Path) -> Path:
+    """Get the path of the journal of ID mapping changes next to a state file."""
+    return Path(state_path).with_suffix(".journal")
+
+
+def saved_state_signature(state_path: str | Path) -> tuple:
+    """Identify the saved version of a state file and its journal by their file stats.
+
+    Every save replaces the state file or appends to the journal, so the signature changes
+    with every saved change, also of writers in other processes.
+    """
+    signature = []
+    for path in (Path(state_path), state_journal_path(state_path)):
+        try:
+            stat = path.stat()
+            signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
 
 class RAGController:
     def __init__(
         self,
-        model_name: str = "all-MiniLM-L6-v2",
-        rag_state_folder_path: str = "./rag_state",
+        model_name: str | None = None,
+        rag_state_folder_path: str = RAG_STATE_FOLDER,
         file_id: str = None,
+        mmap_index: bool = False,
+        embedding_backend: str | EmbeddingBackend = EMBEDDING_BACKEND,
+        generation: int | None = None,
+        index_factory: str = RAG_INDEX_FACTORY,
     ):
         """
         Initialize the RAG controller with FAISS index.
 
         Args:
-            model_name: Name of the sentence transformer model to use for text embeddings
+            model_name: Name of the sentence transformer model to use for text embeddings. If
+                None, the model the index generation was built with, so texts and queries of a
+                migrated file are encoded with its new model.
             rag_state_folder_path: Path to the folder containing RAG state files
             file_id: File ID to load specific RAG state and index. If None, will create a new index in memory.
+            mmap_index: Memory-map an existing index read-only where the index type allows. The
+                index is copied into memory before the first change.
+            embedding_backend: Backend encoding the texts, "torch", "onnx" or "onnx-int8", or an
+                already loaded backend. All backends produce vectors compatible with the same index.
+            generation: Generation of the index of the file, the live generation if None. A new
+                generation is built alongside the live one when the embedding model changes.
+            index_factory: FAISS index factory string of a new index, e.g. "Flat", "HNSW32" or
+                "IVF64,Flat". Trained indexes are trained on the first vectors added, a flat
+                index is used if those are too few to train on. An existing index keeps the type
+                it was saved with.
         """
         self.rag_state_folder = Path(rag_state_folder_path)
         self.rag_state_folder.mkdir(exist_ok=True)
         self.file_id = file_id
 
-        # Set up paths based on file_id
+        # Set up paths based on file_id and the index generation
         if file_id is not None:
-            self.index_path = self.rag_state_folder / f"{file_id}_rag_index.pkl"
-            self.state_path = self.rag_state_folder / f"{file_id}_rag_state.pkl"
+            if generation is None:
+                generation = current_generation(file_id, self.rag_state_folder)
+            self.generation = generation
+            self.storage_id = generation_storage_id(file_id, generation)
+            self.index_path = self.rag_state_folder / f"{self.storage_id}_rag_index.pkl"
+            self.state_path = self.rag_state_folder / f"{self.storage_id}_rag_state.pkl"
+            self.context_pack_path = context_pack_path(self.storage_id, self.rag_state_folder)
         else:
             raise ValueError("File ID is required to initialize RAGController")
+        if model_name is None:
+            model_name = self._saved_model_name(file_id, generation)
 
         self.index = None
-        self.model = SentenceTransformer(model_name)
+        self._index_is_mapped = False
+        if isinstance(embedding_backend, EmbeddingBackend):
+            self.embedding_backend = embedding_backend
+        else:
+            self.embedding_backend = get_embedding_backend(model_name, embedding_backend)
+        self.index_factory = index_factory
         self.model_name = model_name
-        self.dimension = self.model.get_sentence_embedding_dimension()
-        self.text_store = []  # Store original texts
+        self.dimension = self.embedding_backend.get_sentence_embedding_dimension()
+        self.last_encoding_stats = None  # Padding and throughput of the last `add_texts`
+        # Original texts and their metadata like parent section pointers by stable ID. Both live
+        # on disk next to the index and only the looked up entries are read.
+        self.text_store = TextStore(self.rag_state_folder / f"{self.storage_id}_rag_texts")
+        self.metadata_store = MetadataStore(
+            self.rag_state_folder / f"{self.storage_id}_rag_metadata"
+        )
+        # Stable IDs are decoupled from FAISS labels so an upsert never reuses a label and
+        # removals only drop the mapping. Stale labels are dropped by `compact`.
+        self.id_to_label = {}
+        self.label_to_id = {}
+        self.next_id = 0
+        self.next_label = 0
+        self.compact_ratio = 0.25
+        # Identify the contents of the index, search results are cached per identity and
+        # version. The version is incremented on every change, the UID only changes when an
+        # index is created from scratch so a rebuilt index never reuses cached results.
+        self.index_uid = uuid.uuid4().hex
+        self.index_version = 0
+        # Changes of the ID mapping since the state file was last written, None marks a removal.
+        # Flushes append them to a journal next to the state file instead of rewriting it, the
+        # journal belongs to the state file with the same journal ID.
+        self._journal_changes: dict[int, int | None] = {}
+        self._journal_entries = 0
+        self._journal_id = None  # Unknown until a state file is restored or written
+        # Signature of the saved state this controller reflects, see `is_current`
+        self._saved_signature = None
+
+        # Persistence is deferred inside `bulk` sessions until they end, or until one of the
+        # thresholds below is hit. None disables a threshold.
+        self.flush_every_n_changes = None
+        self.flush_interval_seconds = None
+        self._bulk_depth = 0
+        self._pending_changes = 0
+        self._last_flush_time = time.monotonic()
 
         if self.index_path and self.index_path.exists():
-            self._load_index()
+            self._load_index(mmap_index)
+            self._restore_stores({})
+            self._dirty = False
         else:
             self._init_index()
+            # Drop the texts of a previous index of the file
+            self.text_store.clear()
+            self.metadata_store.clear()
+            self._dirty = True  # A new index only exists in memory
+
+    def _saved_model_name(self, file_id: str, generation: int) -> str:
+        """Get the embedding model of a generation from its saved state or the pointer."""
+        if self.state_path.exists():
+            with open(self.state_path, "rb") as f:
+                return pickle.load(f)["model_name"]
+        pointer = read_rag_pointer(file_id, self.rag_state_folder)
+        if pointer is not None and pointer["generation"] == generation:
+            return pointer["model_name"]
+        return EMBEDDING_MODEL
 
     @classmethod
     def from_file_id(
-        cls, file_id: str, rag_state_folder_path: str = "./rag_state"
+        cls, file_id: str, rag_state_folder_path: str = RAG_STATE_FOLDER, use_pool: bool = True
     ) -> "RAGController":
         """
         Initialize a RAGController instance for a specific file.
@@ -56,84 +215,423 @@ class RAGController:
         Args:
             file_id: The ID of the file to load RAG state for
             rag_state_folder_path: Path to the folder containing RAG state files
+            use_pool: Share the controller through the process-wide index pool, so repeated
+                calls for a hot file skip loading it. The pooled controller is shared by all
+                callers, and reloaded once the saved index of the file changed.
+
+        Returns:
+            A RAGController instance initialized for the specified file
+        """
+        if use_pool:
+            return rag_index_pool.get(
+                file_id,
+                rag_state_folder_path,
+                loader=lambda: cls._load_file_id(file_id, rag_state_folder_path, mmap_index=True),
+                is_current=cls.is_current,
+            )
+        return cls._load_file_id(file_id, rag_state_folder_path)
+
+    def is_current(self) -> bool:
+        """Check if the controller still reflects the live saved index of its file.
+
+        It is stale once the pointer of the file moved to another generation, or once another
+        controller, possibly in another process, saved changes to its generation.
+        """
+        if resolve_storage_id(self.file_id, self.rag_state_folder) != self.storage_id:
+            return False
+        return saved_state_signature(self.state_path) == self._saved_signature
+
+    @classmethod
+    def _from_file_id_or_default(
+        cls, file_id: str, rag_state_folder_path: str | None
+    ) -> "RAGController":
+        """Call `from_file_id`, with its default folder if none is given."""
+        if rag_state_folder_path is None:
+            return cls.from_file_id(file_id)
+        return cls.from_file_id(file_id, rag_state_folder_path)
+
+    @classmethod
+    async def aretrieve(
+        cls,
+        file_id: str,
+        query_text: str,
+        k: int = 5,
+        rag_state_folder_path: str | None = None,
+    ) -> list[tuple[str, float]]:
+        """
+        Load the controller of a file and search it without blocking the event loop.
+
+        Loading and searching run together in one call of the bounded retrieval thread pool.
+
+        Args:
+            file_id: The ID of the file to search
+            query_text: The search query string
+            k: Number of results to return
+            rag_state_folder_path: Path to the folder containing RAG state files, the default
+                folder of `from_file_id` if None
+
+        Returns:
+            List of tuples containing (text, distance) for the top k results
+        """
+
+        def retrieve():
+            rag_controller = cls._from_file_id_or_default(file_id, rag_state_folder_path)
+            return rag_controller.search_text(query_text, k=k)
+
+        return await run_in_retrieval_executor(retrieve)
+
+    @classmethod
+    async def aretrieve_context(
+        cls,
+        file_id: str,
+        query_text: str,
+        k: int,
+        token_budget: int,
+        rag_state_folder_path: str | None = None,
+    ) -> str:
+        """
+        Search the sentence index of a file and expand the hits within a token budget.
+
+        Args:
+            file_id: The ID of the file to search
+            query_text: The search query string
+            k: Number of sentences to retrieve
+            token_budget: Maximum estimated tokens of the assembled context
+            rag_state_folder_path: Path to the folder containing RAG state files, the default
+                folder of `from_file_id` if None
 
         Returns:
-            A new RAGController instance initialized for the specified file
+            The retrieved sentences and their surroundings grouped by section
+
+        Raises:
+            ValueError: If the file has no sentence index
         """
-        index_path = Path(rag_state_folder_path) / f"{file_id}_rag_index.pkl"
-        state_path = Path(rag_state_folder_path) / f"{file_id}_rag_state.pkl"
+
+        def retrieve():
+            sentence_controller = cls._from_file_id_or_default(
+                sentence_index_file_id(file_id), rag_state_folder_path
+            )
+            hits = sentence_controller.search_text_ids(query_text, k=k)
+            return assemble_context(sentence_controller, hits, token_budget)
+
+        return await run_in_retrieval_executor(retrieve)
+
+    @classmethod
+    def _load_file_id(
+        cls, file_id: str, rag_state_folder_path: str, mmap_index: bool = False
+    ) -> "RAGController":
+        """Load the saved state of the live index generation of a file from disk."""
+        storage_id = resolve_storage_id(file_id, rag_state_folder_path)
+        index_path = Path(rag_state_folder_path) / f"{storage_id}_rag_index.pkl"
+        state_path = Path(rag_state_folder_path) / f"{storage_id}_rag_state.pkl"
 
         if index_path.exists() and state_path.exists():
-            return cls.load_state(state_path)
+            return cls.load_state(state_path, mmap_index=mmap_index)
         else:
             raise ValueError(
                 f"RAG state files for file {file_id} not found in {rag_state_folder_path}"
             )
 
+    def _new_index(self) -> faiss.Index:
+        """Create an empty FAISS index addressed by labels."""
+        index = faiss.index_factory(self.dimension, self.index_factory)
+        try:
+            # IVF indexes only reconstruct vectors, e.g. for `compact`, with a direct map
+            faiss.extract_index_ivf(index).make_direct_map()
+        except RuntimeError:
+            pass  # Not an IVF index
+        return faiss.IndexIDMap2(index)
+
+    def _train_index(self, index: faiss.Index, vectors: np.ndarray) -> faiss.Index:
+        """Train an empty index, or replace it by a flat index if there are too few vectors.
+
+        An IVF index needs at least as many training vectors as it has lists, which small
+        materials don't have. Their index falls back to exact search, `compact` builds the
+        configured index type again once the material has grown.
+        """
+        try:
+            index.train(vectors)
+            return index
+        except RuntimeError as e:
+            logger.info(
+                f"Can't train a {self.index_factory} index on {len(vectors)} vectors, using a "
+                f"flat index instead: {e}"
+            )
+            return faiss.IndexIDMap2(faiss.index_factory(self.dimension, "Flat"))
+
+    @staticmethod
+    def _to_device(index: faiss.Index) -> faiss.Index:
+        """Move an index to GPU if one is available."""
+        if faiss.get_num_gpus() > 0:
+            try:
+                return faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, index)
+            except Exception as e:
+                logger.warning(f"Failed to move index to GPU, keeping it on CPU: {e}")
+        return index
+
+    def _cpu_index(self) -> faiss.Index:
+        """Return a CPU copy of the index, or the index itself if it is on CPU."""
+        return faiss.index_gpu_to_cpu(self.index) if faiss.get_num_gpus() > 0 else self.index
+
     def _init_index(self):
         """Initialize a new FAISS index."""
-        self.index = faiss.IndexFlatL2(self.dimension)
-        if faiss.get_num_gpus() > 0:
-            self.index = faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, self.index)
+        self.index = self._to_device(self._new_index())
+
+    def _read_index(self, mmap_index: bool) -> faiss.Index:
+        """Read the FAISS index file, memory-mapping it read-only if requested and possible."""
+        # Mapped codes can't be moved to GPU without a copy, so only map CPU indexes
+        mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+        if mmap_index and mmap_flag is not None and faiss.get_num_gpus() == 0:
+            try:
+                index = faiss.read_index(str(self.index_path), mmap_flag | faiss.IO_FLAG_READ_ONLY)
+                self._index_is_mapped = True
+                return index
+            except Exception as e:
+                logger.info(f"Index type doesn't support mmap, reading it into memory: {e}")
+
+        self._index_is_mapped = False
+        return faiss.read_index(str(self.index_path))
+
+    def _ensure_writable_index(self) -> None:
+        """Copy a memory-mapped index into memory before changing it."""
+        if self._index_is_mapped:
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            self._index_is_mapped = False
 
-    def _load_index(self):
+    def _load_index(self, mmap_index: bool = False):
         """Load an existing FAISS index from disk."""
         try:
-            self.index = faiss.read_index(str(self.index_path))
-            if faiss.get_num_gpus() > 0:
-                self.index = faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, self.index)
+            index = self._read_index(mmap_index)
+            if not isinstance(index, faiss.IndexIDMap2):
+                # Index saved before stable IDs were introduced, labels are the positions
+                labelled_index = self._new_index()
+                if index.ntotal > 0:
+                    labelled_index.add_with_ids(
+                        index.reconstruct_n(0, index.ntotal), np.arange(index.ntotal, dtype="int64")
+                    )
+                index = labelled_index
+                self._index_is_mapped = False
+            self.index = self._to_device(index)
             logger.info(f"Successfully loaded FAISS index from {self.index_path}")
         except Exception as e:
             logger.error(f"Failed to load index: {e}")
             self._init_index()
 
     def _save_index(self):
-        """Save the FAISS index to disk."""
+        """Save the FAISS index to disk atomically via a temporary file rename.
+
+        Raises:
+            Exception: If the index could not be written, the previous index file is kept
+        """
         if self.index_path:
+            tmp_path = self.index_path.with_name(f"{self.index_path.name}.tmp")
             try:
-                cpu_index = (
-                    faiss.index_gpu_to_cpu(self.index) if faiss.get_num_gpus() > 0 else self.index
-                )
-                faiss.write_index(cpu_index, str(self.index_path))
+                faiss.write_index(self._cpu_index(), str(tmp_path))
+                os.replace(tmp_path, self.index_path)
                 logger.info(f"Successfully saved FAISS index to {self.index_path}")
             except Exception as e:
                 logger.error(f"Failed to save index: {e}")
+                tmp_path.unlink(missing_ok=True)
+                raise
+
+    def _mark_dirty(self, num_changes: int) -> None:
+        """Record unsaved changes and persist them unless a bulk session defers it."""
+        self._dirty = True
+        self._pending_changes += num_changes
+        self.index_version += 1
+
+        if self._bulk_depth == 0:
+            self.flush()
+        elif (
+            self.flush_every_n_changes is not None
+            and self._pending_changes >= self.flush_every_n_changes
+        ) or (
+            self.flush_interval_seconds is not None
+            and time.monotonic() - self._last_flush_time >= self.flush_interval_seconds
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Persist the FAISS index and the controller state if there are unsaved changes.
+
+        If persisting fails, the error is raised and the changes stay unsaved for the next flush.
+        """
+        if not self._dirty:
+            return
+
+        # A migration can't flip the pointer of the file while its live generation is saved
+        with rag_file_lock(self.file_id, self.rag_state_folder):
+            if current_generation(self.file_id, self.rag_state_folder) > self.generation:
+                logger.warning(
+                    f"Saving generation {self.generation} of file {self.file_id}, which is no "
+                    "longer live, the changes aren't served"
+                )
+            self._save_index()
+            self.text_store.save()
+            self.metadata_store.save()
+            # The journal is folded into the state file once it outgrows the mapping, so each
+            # change is rewritten a constant number of times on average
+            num_entries = self._journal_entries + len(self._journal_changes)
+            if self._journal_id is None or num_entries > max(len(self.id_to_label), 1024):
+                self._save_state_file(self.state_path)
+            else:
+                self._append_journal()
+            self._saved_signature = saved_state_signature(self.state_path)
+        self._dirty = False
+
+        # Context precomputed from the previous version of the index is now stale
+        self.context_pack_path.unlink(missing_ok=True)
+
+        # Other pooled controllers of this generation of the file are now stale
+        pooled = rag_index_pool.peek(self.file_id, self.rag_state_folder)
+        if pooled not in (None, self) and pooled.storage_id == self.storage_id:
+            rag_index_pool.invalidate(self.file_id, self.rag_state_folder)
+        self._pending_changes = 0
+        self._last_flush_time = time.monotonic()
+
+    @contextmanager
+    def bulk(self):
+        """
+        Defer persistence of all changes made inside the session to a single flush at its end.
+
+        Sessions can be nested, only the outermost one flushes. If the session raises, nothing
+        is flushed so a half-built index is never persisted by the session itself.
+
+        Example:
+            with rag_controller.bulk():
+                for texts in batches:
+                    rag_controller.add_texts(texts)
+        """
+        self._bulk_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._bulk_depth -= 1
+            raise
+        self._bulk_depth -= 1
+        if self._bulk_depth == 0:
+            self.flush()
+
+    @staticmethod
+    def _check_ids(ids: list[int]) -> list[int]:
+        """Validate caller supplied IDs, they are stored as unsigned 64-bit integers.
 
-    def add_texts(self, texts: list[str]) -> None:
+        Raises:
+            ValueError: If an ID is not an integer or out of the range of stable IDs
+        """
+        invalid = [
+            id_
+            for id_ in ids
+            if isinstance(id_, bool)
+            or not isinstance(id_, numbers.Integral)
+            or not 0 <= int(id_) <= MAX_STABLE_ID
+        ]
+        if invalid:
+            raise ValueError(f"IDs must be integers from 0 to {MAX_STABLE_ID}, got {invalid}")
+        return [int(id_) for id_ in ids]
+
+    def _assign_ids(self, count: int, ids: list[int] | None) -> list[int]:
+        """Validate caller supplied IDs or allocate new ones."""
+        if ids is None:
+            ids = list(range(self.next_id, self.next_id + count))
+        else:
+            ids = self._check_ids(ids)
+            if len(ids) != count:
+                raise ValueError(f"Expected {count} IDs, got {len(ids)}")
+            if len(set(ids)) != len(ids):
+                raise ValueError("IDs must be unique")
+            existing = [id_ for id_ in ids if id_ in self.id_to_label]
+            if existing:
+                raise ValueError(f"IDs {existing} already exist, use upsert to replace them")
+
+        self.next_id = max([self.next_id, *(id_ + 1 for id_ in ids)])
+        return ids
+
+    def _add_embeddings(self, embeddings: np.ndarray, ids: list[int]) -> None:
+        """Add embeddings to the FAISS index under fresh labels mapped to the given IDs."""
+        self._ensure_writable_index()
+        labels = np.arange(self.next_label, self.next_label + len(ids), dtype="int64")
+        if not self.index.is_trained:
+            trained_index = self._train_index(self.index, embeddings)
+            if trained_index is not self.index:
+                self.index = self._to_device(trained_index)
+        self.index.add_with_ids(embeddings, labels)
+        self.next_label += len(ids)
+
+        for id_, label in zip(ids, labels.tolist()):
+            self.id_to_label[id_] = label
+            self.label_to_id[label] = id_
+            self._journal_changes[id_] = label
+
+    def add_texts(
+        self,
+        texts: list[str],
+        metadatas: list[dict] | None = None,
+        ids: list[int] | None = None,
+    ) -> list[int]:
         """
         Add a list of texts to the vector store.
 
         Args:
             texts: List of strings to be embedded and stored
+            metadatas: Optional metadata for each text, e.g. the parent section of a chunk
+            ids: Optional stable non-negative 64-bit IDs for the texts. New IDs are allocated
+                if None.
+
+        Returns:
+            The stable IDs of the added texts
+
+        Raises:
+            ValueError: If metadatas or ids don't match texts, an ID is invalid or already exists
         """
         if not texts:
-            return
+            return []
 
-        # Generate embeddings
-        embeddings = self.model.encode(texts, convert_to_tensor=True)
-        embeddings = embeddings.cpu().numpy().astype("float32")
+        if metadatas is None:
+            metadatas = [{} for _ in texts]
+        if len(metadatas) != len(texts):
+            raise ValueError(f"Expected {len(texts)} metadata entries, got {len(metadatas)}")
+        ids = self._assign_ids(len(texts), ids)
+
+        # Generate embeddings in batches of texts of similar length to minimize padding
+        embeddings, self.last_encoding_stats = encode_scheduled(self.embedding_backend, texts)
 
         # Add to FAISS index
-        self.index.add(embeddings)
+        self._add_embeddings(embeddings, ids)
+
+        # Store original texts and their metadata
+        for id_, text, metadata in zip(ids, texts, metadatas):
+            self.text_store[id_] = text
+            self.metadata_store[id_] = metadata
 
-        # Store original texts
-        self.text_store.extend(texts)
+        # Save index unless persistence is deferred
+        self._mark_dirty(len(ids))
 
-        # Save index if path is specified
-        self._save_index()
+        return ids
 
-    def add_vectors(self, vectors: np.ndarray) -> None:
+    def add_vectors(
+        self,
+        vectors: np.ndarray,
+        ids: list[int] | None = None,
+        texts: list[str] | None = None,
+    ) -> list[int]:
         """
         Add vectors to the vector store.
 
         Args:
             vectors: numpy array of shape (n, dimension) containing vectors to be stored
+            ids: Optional stable non-negative 64-bit IDs for the vectors. New IDs are allocated
+                if None.
+            texts: Optional original texts of the vectors, stored alongside them
+
+        Returns:
+            The stable IDs of the added vectors
 
         Raises:
-            ValueError: If vectors have wrong dimension
+            ValueError: If vectors have wrong dimension, or ids/texts don't match vectors
         """
         if vectors.size == 0:
-            return
+            return []
 
         # Ensure vectors are float32
         vectors = vectors.astype("float32")
@@ -143,58 +641,197 @@ class RAGController:
             raise ValueError(
                 f"Expected vectors of dimension {self.dimension}, got {vectors.shape[1]}"
             )
+        if texts is not None and len(texts) != len(vectors):
+            raise ValueError(f"Expected {len(vectors)} texts, got {len(texts)}")
+        ids = self._assign_ids(len(vectors), ids)
 
         # Add to FAISS index
-        self.index.add(vectors)
+        self._add_embeddings(vectors, ids)
 
-        # Save index if path is specified
-        self._save_index()
+        if texts is not None:
+            for id_, text in zip(ids, texts):
+                self.text_store[id_] = text
+                self.metadata_store[id_] = {}
 
-    def search_text(self, query_text: str, k: int = 5) -> list[tuple[str, float]]:
+        # Save index unless persistence is deferred
+        self._mark_dirty(len(ids))
+
+        return ids
+
+    def remove_texts(self, ids: list[int]) -> int:
         """
-        Search for the most relevant texts given a query text.
+        Remove texts and their vectors from the vector store.
+
+        Removal only drops the ID mapping, so it costs time proportional to the number of
+        removed IDs. The stale vectors are dropped once they exceed `compact_ratio` of the index.
+
+        Args:
+            ids: Stable IDs of the texts or vectors to remove
+
+        Returns:
+            Number of entries that were removed
+        """
+        removed = 0
+        for id_ in ids:
+            label = self.id_to_label.pop(int(id_), None)
+            if label is None:
+                continue
+            del self.label_to_id[label]
+            self._journal_changes[int(id_)] = None
+            self.text_store.pop(int(id_), None)
+            self.metadata_store.pop(int(id_), None)
+            removed += 1
+
+        if removed == 0:
+            return 0
+
+        if self._num_stale() > self.compact_ratio * self.index.ntotal:
+            self.compact()
+        else:
+            self._mark_dirty(removed)
+
+        return removed
+
+    def upsert(
+        self, ids: list[int], texts: list[str], metadatas: list[dict] | None = None
+    ) -> list[int]:
+        """
+        Insert texts under the given IDs, replacing the entries that already exist.
+
+        Args:
+            ids: Stable IDs of the texts
+            texts: List of strings to be embedded and stored
+            metadatas: Optional metadata for each text
+
+        Returns:
+            The stable IDs of the upserted texts
+        """
+        if len(ids) != len(texts):
+            raise ValueError(f"Expected {len(texts)} IDs, got {len(ids)}")
+        ids = self._check_ids(ids)  # Before anything is removed
+
+        with self.bulk():
+            self.remove_texts([id_ for id_ in ids if id_ in self.id_to_label])
+            return self.add_texts(texts, metadatas=metadatas, ids=ids)
+
+    def _num_stale(self) -> int:
+        """Number of vectors in the FAISS index that no longer map to an ID."""
+        return self.index.ntotal - len(self.label_to_id)
+
+    def compact(self) -> None:
+        """Rebuild the FAISS index without the vectors of removed entries.
+
+        IDs and labels of the remaining entries are preserved.
+        """
+        cpu_index = self._cpu_index()
+        labels = np.array(sorted(self.label_to_id), dtype="int64")
+        compacted_index = self._new_index()
+        if len(labels) > 0:
+            vectors = np.vstack([cpu_index.reconstruct(int(label)) for label in labels])
+            if not compacted_index.is_trained:
+                compacted_index = self._train_index(compacted_index, vectors)
+            compacted_index.add_with_ids(vectors, labels)
+
+        self.index = self._to_device(compacted_index)
+        self._index_is_mapped = False
+        self._mark_dirty(len(labels))
+        logger.info(f"Compacted FAISS index to {self.index.ntotal} vectors")
+
+    def _search_labels(self, query: np.ndarray, k: int) -> list[tuple[int, float]]:
+        """Search the FAISS index and map live labels back to stable IDs."""
+        # Over-fetch by the number of stale vectors so removed entries can't crowd out results
+        fetch_k = min(k + self._num_stale(), self.index.ntotal)
+        distances, labels = self.index.search(query, fetch_k)
+
+        results = []
+        for label, dist in zip(labels[0], distances[0]):
+            id_ = self.label_to_id.get(int(label))  # FAISS returns -1 for empty results
+            if id_ is not None:
+                results.append((id_, float(dist)))
+            if len(results) == k:
+                break
+
+        return results
+
+    def _cache_key(self, kind: str, query, k: int) -> tuple | None:
+        """Key of a search in the query cache, None if the search must not be cached.
+
+        Unsaved changes aren't visible to other controllers of the same file, which may reach
+        the same version with different contents, so only persisted versions are cached.
+        """
+        if self._dirty:
+            return None
+        return (self.file_id, self.index_uid, self.index_version, kind, query, k)
+
+    def search_text_ids(self, query_text: str, k: int = 5) -> list[tuple[int, float]]:
+        """
+        Search for the IDs of the most relevant texts given a query text.
+
+        Results are served from the query cache while the index is unchanged.
 
         Args:
             query_text: The search query string
             k: Number of results to return
 
         Returns:
-            List of tuples containing (text, distance) for the top k results
+            List of tuples containing (ID, distance) for the top k texts
         """
         if not self.text_store:
             return []
 
+        cache_key = self._cache_key("text", query_text, k)
+        if cache_key is not None:
+            cached_results = rag_query_cache.get(cache_key)
+            if cached_results is not None:
+                return cached_results
+
         # Generate query embedding
-        query_embedding = self.model.encode(query_text, convert_to_tensor=True)
-        query_embedding = query_embedding.cpu().numpy().astype("float32")
+        query_embedding = self.embedding_backend.encode(query_text)
         query_embedding = np.expand_dims(query_embedding, axis=0)
 
-        # Search in FAISS index
-        distances, indices = self.index.search(query_embedding, k)
-
-        # Get results
-        results = []
-        for idx, dist in zip(indices[0], distances[0]):
-            if idx >= 0 and idx < len(self.text_store):  # FAISS returns -1 for empty results
-                results.append((self.text_store[idx], float(dist)))
+        # Search in FAISS index, over-fetching by the vectors that were added without a text
+        num_without_text = len(self.id_to_label) - len(self.text_store)
+        hits = self._search_labels(query_embedding, k + num_without_text)
+        results = [(id_, dist) for id_, dist in hits if id_ in self.text_store][:k]
 
+        if cache_key is not None:
+            rag_query_cache.put(cache_key, results)
         return results
 
+    def search_text(self, query_text: str, k: int = 5) -> list[tuple[str, float]]:
+        """
+        Search for the most relevant texts given a query text.
+
+        Args:
+            query_text: The search query string
+            k: Number of results to return
+
+        Returns:
+            List of tuples containing (text, distance) for the top k results
+        """
+        return [(self.text_store[id_], dist) for id_, dist in self.search_text_ids(query_text, k)]
+
+    async def asearch_text(self, query_text: str, k: int = 5) -> list[tuple[str, float]]:
+        """Async version of `search_text` that encodes and searches off the event loop."""
+        return await run_in_retrieval_executor(self.search_text, query_text, k=k)
+
     def search(self, query_vector: np.ndarray, k: int = 5) -> list[tuple[int, float]]:
         """
         Search for the most relevant vectors given a query vector.
 
+        Results are served from the query cache while the index is unchanged.
+
         Args:
             query_vector: numpy array of shape (dimension,) containing the query vector
             k: Number of results to return
 
         Returns:
-            List of tuples containing (index, distance) for the top k results
+            List of tuples containing (ID, distance) for the top k results
 
         Raises:
             ValueError: If query vector has wrong dimension
         """
-        if self.index.ntotal == 0:
+        if not self.id_to_label:
             return []
 
         # Ensure query vector is float32 and has correct shape
@@ -209,94 +846,247 @@ class RAGController:
         if query_vector.ndim == 1:
             query_vector = np.expand_dims(query_vector, axis=0)
 
-        # Search in FAISS index
-        distances, indices = self.index.search(query_vector, k)
+        cache_key = self._cache_key("vector", query_vector.tobytes(), k)
+        if cache_key is not None:
+            cached_results = rag_query_cache.get(cache_key)
+            if cached_results is not None:
+                return cached_results
 
-        # Get results
-        results = []
-        for idx, dist in zip(indices[0], distances[0]):
-            if idx >= 0:  # FAISS returns -1 for empty results
-                results.append((int(idx), float(dist)))
+        # Search in FAISS index
+        results = self._search_labels(query_vector, k)
 
+        if cache_key is not None:
+            rag_query_cache.put(cache_key, results)
         return results
 
     def get_vector_by_index(self, index: int) -> np.ndarray:
         """
-        Retrieve the vector by its index in the store.
+        Retrieve the vector by its stable ID in the store.
 
         Args:
-            index: Index of the vector to retrieve
+            index: Stable ID of the vector to retrieve
 
         Returns:
             The vector as a numpy array
 
         Raises:
-            IndexError: If index is out of bounds
+            IndexError: If no vector is stored under the ID
         """
-        if not 0 <= index < self.index.ntotal:
+        if index not in self.id_to_label:
             raise IndexError(
-                f"Index {index} is out of bounds for vector store of size {self.index.ntotal}"
+                f"ID {index} not found in vector store of size {len(self.id_to_label)}"
             )
 
-        return self.index.reconstruct(index)
+        return self.index.reconstruct(self.id_to_label[index])
 
     def get_text_by_index(self, index: int) -> str:
         """
-        Retrieve the text by its index in the store.
+        Retrieve the text by its stable ID in the store.
 
         Args:
-            index: Index of the text to retrieve
+            index: Stable ID of the text to retrieve
 
         Returns:
             The text string
 
         Raises:
-            IndexError: If index is out of bounds
+            IndexError: If no text is stored under the ID
         """
-        if not 0 <= index < len(self.text_store):
-            raise IndexError(
-                f"Index {index} is out of bounds for text store of size {len(self.text_store)}"
-            )
+        if index not in self.text_store:
+            raise IndexError(f"ID {index} not found in text store of size {len(self.text_store)}")
 
         return self.text_store[index]
 
+    def get_metadata_by_index(self, index: int) -> dict:
+        """
+        Retrieve the metadata of a text by its stable ID in the store.
+
+        Args:
+            index: Stable ID of the text whose metadata to retrieve
+
+        Returns:
+            The metadata dictionary, empty if the text was added without metadata
+
+        Raises:
+            IndexError: If no text is stored under the ID
+        """
+        if index not in self.text_store:
+            raise IndexError(f"ID {index} not found in text store of size {len(self.text_store)}")
+
+        return self.metadata_store.get(index, {})
+
     def save_state(self, state_path: Path) -> None:
         """
-        Save the controller's state (index_path, text_store, model_name) to a file.
+        Save the controller's state (index_path, ID mapping, model_name) to a file.
+
+        The FAISS index and the text store are saved as well if they have unsaved changes.
 
         Args:
             state_path: Path where to save the state file
         """
+        self.flush()
+        # A flush may have only appended the changes to the journal of the own state file
+        if Path(state_path) != self.state_path or self._journal_entries > 0:
+            self._save_state_file(state_path)
+
+        logger.info(f"Successfully saved RAGController state to {state_path}")
+
+    def _save_state_file(self, state_path: Path) -> None:
+        """Write the controller's state atomically via a temporary file rename."""
+        journal_id = uuid.uuid4().hex
         state = {
             "index_path": str(self.index_path) if self.index_path else None,
-            "text_store": self.text_store,
+            "id_to_label": self.id_to_label,
+            "next_id": self.next_id,
+            "next_label": self.next_label,
+            "index_uid": self.index_uid,
+            "index_version": self.index_version,
             "model_name": self.model_name,
             "file_id": self.file_id,
+            "generation": self.generation,
+            "index_factory": self.index_factory,
             "rag_state_folder_path": str(self.rag_state_folder),
+            "journal_id": journal_id,
         }
 
-        with open(state_path, "wb") as f:
+        tmp_path = Path(state_path).with_name(f"{Path(state_path).name}.tmp")
+        with open(tmp_path, "wb") as f:
             pickle.dump(state, f)
+        os.replace(tmp_path, state_path)
+        # Records of a previous journal don't match the new journal ID, so a leftover journal
+        # is ignored even if removing it fails
+        state_journal_path(state_path).unlink(missing_ok=True)
+
+        if Path(state_path) == self.state_path:
+            self._journal_id = journal_id
+            self._journal_changes = {}
+            self._journal_entries = 0
+
+    def _append_journal(self) -> None:
+        """Append the unsaved changes of the ID mapping to the journal of the state file."""
+        record = {
+            "journal_id": self._journal_id,
+            "changes": self._journal_changes,
+            "next_id": self.next_id,
+            "next_label": self.next_label,
+            "index_uid": self.index_uid,
+            "index_version": self.index_version,
+        }
+        with open(state_journal_path(self.state_path), "ab") as f:
+            pickle.dump(record, f)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_entries += len(self._journal_changes)
+        self._journal_changes = {}
 
-        # Save the FAISS index separately
-        if self.index_path:
-            self._save_index()
+    @staticmethod
+    def read_state(state_path: Path) -> dict:
+        """Read a saved state file together with the changes in its journal.
 
-        logger.info(f"Successfully saved RAGController state to {state_path}")
+        Args:
+            state_path: Path to the saved state file
+
+        Returns:
+            dict: The saved state
+        """
+        with open(state_path, "rb") as f:
+            state = pickle.load(f)
+        journal_path = state_journal_path(state_path)
+        if "journal_id" not in state or not journal_path.exists():
+            return state
+
+        id_to_label = dict(state["id_to_label"])
+        num_entries = 0
+        with open(journal_path, "rb") as f:
+            while True:
+                try:
+                    record = pickle.load(f)
+                except EOFError:
+                    break
+                except pickle.UnpicklingError:
+                    logger.warning(f"Ignoring the torn end of the journal {journal_path}")
+                    break
+                if record["journal_id"] != state["journal_id"]:
+                    continue  # Left over from before the state file was last written
+                for id_, label in record["changes"].items():
+                    if label is None:
+                        id_to_label.pop(id_, None)
+                    else:
+                        id_to_label[id_] = label
+                num_entries += len(record["changes"])
+                for key in ("next_id", "next_label", "index_uid", "index_version"):
+                    state[key] = record[key]
+        state["id_to_label"] = id_to_label
+        state["journal_entries"] = num_entries
+        return state
+
+    def _restore_stores(self, state: dict) -> bool:
+        """Restore the ID mapping from a saved state.
+
+        Returns:
+            True if the state still held pickled texts, which were moved into the text store
+        """
+        migrated = "text_store" in state
+        if migrated:
+            # State saved before texts moved to the on-disk text store
+            text_store = state["text_store"]
+            metadata_store = state.get("metadata_store", {})
+            if isinstance(text_store, list):
+                # State saved before stable IDs were introduced, IDs are the positions
+                text_store = dict(enumerate(text_store))
+                metadata_store = dict(enumerate(metadata_store))
+            self.text_store.clear()
+            self.text_store.update(text_store)
+            self.metadata_store.clear()
+            self.metadata_store.update(metadata_store)
+
+        if "id_to_label" in state:
+            id_to_label = state["id_to_label"]
+            next_label = state["next_label"]
+        else:
+            # Without a saved mapping every vector in the index keeps its label as ID
+            labels = faiss.vector_to_array(self._cpu_index().id_map).tolist()
+            id_to_label = {label: label for label in labels}
+            next_label = max(labels, default=-1) + 1
+
+        self.id_to_label = id_to_label
+        self.label_to_id = {label: id_ for id_, label in id_to_label.items()}
+        self.next_label = next_label
+        self.next_id = state.get("next_id", max(id_to_label, default=-1) + 1)
+        self.index_uid = state.get("index_uid", self.index_uid)
+        self.index_version = state.get("index_version", 0)
+        self._journal_id = state.get("journal_id")
+        self._journal_entries = state.get("journal_entries", 0)
+        self._journal_changes = {}
+        return migrated
+
+    def memory_bytes(self) -> int:
+        """Estimate the memory used by the index and the text store.
+
+        Vectors of a memory-mapped index are left out, they are file pages the OS can drop and
+        share between processes rather than memory of the controller.
+        """
+        vector_bytes = 0 if self._index_is_mapped else self.dimension * 4  # float32 vectors
+        index_bytes = self.index.ntotal * (vector_bytes + 8)  # Vectors and labels
+        text_bytes = self.text_store.memory_bytes() + self.metadata_store.memory_bytes()
+        mapping_bytes = len(self.id_to_label) * 2 * 64  # Rough size of the dict entries
+        return index_bytes + text_bytes + mapping_bytes
 
     @classmethod
-    def load_state(cls, state_path: Path) -> "RAGController":
+    def load_state(cls, state_path: Path, mmap_index: bool = False) -> "RAGController":
         """
         Load a RAGController instance from a saved state.
 
         Args:
             state_path: Path to the saved state file
+            mmap_index: Memory-map the index read-only where the index type allows
 
         Returns:
             A new RAGController instance initialized with the saved state
         """
-        with open(state_path, "rb") as f:
-            state = pickle.load(f)
+        # Taken before reading, so a save racing the load makes the controller look stale
+        signature = saved_state_signature(state_path)
+        state = cls.read_state(state_path)
 
         # Create new controller instance
         controller = cls(
@@ -305,16 +1095,18 @@ class RAGController:
             rag_state_folder_path=(
                 state["rag_state_folder_path"]
                 if "rag_state_folder_path" in state
-                else "./rag_state"
+                else RAG_STATE_FOLDER
             ),
+            mmap_index=mmap_index,
+            generation=state.get("generation", 0),
+            index_factory=state.get("index_factory", RAG_INDEX_FACTORY),
         )
 
-        # Restore text store
-        controller.text_store = state["text_store"]
-
-        # Load the index if it exists
-        if controller.index_path and controller.index_path.exists():
-            controller._load_index()
+        # Restore ID mapping, moving pickled texts of an old state into the text store
+        controller._saved_signature = signature
+        if controller._restore_stores(state):
+            controller._dirty = True
+            controller.flush()
 
         logger.info(f"Successfully loaded RAGController state from {state_path}")
         return controller
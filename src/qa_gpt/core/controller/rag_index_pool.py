@@ -0,0 +1,128 @@
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from src.qa_gpt.core.constant import RAG_INDEX_POOL_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+class RAGIndexPool:
+    """Process-wide LRU pool of loaded RAG controllers keyed by file ID.
+
+    Loaded controllers keep their FAISS index (memory-mapped where the index type allows) and
+    their text store, so repeated queries against hot papers don't touch the disk. Entries are
+    evicted in least-recently-used order once the pool exceeds its memory budget.
+    """
+
+    def __init__(self, max_bytes: int = RAG_INDEX_POOL_MAX_BYTES) -> None:
+        """Initialize the pool.
+
+        Args:
+            max_bytes: Memory budget of all pooled entries. The most recently used entry is
+                always kept, even if it alone exceeds the budget.
+        """
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[str, str], tuple[Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(file_id: str, rag_state_folder_path: str | Path) -> tuple[str, str]:
+        return str(Path(rag_state_folder_path).resolve()), str(file_id)
+
+    @property
+    def total_bytes(self) -> int:
+        """Estimated memory used by all pooled entries."""
+        with self._lock:
+            return sum(size for _, size in self._entries.values())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(
+        self,
+        file_id: str,
+        rag_state_folder_path: str | Path,
+        loader: Callable[[], Any],
+        is_current: Callable[[Any], bool] | None = None,
+    ) -> Any:
+        """Get the pooled controller of a file, loading it on a miss.
+
+        Args:
+            file_id: The ID of the file
+            rag_state_folder_path: Path to the folder containing RAG state files
+            loader: Callable loading the controller from disk on a miss. The loaded object must
+                provide `memory_bytes()`.
+            is_current: Callable checking a pooled controller against the disk, a stale one is
+                reloaded. Writers in other processes can't invalidate this pool.
+
+        Returns:
+            The pooled controller
+        """
+        key = self._key(file_id, rag_state_folder_path)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and is_current is not None and not is_current(entry[0]):
+            logger.debug(f"Reloading stale pooled RAG index of file {file_id}")
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            entry = None
+        with self._lock:
+            if entry is not None and key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        controller = loader()
+        self.put(file_id, rag_state_folder_path, controller)
+        return controller
+
+    def peek(self, file_id: str, rag_state_folder_path: str | Path) -> Any | None:
+        """Get the pooled controller of a file without loading or updating recency."""
+        with self._lock:
+            entry = self._entries.get(self._key(file_id, rag_state_folder_path))
+        return entry[0] if entry is not None else None
+
+    def put(self, file_id: str, rag_state_folder_path: str | Path, controller: Any) -> None:
+        """Add or replace the pooled controller of a file and evict entries over budget."""
+        key = self._key(file_id, rag_state_folder_path)
+        size = controller.memory_bytes()
+        with self._lock:
+            self._entries[key] = (controller, size)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def invalidate(self, file_id: str, rag_state_folder_path: str | Path) -> None:
+        """Drop the pooled controller of a file, e.g. after its index was rewritten."""
+        with self._lock:
+            if self._entries.pop(self._key(file_id, rag_state_folder_path), None) is not None:
+                logger.debug(f"Invalidated pooled RAG index of file {file_id}")
+
+    def clear(self) -> None:
+        """Drop all pooled controllers and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def _evict(self) -> None:
+        """Evict least recently used entries until the pool fits in its budget."""
+        total_bytes = sum(size for _, size in self._entries.values())
+        while total_bytes > self.max_bytes and len(self._entries) > 1:
+            (_, file_id), (_, size) = self._entries.popitem(last=False)
+            total_bytes -= size
+            self.evictions += 1
+            logger.info(f"Evicted RAG index of file {file_id} from pool ({size} bytes)")
+
+
+rag_index_pool = RAGIndexPool()
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import time
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from src.qa_gpt.core.constant import EMBEDDING_BACKEND, RAG_STATE_FOLDER
+from src.qa_gpt.core.controller.rag_controller import RAGController
+from src.qa_gpt.core.controller.rag_index_pool import rag_index_pool
+from src.qa_gpt.core.controller.rag_text_store import MetadataStore, TextStore
+from src.qa_gpt.core.utils.context_pack_utils import (
+    build_context_pack,
+    context_pack_path,
+    save_context_pack,
+)
+from src.qa_gpt.core.utils.rag_pointer_utils import (
+    current_generation,
+    generation_storage_id,
+    rag_file_lock,
+    read_rag_pointer,
+    write_rag_pointer,
+)
+
+logger = logging.getLogger(__name__)
+
+# Migrations run one file at a time in the background, apart from the retrieval pool
+_migration_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-migration")
+
+
+class RAGMigrationController:
+    """Re-embeds the RAG indexes of materials with another embedding model without downtime.
+
+    The index of a material is rebuilt as a new generation next to the live one, which keeps
+    serving queries. Once the new generation is complete and the live one didn't change in the
+    meantime, the pointer of the material is atomically flipped to it. The previous generation
+    is kept for in-flight readers and removed by the next migration.
+    """
+
+    def __init__(
+        self,
+        target_model_name: str,
+        rag_state_folder_path: str = RAG_STATE_FOLDER,
+        embedding_backend: str = EMBEDDING_BACKEND,
+        max_texts_per_second: float | None = None,
+        batch_size: int = 64,
+        summary_classes: Iterable[type[BaseModel]] = (),
+        max_attempts: int = 3,
+    ) -> None:
+        """Initialize the migration.
+
+        Args:
+            target_model_name: Name of the sentence transformer model to migrate to
+            rag_state_folder_path: Path to the folder containing RAG state files
+            embedding_backend: Backend encoding the texts with the target model
+            max_texts_per_second: Rate limit of re-embedded texts, None for no limit
+            batch_size: Number of texts re-embedded at once
+            summary_classes: Summary classes whose context pack is rebuilt for a new generation
+            max_attempts: Number of rebuilds of a file whose live index keeps changing
+        """
+        self.target_model_name = target_model_name
+        self.rag_state_folder = Path(rag_state_folder_path)
+        self.embedding_backend = embedding_backend
+        self.max_texts_per_second = max_texts_per_second
+        self.batch_size = batch_size
+        self.summary_classes = list(summary_classes)
+        self.max_attempts = max_attempts
+
+    def _state_path(self, file_id: str, generation: int) -> Path:
+        storage_id = generation_storage_id(file_id, generation)
+        return self.rag_state_folder / f"{storage_id}_rag_state.pkl"
+
+    def _read_state(self, file_id: str, generation: int) -> dict:
+        return RAGController.read_state(self._state_path(file_id, generation))
+
+    def _live_version(self, file_id: str, generation: int) -> tuple[str | None, int]:
+        """Identity and version of a saved index, they change with every saved change."""
+        state = self._read_state(file_id, generation)
+        return state.get("index_uid"), state.get("index_version", 0)
+
+    def has_index(self, file_id: str) -> bool:
+        """Check if a file has a saved index."""
+        generation = current_generation(file_id, self.rag_state_folder)
+        return self._state_path(file_id, generation).exists()
+
+    def needs_migration(self, file_id: str) -> bool:
+        """Check if the live index of a file was embedded with another model than the target."""
+        pointer = read_rag_pointer(file_id, self.rag_state_folder)
+        if pointer is not None:
+            return pointer["model_name"] != self.target_model_name
+        return self._read_state(file_id, 0)["model_name"] != self.target_model_name
+
+    def remove_generation(self, file_id: str, generation: int) -> None:
+        """Delete the files of a generation of the index of a file."""
+        storage_id = generation_storage_id(file_id, generation)
+        for suffix in ("_rag_index.pkl", "_rag_state.pkl", "_rag_state.journal"):
+            (self.rag_state_folder / f"{storage_id}{suffix}").unlink(missing_ok=True)
+        context_pack_path(storage_id, self.rag_state_folder).unlink(missing_ok=True)
+        TextStore(self.rag_state_folder / f"{storage_id}_rag_texts").remove_files()
+        MetadataStore(self.rag_state_folder / f"{storage_id}_rag_metadata").remove_files()
+
+    def _throttle(self, start_time: float, num_texts: int) -> None:
+        """Sleep until re-embedding num_texts since start_time respects the rate limit."""
+        if self.max_texts_per_second is None:
+            return
+        delay = num_texts / self.max_texts_per_second - (time.monotonic() - start_time)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _build_generation(self, file_id: str, live_controller: RAGController) -> RAGController:
+        """Re-embed the texts of the live generation into the next generation."""
+        new_generation = live_controller.generation + 1
+        self.remove_generation(file_id, new_generation)  # Leftovers of an interrupted attempt
+        new_controller = RAGController(
+            model_name=self.target_model_name,
+            rag_state_folder_path=str(self.rag_state_folder),
+            file_id=file_id,
+            embedding_backend=self.embedding_backend,
+            generation=new_generation,
+        )
+
+        ids = list(live_controller.text_store)
+        num_without_text = len(live_controller.id_to_label) - len(ids)
+        if num_without_text > 0:
+            logger.warning(
+                f"Dropping {num_without_text} vectors without text of file {file_id}, "
+                "they can't be re-embedded"
+            )
+
+        start_time = time.monotonic()
+        with new_controller.bulk():
+            for start in range(0, len(ids), self.batch_size):
+                batch_ids = ids[start : start + self.batch_size]
+                new_controller.add_texts(
+                    [live_controller.text_store[id_] for id_ in batch_ids],
+                    metadatas=[live_controller.metadata_store.get(id_, {}) for id_ in batch_ids],
+                    ids=batch_ids,
+                )
+                self._throttle(start_time, start + len(batch_ids))
+            # Never hand out IDs of removed entries again
+            new_controller.next_id = max(new_controller.next_id, live_controller.next_id)
+
+        new_controller.save_state(new_controller.state_path)
+        if self.summary_classes:
+            context_pack = build_context_pack(new_controller, self.summary_classes)
+            save_context_pack(context_pack, new_controller.context_pack_path)
+        return new_controller
+
+    def migrate_file(self, file_id: str) -> Path | None:
+        """Re-embed the index of a file with the target model and make it live.
+
+        Args:
+            file_id: ID of the material
+
+        Returns:
+            Path: The state path of the new live generation, or None if the file already uses
+                the target model
+
+        Raises:
+            RuntimeError: If the live index changed during every attempt
+        """
+        if not self.needs_migration(file_id):
+            return None
+
+        for _ in range(self.max_attempts):
+            live_generation = current_generation(file_id, self.rag_state_folder)
+            live_controller = RAGController.load_state(
+                self._state_path(file_id, live_generation), mmap_index=True
+            )
+            # The version of the snapshot being migrated, a save after the load changes it
+            live_version = (live_controller.index_uid, live_controller.index_version)
+
+            new_controller = self._build_generation(file_id, live_controller)
+
+            # Changes saved to the live index while re-embedding would be lost by the flip. The
+            # lock keeps saves of the live index out until the pointer is flipped.
+            with rag_file_lock(file_id, self.rag_state_folder):
+                changed = self._live_version(file_id, live_generation) != live_version
+                if not changed:
+                    write_rag_pointer(
+                        file_id,
+                        new_controller.generation,
+                        self.target_model_name,
+                        self.rag_state_folder,
+                    )
+            if changed:
+                logger.info(f"Index of file {file_id} changed during migration, rebuilding")
+                self.remove_generation(file_id, new_controller.generation)
+                continue
+
+            rag_index_pool.invalidate(file_id, self.rag_state_folder)
+            logger.info(
+                f"Migrated index of file {file_id} to generation {new_controller.generation} "
+                f"with model {self.target_model_name}"
+            )
+
+            # Keep the previous generation for readers that loaded it before the flip. Pooled
+            # readers reload once they see the new pointer, so older generations are unused.
+            for old_generation in range(live_generation):
+                self.remove_generation(file_id, old_generation)
+            return new_controller.state_path
+
+        raise RuntimeError(
+            f"Index of file {file_id} changed during all {self.max_attempts} migration attempts"
+        )
+
+    async def amigrate_file(self, file_id: str) -> Path | None:
+        """Async version of `migrate_file` running in the background migration thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_migration_executor, self.migrate_file, file_id)
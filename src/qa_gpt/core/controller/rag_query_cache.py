@@ -0,0 +1,70 @@
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+from src.qa_gpt.core.constant import RAG_QUERY_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+
+class RAGQueryCache:
+    """Process-wide LRU cache of RAG search results.
+
+    Keys include the identity and version of the searched index, so results of an index are
+    never served after it changed. Stale entries are not removed eagerly, they age out in
+    least-recently-used order.
+    """
+
+    def __init__(self, max_entries: int = RAG_QUERY_CACHE_MAX_ENTRIES) -> None:
+        """Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of cached search results
+        """
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, list] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key: Hashable) -> list | None:
+        """Get the cached results of a search.
+
+        Args:
+            key: The search key
+
+        Returns:
+            A copy of the cached results, or None on a miss
+        """
+        with self._lock:
+            results = self._entries.get(key)
+            if results is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(results)
+
+    def put(self, key: Hashable, results: list[Any]) -> None:
+        """Cache the results of a search and evict the least recently used ones over capacity."""
+        with self._lock:
+            self._entries[key] = list(results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all cached results and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+rag_query_cache = RAGQueryCache()
@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+from collections.abc import Iterator, MutableMapping
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class TextStore(MutableMapping):
+    """Append-only on-disk store of texts by stable ID.
+
+    Texts are appended to a data file and located through a sorted uint64 array of
+    (ID, offset, length) records, which is memory-mapped on load. Opening the store and looking
+    up a text cost the same regardless of the number of stored texts, only the looked up texts
+    are read from disk.
+
+    Changes are kept in memory until `save`, which appends the new texts to the data file and
+    then atomically replaces the records. Replaced and removed texts stay in the data file until
+    they outweigh the live ones, then the live texts are compacted into a new data file.
+    The first record is a header holding the generation of the data file, so the records switch
+    to a compacted data file atomically as well. The previous data file is removed by the next
+    compaction, so readers in other processes can finish with it.
+    """
+
+    def __init__(self, path_prefix: str | Path) -> None:
+        """Open the store, loading nothing but the memory-mapped records.
+
+        Args:
+            path_prefix: Path prefix of the store files. The records are saved to
+                "{path_prefix}.npy" and the texts to "{path_prefix}.{generation}.bin".
+        """
+        self.path_prefix = Path(path_prefix)
+        self.records_path = self.path_prefix.with_name(f"{self.path_prefix.name}.npy")
+        self._pending: dict[int, Any | None] = {}  # Unsaved changes, None marks a removal
+        self._rewrite = False
+        self._load_records()
+
+    def _data_path(self, generation: int) -> Path:
+        return self.path_prefix.with_name(f"{self.path_prefix.name}.{generation}.bin")
+
+    def _load_records(self) -> None:
+        if self.records_path.exists():
+            records = np.load(self.records_path, mmap_mode="r")
+            self._generation = int(records[0, 0])
+            self._records = records[1:]
+        else:
+            self._generation = 0
+            self._records = np.zeros((0, 3), dtype=np.uint64)
+        self._len = len(self._records)
+
+    def _encode(self, value: Any) -> bytes:
+        return value.encode("utf-8")
+
+    def _decode(self, data: bytes) -> Any:
+        return data.decode("utf-8")
+
+    def _find(self, id_: int) -> int | None:
+        """Row of an ID in the saved records, None if it isn't saved."""
+        if id_ < 0 or len(self._records) == 0:
+            return None
+        ids = self._records[:, 0]
+        row = int(np.searchsorted(ids, np.uint64(id_)))
+        if row < len(ids) and int(ids[row]) == id_:
+            return row
+        return None
+
+    def __getitem__(self, id_: int) -> Any:
+        id_ = int(id_)
+        if id_ in self._pending:
+            value = self._pending[id_]
+            if value is None:
+                raise KeyError(id_)
+            return value
+
+        row = self._find(id_)
+        if row is None:
+            raise KeyError(id_)
+        _, offset, length = (int(field) for field in self._records[row])
+        with open(self._data_path(self._generation), "rb") as f:
+            f.seek(offset)
+            return self._decode(f.read(length))
+
+    def __setitem__(self, id_: int, value: Any) -> None:
+        id_ = int(id_)
+        if id_ not in self:
+            self._len += 1
+        self._pending[id_] = value
+
+    def __delitem__(self, id_: int) -> None:
+        id_ = int(id_)
+        if id_ not in self:
+            raise KeyError(id_)
+        self._pending[id_] = None
+        self._len -= 1
+
+    def __contains__(self, id_: object) -> bool:
+        try:
+            id_ = int(id_)
+        except (TypeError, ValueError):
+            return False
+        if id_ in self._pending:
+            return self._pending[id_] is not None
+        return self._find(id_) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        saved_ids = (int(id_) for id_ in self._records[:, 0])
+        ids = [id_ for id_ in saved_ids if id_ not in self._pending]
+        ids.extend(id_ for id_, value in self._pending.items() if value is not None)
+        return iter(sorted(ids))
+
+    def __len__(self) -> int:
+        return self._len
+
+    def clear(self) -> None:
+        """Remove all entries, the data file is replaced by an empty one on the next save."""
+        self._pending = {}
+        self._records = np.zeros((0, 3), dtype=np.uint64)
+        self._len = 0
+        self._rewrite = True
+
+    @property
+    def is_dirty(self) -> bool:
+        """Whether the store has unsaved changes."""
+        return bool(self._pending) or self._rewrite
+
+    def memory_bytes(self) -> int:
+        """Estimate the memory used by the records and the unsaved entries."""
+        pending_bytes = sum(len(str(value)) for value in self._pending.values())
+        return self._records.nbytes + pending_bytes
+
+    def save(self) -> None:
+        """Persist unsaved changes, compacting the data file if it's mostly dead entries."""
+        if not self.is_dirty:
+            return
+
+        data_path = self._data_path(self._generation)
+        data_size = data_path.stat().st_size if data_path.exists() else 0
+        kept_mask = ~np.isin(
+            self._records[:, 0], np.fromiter(self._pending, dtype=np.uint64, count=-1)
+        )
+        kept_records = np.array(self._records[kept_mask], dtype=np.uint64)
+        new_entries = [
+            (id_, self._encode(value)) for id_, value in self._pending.items() if value is not None
+        ]
+        live_bytes = int(kept_records[:, 2].sum()) + sum(len(data) for _, data in new_entries)
+
+        generation = self._generation
+        if self._rewrite or data_size - int(kept_records[:, 2].sum()) > live_bytes:
+            # Copy the live texts into a new data file, the records then point to the new one
+            generation += 1
+            offset = 0
+            with open(self._data_path(generation), "wb") as out:
+                if len(kept_records) > 0:
+                    with open(data_path, "rb") as f:
+                        for record in kept_records:
+                            f.seek(int(record[1]))
+                            out.write(f.read(int(record[2])))
+                            record[1] = offset
+                            offset += int(record[2])
+                new_records = self._write_entries(out, new_entries, offset)
+        else:
+            with open(data_path, "ab") as out:
+                new_records = self._write_entries(out, new_entries, data_size)
+
+        records = np.vstack([kept_records, new_records])
+        records = records[np.argsort(records[:, 0], kind="stable")]
+        header = np.array([[generation, 0, 0]], dtype=np.uint64)
+
+        tmp_path = self.records_path.with_name(f"{self.records_path.name}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.vstack([header, records]))
+        os.replace(tmp_path, self.records_path)
+
+        if generation != self._generation:
+            # Keep the previous data file for readers that loaded the records before the switch
+            for old_generation in range(self._generation):
+                self._data_path(old_generation).unlink(missing_ok=True)
+            logger.info(f"Compacted text store {self.path_prefix} to {live_bytes} bytes")
+
+        self._pending = {}
+        self._rewrite = False
+        self._load_records()
+
+    def remove_files(self) -> None:
+        """Delete the files of the store and drop its entries."""
+        for data_path in self.path_prefix.parent.glob(f"{self.path_prefix.name}.*.bin"):
+            data_path.unlink()
+        self.records_path.unlink(missing_ok=True)
+        self._pending = {}
+        self._rewrite = False
+        self._load_records()
+
+    @staticmethod
+    def _write_entries(out, entries: list[tuple[int, bytes]], offset: int) -> np.ndarray:
+        """Write encoded entries from the given offset and return their records."""
+        records = np.zeros((len(entries), 3), dtype=np.uint64)
+        for row, (id_, data) in enumerate(entries):
+            out.write(data)
+            records[row] = (id_, offset, len(data))
+            offset += len(data)
+        return records
+
+
+class MetadataStore(TextStore):
+    """Append-only on-disk store of JSON-serializable metadata dictionaries by stable ID."""
+
+    def _encode(self, value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+    def _decode(self, data: bytes) -> Any:
+        return json.loads(data.decode("utf-8"))
@@ -21,3 +21,22 @@ class TextSections(BaseModel):
 
     def __str__(self) -> str:
         return "\n\n".join(str(section) for section in self.sections)
+
+
+class TextChunk(BaseModel):
+    """Represents a token-bounded clip of a TextSection used for retrieval"""
+
+    text: str = Field(..., description="Clip of the parent section content")
+    section_index: int = Field(..., description="Index of the parent section")
+    section_title: str = Field(..., description="Title of the parent section")
+    chunk_index: int = Field(..., description="Position of the chunk inside its parent section")
+    start_char: int = Field(..., description="Start offset of the clip in the section content")
+    end_char: int = Field(..., description="End offset of the clip in the section content")
+    token_count: int = Field(..., description="Estimated number of tokens in the clip")
+
+    def parent_pointer(self) -> dict:
+        """Return the metadata that links this chunk back to its parent section."""
+        return self.model_dump(exclude={"text"})
+
+    def __str__(self) -> str:
+        return f"Section: {self.section_title}\nContent: {self.text}"
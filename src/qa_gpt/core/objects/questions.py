@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+import functools
+
+from pydantic import BaseModel, Field, create_model
 
 
 class Choice(BaseModel):
@@ -42,6 +44,21 @@ class MultipleChoiceQuestionSet(BaseModel):
     question_5: MultipleChoiceQuestion
 
 
+@functools.lru_cache(maxsize=None)
+def multiplexed_question_set_model(field_names: tuple[str, ...]) -> type[BaseModel]:
+    """Create a response schema holding one question set per field, keyed by field name."""
+    return create_model(
+        "MultiplexedQuestionSets",
+        **{
+            field_name: (
+                MultipleChoiceQuestionSet,
+                Field(description=f"Questions on the {field_name.replace('_', ' ')} material"),
+            )
+            for field_name in field_names
+        },
+    )
+
+
 class MaterialClipsForTopic(BaseModel):
     topic: str
     clips: list[str]
@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+import functools
+
+from pydantic import BaseModel, create_model
 
 
 class Motivation(BaseModel):
@@ -711,3 +713,26 @@ Additional Guidelines:
 - Maintain proper citation standards
 - Verify the completeness of the information
 """
+
+
+@functools.lru_cache(maxsize=None)
+def combined_summary_model(summary_classes: tuple[type[BaseModel], ...]) -> type[BaseModel]:
+    """Create a response schema holding one summary per class, keyed by class name."""
+    return create_model(
+        "CombinedSummary",
+        **{summary_class.__name__: (summary_class, ...) for summary_class in summary_classes},
+    )
+
+
+def combined_summary_prompt(summary_classes: tuple[type[BaseModel], ...]) -> str:
+    """Combine the prompts of summary classes into the prompt of their combined summary."""
+    instructions = "\n\n".join(
+        f"Instructions for {summary_class.__name__}:\n{summary_class.prompt().strip()}"
+        for summary_class in summary_classes
+    )
+    names = ", ".join(summary_class.__name__ for summary_class in summary_classes)
+    return (
+        f"Create several summaries of the same input material: {names}. Each summary is a "
+        f"separate field of the response and follows its own instructions below.\n\n"
+        f"{instructions}"
+    )
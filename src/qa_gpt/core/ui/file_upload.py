@@ -4,6 +4,7 @@ from pathlib import Path
 import streamlit as st
 
 from src.qa_gpt.core.controller.fetch_controller import FetchController
+from src.qa_gpt.core.controller.llm_job_queue import JobPriority
 from src.qa_gpt.core.utils.fetch_utils import initialize_controllers_and_get_file_id
 
 
@@ -51,8 +52,13 @@ async def handle_file_upload():
 
                 await fetch_controller.fetch_material_add_parsing(file_id=file_id)
                 await fetch_controller.build_rag_index(file_id=file_id)
-                await fetch_controller.fetch_material_add_summary(file_id=file_id)
-                await fetch_controller.fetch_material_add_sets(file_id=file_id)
+                # A user is waiting, so these jobs start ahead of background runs
+                await fetch_controller.fetch_material_add_summary(
+                    file_id=file_id, priority=JobPriority.INTERACTIVE
+                )
+                await fetch_controller.fetch_material_add_sets(
+                    file_id=file_id, priority=JobPriority.INTERACTIVE
+                )
                 fetch_controller.output_question_data(file_id=file_id)
 
             st.success(f"File '{uploaded_file.name}' uploaded and processed successfully")
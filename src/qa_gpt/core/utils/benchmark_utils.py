@@ -0,0 +1,175 @@
+import faiss
+import numpy as np
+
+from src.qa_gpt.core.utils.embedding_backends import EmbeddingBackend
+
+# Sentence pieces of the synthetic corpus, combined at random into paper-like passages
+CORPUS_VOCABULARY = (
+    "we propose a novel method for retrieval augmented question generation from scientific papers "
+    "the model is trained on a large corpus and evaluated against strong baselines results show "
+    "significant improvements in accuracy latency and cost while the architecture remains simple "
+    "transformer attention encoder decoder dataset benchmark ablation loss gradient optimizer "
+    "graph convolution reinforcement policy reward contrastive embedding clustering retrieval"
+).split()
+
+
+class PrecomputedVectorBackend(EmbeddingBackend):
+    """Stand-in backend of a controller that is only fed precomputed vectors."""
+
+    def __init__(self, dimension: int, model_name: str = "precomputed") -> None:
+        self.dimension = dimension
+        self.model_name = model_name
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts: list[str], batch_size: int = 32) -> np.ndarray:
+        raise TypeError("Precomputed vectors can't encode texts")
+
+
+def synthetic_corpus(num_texts: int, seed: int = 0) -> list[str]:
+    """Generate passages of mixed lengths from the synthetic vocabulary.
+
+    Args:
+        num_texts: Number of passages
+        seed: Seed of the generator, the same seed gives the same corpus
+
+    Returns:
+        list[str]: The passages
+    """
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(20, 200, size=num_texts)
+    return [" ".join(rng.choice(CORPUS_VOCABULARY, size=length)) for length in lengths]
+
+
+def synthetic_vectors(
+    num_vectors: int, dimension: int, num_clusters: int = 32, seed: int = 0
+) -> np.ndarray:
+    """Generate clustered unit vectors, which are harder for approximate indexes than noise.
+
+    Args:
+        num_vectors: Number of vectors
+        dimension: Dimension of the vectors
+        num_clusters: Number of cluster centers the vectors are drawn around
+        seed: Seed of the generator
+
+    Returns:
+        np.ndarray: float32 array of shape (num_vectors, dimension)
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dimension))
+    vectors = centers[rng.integers(0, num_clusters, size=num_vectors)]
+    vectors = vectors + 0.5 * rng.standard_normal((num_vectors, dimension))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype("float32")
+
+
+def perturbed_queries(
+    vectors: np.ndarray, num_queries: int, noise: float = 0.1, seed: int = 0
+) -> np.ndarray:
+    """Sample corpus vectors and add noise, so queries resemble but don't equal stored vectors.
+
+    Args:
+        vectors: The corpus vectors
+        num_queries: Number of queries
+        noise: Standard deviation of the added noise
+        seed: Seed of the generator
+
+    Returns:
+        np.ndarray: float32 array of shape (num_queries, dimension)
+    """
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(0, len(vectors), size=num_queries)]
+    queries = queries + noise * rng.standard_normal(queries.shape)
+    return queries.astype("float32")
+
+
+def exact_neighbors(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Find the exact L2 nearest neighbors of queries by brute force.
+
+    Returns:
+        np.ndarray: Positions of the k nearest corpus vectors of each query
+    """
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    _, neighbors = index.search(queries, min(k, len(vectors)))
+    return neighbors
+
+
+def recall_at_k(retrieved: list[list[int]], exact: np.ndarray, k: int) -> float:
+    """Mean share of the exact k nearest neighbors found among the k retrieved results.
+
+    Args:
+        retrieved: Retrieved IDs of each query
+        exact: Exact nearest neighbor IDs of each query
+        k: Number of results compared per query
+
+    Returns:
+        float: Recall between 0 and 1, 1 if there are no queries
+    """
+    if len(retrieved) == 0:
+        return 1.0
+    recalls = []
+    for found, expected in zip(retrieved, exact):
+        expected = set(int(id_) for id_ in expected[:k])
+        recalls.append(len(expected & set(found[:k])) / len(expected) if expected else 1.0)
+    return float(np.mean(recalls))
+
+
+def latency_percentiles(latencies: list[float]) -> dict[str, float]:
+    """Summarize latencies in seconds as p50/p99/mean milliseconds."""
+    latencies_ms = np.asarray(latencies, dtype="float64") * 1000
+    if latencies_ms.size == 0:
+        return {"p50_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0}
+    return {
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "mean_ms": float(latencies_ms.mean()),
+    }
+
+
+def find_regressions(
+    results: list[dict],
+    baseline: list[dict],
+    max_recall_drop: float = 0.02,
+    max_latency_ratio: float = 1.5,
+) -> list[str]:
+    """Compare benchmark results to a baseline run of the same configurations.
+
+    Results are matched on backend, index type, corpus size and k. Configurations missing from
+    either run are not compared.
+
+    Args:
+        results: Result entries of the current run
+        baseline: Result entries of the baseline run
+        max_recall_drop: Largest accepted absolute drop of recall@k
+        max_latency_ratio: Largest accepted ratio of the current to the baseline p99 latency
+
+    Returns:
+        list[str]: Description of each regression, empty if there is none
+    """
+
+    def key(result: dict) -> tuple:
+        return (result["backend"], result["index_type"], result["corpus_size"], result["k"])
+
+    baseline_by_key = {key(result): result for result in baseline if "error" not in result}
+    regressions = []
+    for result in results:
+        previous = baseline_by_key.get(key(result))
+        if previous is None:
+            continue
+        name = "{} {} n={} k={}".format(*key(result))
+        if "error" in result:
+            regressions.append(f"{name}: failed with {result['error']}")
+            continue
+        if result["recall_at_k"] < previous["recall_at_k"] - max_recall_drop:
+            regressions.append(
+                f"{name}: recall@k dropped from {previous['recall_at_k']:.3f} "
+                f"to {result['recall_at_k']:.3f}"
+            )
+        if result["search_p99_ms"] > previous["search_p99_ms"] * max_latency_ratio:
+            regressions.append(
+                f"{name}: p99 search latency rose from {previous['search_p99_ms']:.2f} ms "
+                f"to {result['search_p99_ms']:.2f} ms"
+            )
+    return regressions
@@ -0,0 +1,181 @@
+from src.qa_gpt.core.objects.parsing import TextChunk, TextSection
+from src.qa_gpt.core.utils.token_utils import estimate_tokens, token_spans
+
+# all-MiniLM-L6-v2 truncates at 256 word pieces. Estimated tokens undercount word pieces, so keep
+# some headroom for sub-word splits and the section title prepended to every chunk.
+DEFAULT_MAX_TOKENS = 180
+DEFAULT_OVERLAP_TOKENS = 30
+MIN_CONTENT_TOKENS = 16
+SENTENCE_END_TOKENS = {".", "!", "?", ";"}
+# Sentences are embedded one by one for small-to-big retrieval. Longer sentences are split and
+# shorter fragments, e.g. after an abbreviation, are merged into a neighboring sentence.
+DEFAULT_SENTENCE_MAX_TOKENS = 64
+MIN_SENTENCE_TOKENS = 4
+
+
+def _find_chunk_end(content: str, spans: list[tuple[int, int]], start: int, end: int) -> int:
+    """Move a chunk end back to the last sentence boundary in the second half of the window."""
+    if end >= len(spans):
+        return end
+    for idx in range(end - 1, start + (end - start) // 2, -1):
+        token_start, token_end = spans[idx]
+        if content[token_start:token_end] in SENTENCE_END_TOKENS:
+            return idx + 1
+    return end
+
+
+def chunk_section(
+    section: TextSection,
+    section_index: int,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+) -> list[TextChunk]:
+    """Split a section into overlapping, token-bounded chunks.
+
+    Args:
+        section: The section to split
+        section_index: Index of the section in its parent TextSections
+        max_tokens: Maximum estimated tokens per chunk, including the section title
+        overlap_tokens: Number of tokens shared by consecutive chunks
+
+    Returns:
+        list[TextChunk]: Chunks pointing back to the parent section
+    """
+    content = section.content
+    spans = token_spans(content)
+    if not spans:
+        # Nothing to split, fall back to the section summary so the section is still searchable
+        text = section.summary or section.title
+        return [
+            TextChunk(
+                text=text,
+                section_index=section_index,
+                section_title=section.title,
+                chunk_index=0,
+                start_char=0,
+                end_char=0,
+                token_count=estimate_tokens(text),
+            )
+        ]
+
+    header_tokens = estimate_tokens(f"Section: {section.title}\nContent:")
+    budget = max(max_tokens - header_tokens, MIN_CONTENT_TOKENS)
+    overlap = min(overlap_tokens, budget // 2)
+
+    chunks = []
+    start = 0
+    while start < len(spans):
+        end = _find_chunk_end(content, spans, start, min(start + budget, len(spans)))
+        start_char, end_char = spans[start][0], spans[end - 1][1]
+        chunks.append(
+            TextChunk(
+                text=content[start_char:end_char],
+                section_index=section_index,
+                section_title=section.title,
+                chunk_index=len(chunks),
+                start_char=start_char,
+                end_char=end_char,
+                token_count=end - start,
+            )
+        )
+        if end >= len(spans):
+            break
+        start = max(end - overlap, start + 1)
+
+    return chunks
+
+
+def chunk_sections(
+    sections: list[TextSection],
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+) -> list[TextChunk]:
+    """Split parsed sections into overlapping, token-bounded chunks.
+
+    Args:
+        sections: Sections produced by the ParsingController
+        max_tokens: Maximum estimated tokens per chunk, including the section title
+        overlap_tokens: Number of tokens shared by consecutive chunks of the same section
+
+    Returns:
+        list[TextChunk]: Chunks of all sections in reading order
+    """
+    chunks = []
+    for section_index, section in enumerate(sections):
+        chunks.extend(chunk_section(section, section_index, max_tokens, overlap_tokens))
+    return chunks
+
+
+def split_sentences(
+    section: TextSection,
+    section_index: int,
+    max_tokens: int = DEFAULT_SENTENCE_MAX_TOKENS,
+) -> list[TextChunk]:
+    """Split the content of a section into sentences.
+
+    Args:
+        section: The section to split
+        section_index: Index of the section in its parent TextSections
+        max_tokens: Maximum estimated tokens per sentence, longer sentences are split
+
+    Returns:
+        list[TextChunk]: Sentences pointing back to the parent section, the chunk index is the
+            position of the sentence in the section
+    """
+    content = section.content
+    spans = token_spans(content)
+
+    sentences = []
+    start = 0
+    for idx, (token_start, token_end) in enumerate(spans):
+        # A sentence end is followed by whitespace, unlike the dot in "3.5"
+        is_sentence_end = content[token_start:token_end] in SENTENCE_END_TOKENS and (
+            token_end == len(content) or content[token_end].isspace()
+        )
+        num_tokens = idx + 1 - start
+        if (
+            (is_sentence_end and num_tokens >= MIN_SENTENCE_TOKENS)
+            or num_tokens >= max_tokens
+            or idx == len(spans) - 1
+        ):
+            start_char, end_char = spans[start][0], token_end
+            sentences.append(
+                TextChunk(
+                    text=content[start_char:end_char],
+                    section_index=section_index,
+                    section_title=section.title,
+                    chunk_index=len(sentences),
+                    start_char=start_char,
+                    end_char=end_char,
+                    token_count=num_tokens,
+                )
+            )
+            start = idx + 1
+
+    # Merge a short trailing fragment into the previous sentence
+    if len(sentences) > 1 and sentences[-1].token_count < MIN_SENTENCE_TOKENS:
+        last = sentences.pop()
+        previous = sentences[-1]
+        previous.text = content[previous.start_char : last.end_char]
+        previous.end_char = last.end_char
+        previous.token_count += last.token_count
+
+    return sentences
+
+
+def sentence_chunks(
+    sections: list[TextSection], max_tokens: int = DEFAULT_SENTENCE_MAX_TOKENS
+) -> list[TextChunk]:
+    """Split parsed sections into sentences.
+
+    Args:
+        sections: Sections produced by the ParsingController
+        max_tokens: Maximum estimated tokens per sentence, longer sentences are split
+
+    Returns:
+        list[TextChunk]: Sentences of all sections in reading order
+    """
+    sentences = []
+    for section_index, section in enumerate(sections):
+        sentences.extend(split_sentences(section, section_index, max_tokens))
+    return sentences
@@ -0,0 +1,94 @@
+from src.qa_gpt.core.utils.token_utils import estimate_tokens
+
+# Number of sentence hits and token budget of the assembled context of a summary and of a
+# question set
+SUMMARY_SENTENCE_K = 10
+SUMMARY_CONTEXT_TOKENS = 1200
+FIELD_SENTENCE_K = 4
+FIELD_CONTEXT_TOKENS = 400
+SENTENCE_GAP = " ... "
+
+
+def sentence_index_file_id(file_id: str) -> str:
+    """Get the file ID of the sentence-level RAG index of a material.
+
+    Args:
+        file_id: ID of the material
+
+    Returns:
+        str: File ID under which the sentence index is stored
+    """
+    return f"{file_id}_sentences"
+
+
+def assemble_context(sentence_controller, hits: list[tuple[int, float]], token_budget: int) -> str:
+    """Expand sentence hits to their surrounding sentences within a token budget.
+
+    Hits are taken by rank as long as they fit the budget. The remaining budget then grows the
+    windows around the hits one sentence at a time, alternating after and before each hit and
+    cycling through the hits by rank. Windows never cross the parent section of their hit.
+    Sentence IDs follow the reading order, so the neighbors of a sentence are the adjacent IDs.
+
+    Args:
+        sentence_controller: RAG controller holding the sentence index, with the parent pointer
+            of each sentence as its metadata
+        hits: (ID, distance) of the retrieved sentences, best first
+        token_budget: Maximum estimated tokens of the sentence texts in the context
+
+    Returns:
+        str: The context grouped by section in reading order, gaps between windows are marked
+    """
+    sentences = {}  # ID -> (section index, section title, text)
+    used_tokens = 0
+
+    def include(id_: int, section_index: int | None = None) -> bool:
+        """Include a sentence if it exists, belongs to the section and fits the budget."""
+        nonlocal used_tokens
+        if id_ in sentences or id_ not in sentence_controller.text_store:
+            return False
+        metadata = sentence_controller.get_metadata_by_index(id_)
+        if section_index is not None and metadata.get("section_index") != section_index:
+            return False
+        text = sentence_controller.get_text_by_index(id_)
+        num_tokens = estimate_tokens(text)
+        if used_tokens + num_tokens > token_budget:
+            return False
+        sentences[id_] = (metadata.get("section_index"), metadata.get("section_title", ""), text)
+        used_tokens += num_tokens
+        return True
+
+    # Each window holds its section, the next sentence ID to try on each side of the hit and
+    # the side to try first
+    windows = []
+    for id_, _ in hits:
+        if include(id_):
+            windows.append(
+                {"section_index": sentences[id_][0], "after": id_ + 1, "before": id_ - 1}
+            )
+
+    growing = list(windows)
+    while growing:
+        for window in list(growing):
+            sides = ("before", "after") if window.get("grew") == "after" else ("after", "before")
+            for side in sides:
+                if include(window[side], window["section_index"]):
+                    window[side] += 1 if side == "after" else -1
+                    window["grew"] = side
+                    break
+            else:
+                growing.remove(window)
+
+    # Render the windows by section in reading order
+    parts = []
+    previous_id = previous_section = None
+    for id_ in sorted(sentences):
+        section_index, section_title, text = sentences[id_]
+        if section_index != previous_section:
+            parts.append(f"\n\nSection: {section_title}\nContent: {text}")
+        elif id_ != previous_id + 1:
+            parts.append(f"{SENTENCE_GAP}{text}")
+        else:
+            parts.append(f" {text}")
+        previous_id, previous_section = id_, section_index
+
+    return "".join(parts).strip()
@@ -0,0 +1,139 @@
+import functools
+import json
+import os
+from collections.abc import Iterable
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from src.qa_gpt.core.constant import RAG_STATE_FOLDER
+from src.qa_gpt.core.utils.rag_pointer_utils import resolve_storage_id
+
+# Number of retrieved chunks used as context of a summary and of a question set
+SUMMARY_CONTEXT_K = 5
+FIELD_CONTEXT_K = 2
+
+
+def summary_context_query(summary_class: type[BaseModel]) -> str:
+    """Get the retrieval query of a summary type.
+
+    Args:
+        summary_class: The summary class
+
+    Returns:
+        str: The joined RAG key words of the summary class
+    """
+    return ", ".join(summary_class.get_rag_key_words())
+
+
+def summary_field_names(summary_class: type[BaseModel]) -> list[str]:
+    """Get the fields of a summary type that question sets are generated for.
+
+    Args:
+        summary_class: The summary class
+
+    Returns:
+        list[str]: Field names of the summary class without its excluded fields
+    """
+    excluded_fields = set(summary_class.excluded_fields())
+    return [name for name in summary_class.model_fields if name not in excluded_fields]
+
+
+def context_pack_path(
+    storage_id: str, rag_state_folder_path: str | Path = RAG_STATE_FOLDER
+) -> Path:
+    """Get the path of the context pack of a RAG index generation of a material.
+
+    Args:
+        storage_id: Storage ID of the index generation, see `generation_storage_id`
+        rag_state_folder_path: Path to the folder containing RAG state files
+
+    Returns:
+        Path: The path of the context pack
+    """
+    return Path(rag_state_folder_path) / f"{storage_id}_context_pack.json"
+
+
+def build_context_pack(rag_controller, summary_classes: Iterable[type[BaseModel]]) -> dict:
+    """Retrieve the context of every summary type and summary field query of a material.
+
+    Args:
+        rag_controller: The RAG controller holding the index of the material
+        summary_classes: Summary classes whose queries are precomputed
+
+    Returns:
+        dict: The context pack, holding the top-k results of every query
+    """
+    queries = {}
+    for summary_class in summary_classes:
+        queries[(summary_context_query(summary_class), SUMMARY_CONTEXT_K)] = None
+        for field_name in summary_field_names(summary_class):
+            queries[(field_name, FIELD_CONTEXT_K)] = None
+
+    contexts = [
+        {
+            "query": query,
+            "k": k,
+            "results": [[text, dist] for text, dist in rag_controller.search_text(query, k=k)],
+        }
+        for query, k in queries
+    ]
+    return {
+        "file_id": rag_controller.file_id,
+        "index_uid": rag_controller.index_uid,
+        "index_version": rag_controller.index_version,
+        "contexts": contexts,
+    }
+
+
+def save_context_pack(context_pack: dict, path: Path) -> None:
+    """Write a context pack atomically via a temporary file rename.
+
+    Args:
+        context_pack: The context pack to save
+        path: Path where to save the context pack
+    """
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(context_pack, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+@functools.lru_cache(maxsize=32)
+def _read_context_pack(path: str, mtime_ns: int) -> dict[tuple[str, int], list]:
+    """Read a context pack into a lookup by (query, k), cached until the file changes."""
+    with open(path, encoding="utf-8") as f:
+        context_pack = json.load(f)
+    return {
+        (context["query"], context["k"]): [(text, dist) for text, dist in context["results"]]
+        for context in context_pack["contexts"]
+    }
+
+
+def get_packed_context(
+    file_id: str,
+    query: str,
+    k: int,
+    rag_state_folder_path: str | Path = RAG_STATE_FOLDER,
+) -> list[tuple[str, float]] | None:
+    """Get the precomputed context of a query from the context pack of the live index.
+
+    Args:
+        file_id: ID of the material
+        query: The retrieval query
+        k: Number of results
+        rag_state_folder_path: Path to the folder containing RAG state files
+
+    Returns:
+        List of (text, distance) tuples, or None if the material has no context pack or the
+        query isn't in it
+    """
+    storage_id = resolve_storage_id(file_id, rag_state_folder_path)
+    path = context_pack_path(storage_id, rag_state_folder_path)
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    results = _read_context_pack(str(path.resolve()), mtime_ns).get((query, k))
+    return list(results) if results is not None else None
@@ -0,0 +1,132 @@
+import hashlib
+from collections import defaultdict
+
+import numpy as np
+
+from src.qa_gpt.core.utils.token_utils import TOKEN_PATTERN
+
+DEFAULT_DEDUP_THRESHOLD = 0.8
+DEFAULT_SHINGLE_SIZE = 5
+DEFAULT_NUM_PERM = 64
+# 16 bands of 4 rows make pairs above a Jaccard similarity of about 0.5 likely candidates, the
+# candidates are then checked against the actual threshold.
+DEFAULT_NUM_BANDS = 16
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+def shingles(text: str, shingle_size: int = DEFAULT_SHINGLE_SIZE) -> set[str]:
+    """Get the set of word n-grams of a text, case and punctuation insensitive.
+
+    Args:
+        text: The text to shingle
+        shingle_size: Number of words per shingle. Shorter texts are a single shingle.
+
+    Returns:
+        set[str]: The shingles of the text
+    """
+    words = [word.lower() for word in TOKEN_PATTERN.findall(text) if word[0].isalnum()]
+    if len(words) <= shingle_size:
+        return {" ".join(words)}
+    return {" ".join(words[i : i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+
+
+def jaccard_similarity(first: set[str], second: set[str]) -> float:
+    """Jaccard similarity of two shingle sets."""
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+def minhash_signatures(
+    shingle_sets: list[set[str]], num_perm: int = DEFAULT_NUM_PERM, seed: int = 0
+) -> np.ndarray:
+    """Compute MinHash signatures of shingle sets.
+
+    Args:
+        shingle_sets: The shingle sets
+        num_perm: Number of hash permutations, i.e. the signature length
+        seed: Seed of the permutations, signatures are only comparable with the same seed
+
+    Returns:
+        np.ndarray: Array of shape (len(shingle_sets), num_perm)
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+    b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+
+    signatures = np.full((len(shingle_sets), num_perm), _MERSENNE_PRIME, dtype=np.int64)
+    for row, shingle_set in enumerate(shingle_sets):
+        if not shingle_set:
+            continue
+        hashes = np.array(
+            [
+                int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=4).digest(), "little")
+                for shingle in shingle_set
+            ],
+            dtype=np.int64,
+        )
+        # Universal hashing (a * x + b) mod p stays below 2^62, so it can't overflow int64
+        permuted = (np.outer(hashes % _MERSENNE_PRIME, a) + b) % _MERSENNE_PRIME
+        signatures[row] = permuted.min(axis=0)
+    return signatures
+
+
+def find_near_duplicates(
+    texts: list[str],
+    threshold: float = DEFAULT_DEDUP_THRESHOLD,
+    shingle_size: int = DEFAULT_SHINGLE_SIZE,
+    num_perm: int = DEFAULT_NUM_PERM,
+    num_bands: int = DEFAULT_NUM_BANDS,
+) -> list[int]:
+    """Group near-duplicate texts with MinHash locality-sensitive hashing.
+
+    Texts whose signatures collide in any band are candidates, candidates are near duplicates if
+    the Jaccard similarity of their shingles reaches the threshold. Near duplicates are grouped
+    transitively and each group is represented by its first text.
+
+    Args:
+        texts: The texts to group
+        threshold: Minimum Jaccard similarity of near duplicates
+        shingle_size: Number of words per shingle
+        num_perm: Number of hash permutations, must be divisible by num_bands
+        num_bands: Number of LSH bands
+
+    Returns:
+        list[int]: For each text the position of the text representing its group, which is
+            the position of the text itself if it's kept
+    """
+    if num_perm % num_bands != 0:
+        raise ValueError(f"num_perm {num_perm} must be divisible by num_bands {num_bands}")
+
+    shingle_sets = [shingles(text, shingle_size) for text in texts]
+    signatures = minhash_signatures(shingle_sets, num_perm)
+    rows = num_perm // num_bands
+
+    # Union-find whose roots are the first text of each group
+    parents = list(range(len(texts)))
+
+    def find(position: int) -> int:
+        while parents[position] != position:
+            parents[position] = parents[parents[position]]
+            position = parents[position]
+        return position
+
+    checked = set()
+    for band in range(num_bands):
+        buckets = defaultdict(list)
+        for position, signature in enumerate(signatures):
+            buckets[signature[band * rows : (band + 1) * rows].tobytes()].append(position)
+
+        for positions in buckets.values():
+            for other in positions[1:]:
+                first = positions[0]
+                if (first, other) in checked:
+                    continue
+                checked.add((first, other))
+                root, other_root = find(first), find(other)
+                if root == other_root:
+                    continue
+                if jaccard_similarity(shingle_sets[first], shingle_sets[other]) >= threshold:
+                    parents[max(root, other_root)] = min(root, other_root)
+
+    return [find(position) for position in range(len(texts))]
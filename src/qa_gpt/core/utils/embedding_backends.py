@@ -0,0 +1,286 @@
+import functools
+import json
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import numpy as np
+
+from src.qa_gpt.core.constant import EMBEDDING_BACKEND, ONNX_MODEL_FOLDER
+from src.qa_gpt.core.utils.token_utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBackend(ABC):
+    """Encodes texts into float32 sentence embeddings."""
+
+    model_name: str
+
+    @abstractmethod
+    def get_sentence_embedding_dimension(self) -> int:
+        pass
+
+    @abstractmethod
+    def encode(self, texts: str | list[str], batch_size: int = 32) -> np.ndarray:
+        """Encode texts into embeddings.
+
+        Args:
+            texts: A text or a list of texts to encode
+            batch_size: Number of texts encoded per forward pass
+
+        Returns:
+            np.ndarray: float32 array of shape (dimension,) for a single text, otherwise
+                (len(texts), dimension)
+        """
+        pass
+
+    def count_tokens(self, texts: list[str]) -> list[int]:
+        """Count the tokens of each text as seen by the model, without padding.
+
+        Backends without access to their tokenizer fall back to an estimate.
+
+        Args:
+            texts: The texts to count the tokens of
+
+        Returns:
+            list[int]: Number of tokens of each text
+        """
+        return [estimate_tokens(text) for text in texts]
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """Encodes texts with a sentence transformer running in PyTorch."""
+
+    def __init__(self, model_name: str) -> None:
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: str | list[str], batch_size: int = 32) -> np.ndarray:
+        embeddings = self.model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+        return np.asarray(embeddings, dtype="float32")
+
+    def count_tokens(self, texts: list[str]) -> list[int]:
+        encodings = self.model.tokenizer(
+            list(texts), truncation=True, max_length=self.model.max_seq_length
+        )
+        return [len(input_ids) for input_ids in encodings["input_ids"]]
+
+
+def _get_pooling_mode(pooling_module) -> str:
+    """Read the pooling mode of a sentence transformer Pooling module."""
+    config = pooling_module.get_config_dict()
+    if "pooling_mode" in config:
+        return config["pooling_mode"]
+    for mode in ("mean", "cls", "max"):
+        if config.get(f"pooling_mode_{mode}_token") or config.get(f"pooling_mode_{mode}_tokens"):
+            return mode
+    raise ValueError(f"Unsupported pooling config for ONNX export: {config}")
+
+
+def pool_token_embeddings(
+    token_embeddings: np.ndarray, attention_mask: np.ndarray, pooling_mode: str
+) -> np.ndarray:
+    """Pool token embeddings into sentence embeddings like sentence-transformers does.
+
+    Args:
+        token_embeddings: Array of shape (batch, tokens, dimension)
+        attention_mask: Array of shape (batch, tokens), 0 for padding
+        pooling_mode: One of "mean", "cls" or "max"
+
+    Returns:
+        np.ndarray: Array of shape (batch, dimension)
+    """
+    mask = attention_mask[:, :, None].astype(token_embeddings.dtype)
+    if pooling_mode == "mean":
+        return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    if pooling_mode == "cls":
+        return token_embeddings[:, 0]
+    if pooling_mode == "max":
+        return np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+    raise ValueError(f"Unsupported pooling mode: {pooling_mode}")
+
+
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    """Encodes texts with an ONNX Runtime export of a sentence transformer on CPU.
+
+    The transformer is exported once into `cache_folder`, together with its tokenizer and pooling
+    config, so later processes load it without PyTorch. With `quantize=True` the weights are
+    dynamically quantized to int8, which trades a little accuracy for faster CPU inference.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        quantize: bool = False,
+        cache_folder: str = ONNX_MODEL_FOLDER,
+        num_threads: int | None = None,
+    ) -> None:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_name = model_name
+        self.quantize = quantize
+        self.model_folder = Path(cache_folder) / model_name.replace("/", "__")
+        self._export_if_missing()
+
+        with open(self.model_folder / "embedding_config.json", encoding="utf-8") as f:
+            self.config = json.load(f)
+
+        self.tokenizer = Tokenizer.from_file(str(self.model_folder / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(
+            pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"]
+        )
+
+        options = ort.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        model_file = "model_int8.onnx" if quantize else "model.onnx"
+        self.session = ort.InferenceSession(
+            str(self.model_folder / model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _export_if_missing(self) -> None:
+        """Export the transformer to ONNX, and quantize it if requested, unless cached."""
+        fp32_path = self.model_folder / "model.onnx"
+        int8_path = self.model_folder / "model_int8.onnx"
+
+        if not fp32_path.exists():
+            self._export(fp32_path)
+
+        if self.quantize and not int8_path.exists():
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+            logger.info(f"Quantized ONNX embedding model to {int8_path}")
+
+    def _export(self, fp32_path: Path) -> None:
+        """Export the transformer of a sentence transformer with dynamic batch and length."""
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(self.model_name, device="cpu")
+        transformer = model[0].auto_model.eval()
+        tokenizer = model.tokenizer
+        modules = list(model)
+        pooling_mode = _get_pooling_mode(modules[1])
+        normalize = any(type(module).__name__ == "Normalize" for module in modules[2:])
+
+        input_names = [
+            name
+            for name in ("input_ids", "attention_mask", "token_type_ids")
+            if name in tokenizer.model_input_names
+        ]
+        dummy = tokenizer(["An example sentence"], return_tensors="pt")
+
+        class _TokenEmbeddings(torch.nn.Module):
+            """Call the transformer with keyword inputs and return its token embeddings."""
+
+            def __init__(self, transformer):
+                super().__init__()
+                self.transformer = transformer
+
+            def forward(self, *inputs):
+                outputs = self.transformer(**dict(zip(input_names, inputs)))
+                return outputs.last_hidden_state
+
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+        self.model_folder.mkdir(parents=True, exist_ok=True)
+        with torch.no_grad():
+            torch.onnx.export(
+                _TokenEmbeddings(transformer),
+                tuple(dummy[name] for name in input_names),
+                str(fp32_path),
+                input_names=input_names,
+                output_names=["token_embeddings"],
+                dynamic_axes=dynamic_axes,
+                opset_version=17,
+                dynamo=False,
+            )
+
+        tokenizer.save_pretrained(str(self.model_folder))
+        config = {
+            "model_name": self.model_name,
+            "dimension": model.get_sentence_embedding_dimension(),
+            "max_seq_length": model.max_seq_length,
+            "pooling_mode": pooling_mode,
+            "normalize": normalize,
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id,
+        }
+        with open(self.model_folder / "embedding_config.json", "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=4)
+        logger.info(f"Exported ONNX embedding model to {fp32_path}")
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dimension"]
+
+    def encode(self, texts: str | list[str], batch_size: int = 32) -> np.ndarray:
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start : start + batch_size])
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype="int64"),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype="int64"),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype="int64"),
+            }
+            inputs = {name: value for name, value in inputs.items() if name in self.input_names}
+            token_embeddings = self.session.run(["token_embeddings"], inputs)[0]
+            batches.append(
+                pool_token_embeddings(
+                    token_embeddings, inputs["attention_mask"], self.config["pooling_mode"]
+                )
+            )
+
+        dimension = self.get_sentence_embedding_dimension()
+        embeddings = np.vstack(batches) if batches else np.zeros((0, dimension))
+        if self.config["normalize"]:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.clip(norms, 1e-12, None)
+
+        embeddings = embeddings.astype("float32")
+        return embeddings[0] if single else embeddings
+
+    def count_tokens(self, texts: list[str]) -> list[int]:
+        # Padding is enabled on the tokenizer, the attention mask marks the real tokens
+        return [sum(e.attention_mask) for e in self.tokenizer.encode_batch(list(texts))]
+
+
+EMBEDDING_BACKENDS = {
+    "torch": SentenceTransformerBackend,
+    "onnx": functools.partial(OnnxEmbeddingBackend, quantize=False),
+    "onnx-int8": functools.partial(OnnxEmbeddingBackend, quantize=True),
+}
+
+
+@functools.cache
+def get_embedding_backend(model_name: str, backend: str = EMBEDDING_BACKEND) -> EmbeddingBackend:
+    """Get an embedding backend, loaded once per process and shared between controllers.
+
+    Args:
+        model_name: Name of the sentence transformer model
+        backend: One of the keys of EMBEDDING_BACKENDS
+
+    Returns:
+        EmbeddingBackend: The shared backend instance
+
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(
+            f"Unknown embedding backend {backend}, expected one of {list(EMBEDDING_BACKENDS)}"
+        )
+    return EMBEDDING_BACKENDS[backend](model_name)
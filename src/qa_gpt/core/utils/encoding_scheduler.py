@@ -0,0 +1,131 @@
+import logging
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.qa_gpt.core.utils.embedding_backends import EmbeddingBackend
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = 8192  # Padded tokens per forward pass, e.g. 32 texts of 256 tokens
+DEFAULT_MAX_BATCH_SIZE = 128
+ARRIVAL_BATCH_SIZE = 32  # Batch size of a plain encode call, the baseline of the stats
+
+
+@dataclass
+class EncodingStats:
+    """Padding and throughput of a scheduled encode call."""
+
+    num_texts: int
+    num_batches: int
+    real_tokens: int
+    padded_tokens: int
+    arrival_padded_tokens: int
+    elapsed_seconds: float
+
+    @property
+    def padding_efficiency(self) -> float:
+        """Share of the encoded tokens that are real tokens rather than padding."""
+        return self.real_tokens / self.padded_tokens if self.padded_tokens else 1.0
+
+    @property
+    def arrival_padding_efficiency(self) -> float:
+        """Padding efficiency of encoding the texts in arrival order with a fixed batch size."""
+        return self.real_tokens / self.arrival_padded_tokens if self.arrival_padded_tokens else 1.0
+
+    @property
+    def texts_per_second(self) -> float:
+        return self.num_texts / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.real_tokens / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+
+def plan_batches(
+    token_counts: list[int],
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+) -> list[list[int]]:
+    """Group texts of similar length into batches that fit a padded token budget.
+
+    Texts are sorted by length, longest first, so each batch is padded to about the length of
+    its texts and the memory peak is reached by the first batch.
+
+    Args:
+        token_counts: Number of tokens of each text
+        token_budget: Maximum padded tokens per batch, i.e. batch size times longest text. A
+            text longer than the budget gets a batch of its own.
+        max_batch_size: Maximum number of texts per batch
+
+    Returns:
+        list[list[int]]: Positions of the texts in each batch
+    """
+    order = sorted(range(len(token_counts)), key=lambda i: token_counts[i], reverse=True)
+
+    batches = []
+    batch = []
+    for position in order:
+        # The first text of a batch is its longest, so it sets the padded length
+        padded_length = max(token_counts[batch[0]] if batch else token_counts[position], 1)
+        if batch and (
+            len(batch) >= max_batch_size or padded_length * (len(batch) + 1) > token_budget
+        ):
+            batches.append(batch)
+            batch = []
+        batch.append(position)
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def _padded_tokens(token_counts: list[int], batches: list[list[int]]) -> int:
+    return sum(max(token_counts[i] for i in batch) * len(batch) for batch in batches)
+
+
+def encode_scheduled(
+    backend: EmbeddingBackend,
+    texts: list[str],
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+) -> tuple[np.ndarray, EncodingStats]:
+    """Encode texts in length-bucketed batches and return the embeddings in input order.
+
+    Args:
+        backend: The embedding backend
+        texts: The texts to encode
+        token_budget: Maximum padded tokens per batch
+        max_batch_size: Maximum number of texts per batch
+
+    Returns:
+        Tuple of (embeddings of shape (len(texts), dimension), encoding stats)
+    """
+    start_time = time.perf_counter()
+    token_counts = backend.count_tokens(texts)
+    batches = plan_batches(token_counts, token_budget, max_batch_size)
+
+    embeddings = np.zeros((len(texts), backend.get_sentence_embedding_dimension()), "float32")
+    for batch in batches:
+        embeddings[batch] = backend.encode([texts[i] for i in batch], batch_size=len(batch))
+
+    arrival_batches = [
+        list(range(start, min(start + ARRIVAL_BATCH_SIZE, len(texts))))
+        for start in range(0, len(texts), ARRIVAL_BATCH_SIZE)
+    ]
+    stats = EncodingStats(
+        num_texts=len(texts),
+        num_batches=len(batches),
+        real_tokens=sum(token_counts),
+        padded_tokens=_padded_tokens(token_counts, batches),
+        arrival_padded_tokens=_padded_tokens(token_counts, arrival_batches),
+        elapsed_seconds=time.perf_counter() - start_time,
+    )
+    logger.info(
+        f"Encoded {stats.num_texts} texts in {stats.num_batches} batches, "
+        f"padding efficiency {stats.padding_efficiency:.1%} "
+        f"(arrival order {stats.arrival_padding_efficiency:.1%}), "
+        f"{stats.texts_per_second:.1f} texts/sec, {stats.tokens_per_second:.0f} tokens/sec"
+    )
+    return embeddings, stats
@@ -106,3 +106,13 @@ def _should_skip_field_processing(
         return True, f"Skipping {prefix} as {existing_count} question set(s) already exist(s)."
 
     return False, None
+
+
+def _summary_task_key(summary_type: str) -> str:
+    """Key of the generation task of a summary in the failure table."""
+    return f"summary:{summary_type}"
+
+
+def _question_task_key(prefix: str) -> str:
+    """Key of the generation task of a question set in the failure table."""
+    return f"questions:{prefix}"
@@ -0,0 +1,81 @@
+import logging
+from dataclasses import dataclass
+
+from src.qa_gpt.core.utils.token_utils import estimate_tokens, token_spans
+
+logger = logging.getLogger(__name__)
+
+# Estimated tokens of the material parts of a prompt, on top of the system prompt
+SUMMARY_PROMPT_TOKENS = 4000
+FIELD_PROMPT_TOKENS = 2000
+# Estimated tokens of the paper shared by the question requests of a material. The budget is
+# fixed, so the paper is cut identically in every request and forms a cacheable prompt prefix.
+PAPER_CONTEXT_TOKENS = 2000
+
+
+@dataclass
+class PromptPart:
+    """A part of a prompt competing for the token budget."""
+
+    name: str
+    text: str
+    truncatable: bool = True  # Otherwise the part is dropped if it doesn't fit whole
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut a text after its first max_tokens estimated tokens.
+
+    Args:
+        text: The text to cut
+        max_tokens: Number of tokens to keep
+
+    Returns:
+        str: The text itself if it fits, otherwise its beginning
+    """
+    if max_tokens <= 0:
+        return ""
+    spans = token_spans(text)
+    if len(spans) <= max_tokens:
+        return text
+    return text[: spans[max_tokens - 1][1]]
+
+
+def fit_prompt_parts(
+    parts: list[PromptPart], token_budget: int, request_name: str = "prompt"
+) -> dict[str, str]:
+    """Fit prompt parts into a token budget in priority order.
+
+    Parts are included whole while they fit. A part that doesn't fit is cut to the remaining
+    budget if it's truncatable, which leaves nothing for the parts after it, and dropped
+    otherwise.
+
+    Args:
+        parts: The parts, highest priority first
+        token_budget: Estimated tokens available to all parts
+        request_name: Name of the request in the logged token usage
+
+    Returns:
+        dict[str, str]: The fitted text of each part by name, empty if it was dropped
+    """
+    fitted = {}
+    total_tokens = 0
+    used = 0
+    usage = []
+    for part in parts:
+        tokens = estimate_tokens(part.text)
+        if tokens <= token_budget - used:
+            text = part.text
+        elif part.truncatable:
+            text = truncate_to_tokens(part.text, token_budget - used)
+        else:
+            text = ""
+        fitted_tokens = tokens if text is part.text else estimate_tokens(text)
+        total_tokens += tokens
+        used += fitted_tokens
+        fitted[part.name] = text
+        usage.append(f"{part.name} {tokens}->{fitted_tokens}")
+    logger.info(
+        f"Context of {request_name}: {total_tokens} -> {used} estimated tokens within a "
+        f"budget of {token_budget} ({', '.join(usage)})"
+    )
+    return fitted
@@ -0,0 +1,108 @@
+import fcntl
+import json
+import os
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from src.qa_gpt.core.constant import RAG_STATE_FOLDER
+
+
+def generation_storage_id(file_id: str, generation: int) -> str:
+    """Get the storage ID that prefixes the RAG files of a generation of a material.
+
+    Generation 0 keeps the plain file ID, so indexes built before generations existed are
+    generation 0.
+
+    Args:
+        file_id: ID of the material
+        generation: Generation of the RAG index
+
+    Returns:
+        str: The storage ID
+    """
+    return file_id if generation == 0 else f"{file_id}.g{generation}"
+
+
+def rag_pointer_path(file_id: str, rag_state_folder_path: str | Path = RAG_STATE_FOLDER) -> Path:
+    """Get the path of the pointer to the live RAG index generation of a material."""
+    return Path(rag_state_folder_path) / f"{file_id}_rag_pointer.json"
+
+
+@contextmanager
+def rag_file_lock(
+    file_id: str, rag_state_folder_path: str | Path = RAG_STATE_FOLDER
+) -> Iterator[None]:
+    """Hold the lock of the RAG files of a material, across threads and processes.
+
+    Saving the live index generation and flipping the pointer to a new generation take the
+    lock, so a migration never flips the pointer over changes saved after its last check.
+
+    Args:
+        file_id: ID of the material
+        rag_state_folder_path: Path to the folder containing RAG state files
+    """
+    path = Path(rag_state_folder_path) / f"{file_id}_rag.lock"
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_rag_pointer(
+    file_id: str, rag_state_folder_path: str | Path = RAG_STATE_FOLDER
+) -> dict | None:
+    """Read the pointer to the live RAG index generation of a material.
+
+    Args:
+        file_id: ID of the material
+        rag_state_folder_path: Path to the folder containing RAG state files
+
+    Returns:
+        dict: The pointer with "generation", "storage_id" and "model_name", or None if the
+            material was never migrated and generation 0 is live
+    """
+    try:
+        with open(rag_pointer_path(file_id, rag_state_folder_path), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def current_generation(file_id: str, rag_state_folder_path: str | Path = RAG_STATE_FOLDER) -> int:
+    """Get the live RAG index generation of a material."""
+    pointer = read_rag_pointer(file_id, rag_state_folder_path)
+    return pointer["generation"] if pointer is not None else 0
+
+
+def resolve_storage_id(file_id: str, rag_state_folder_path: str | Path = RAG_STATE_FOLDER) -> str:
+    """Get the storage ID of the live RAG index generation of a material."""
+    return generation_storage_id(file_id, current_generation(file_id, rag_state_folder_path))
+
+
+def write_rag_pointer(
+    file_id: str,
+    generation: int,
+    model_name: str,
+    rag_state_folder_path: str | Path = RAG_STATE_FOLDER,
+) -> None:
+    """Atomically point a material to another RAG index generation.
+
+    Args:
+        file_id: ID of the material
+        generation: The generation to make live
+        model_name: Embedding model of the generation
+        rag_state_folder_path: Path to the folder containing RAG state files
+    """
+    path = rag_pointer_path(file_id, rag_state_folder_path)
+    pointer = {
+        "generation": generation,
+        "storage_id": generation_storage_id(file_id, generation),
+        "model_name": model_name,
+    }
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(pointer, f, indent=4)
+    os.replace(tmp_path, path)
@@ -0,0 +1,29 @@
+import re
+
+# Words and standalone punctuation, which is roughly how BERT-style and BPE tokenizers split text
+# before sub-word splitting. Good enough to budget tokens without loading a tokenizer.
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def token_spans(text: str) -> list[tuple[int, int]]:
+    """Return the (start, end) character spans of the estimated tokens in a text.
+
+    Args:
+        text: The text to split
+
+    Returns:
+        list[tuple[int, int]]: Character spans of each estimated token
+    """
+    return [match.span() for match in TOKEN_PATTERN.finditer(text)]
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a text without loading a tokenizer.
+
+    Args:
+        text: The text to measure
+
+    Returns:
+        int: Estimated token count
+    """
+    return sum(1 for _ in TOKEN_PATTERN.finditer(text))
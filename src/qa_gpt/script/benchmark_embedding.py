@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import random
+import time
+
+import numpy as np
+
+from src.qa_gpt.core.utils.embedding_backends import EMBEDDING_BACKENDS
+
+VOCABULARY = (
+    "we propose a novel method for retrieval augmented question generation from scientific papers "
+    "the model is trained on a large corpus and evaluated against strong baselines results show "
+    "significant improvements in accuracy latency and cost while the architecture remains simple"
+).split()
+
+
+def generate_sentences(num_sentences: int, seed: int = 0) -> list[str]:
+    """Generate synthetic sentences of mixed lengths."""
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(VOCABULARY, k=rng.randint(5, 120))) for _ in range(num_sentences)]
+
+
+def benchmark_backend(backend, sentences: list[str], batch_size: int) -> tuple[float, np.ndarray]:
+    """Return the throughput in sentences/sec and the embeddings of a backend."""
+    backend.encode(sentences[:batch_size], batch_size=batch_size)  # Warm up
+    start_time = time.perf_counter()
+    embeddings = backend.encode(sentences, batch_size=batch_size)
+    elapsed = time.perf_counter() - start_time
+    return len(sentences) / elapsed, embeddings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare embedding throughput of the torch and ONNX backends"
+    )
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Sentence transformer model")
+    parser.add_argument("--num-sentences", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument(
+        "--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=list(EMBEDDING_BACKENDS)
+    )
+    parser.add_argument("--output", help="Optional path of a JSON file to write the results to")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger(__name__)
+
+    sentences = generate_sentences(args.num_sentences)
+    results = {}
+    reference = None
+    for name in args.backends:
+        backend = EMBEDDING_BACKENDS[name](args.model)
+        throughput, embeddings = benchmark_backend(backend, sentences, args.batch_size)
+        if reference is None:
+            reference = embeddings
+        cosine = (embeddings * reference).sum(axis=1) / (
+            np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference, axis=1)
+        )
+        results[name] = {
+            "sentences_per_sec": throughput,
+            "min_cosine_to_first_backend": float(cosine.min()),
+        }
+        logger.info(
+            f"{name}: {throughput:.1f} sentences/sec, "
+            f"min cosine to {args.backends[0]}: {cosine.min():.5f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "model": args.model,
+                    "num_sentences": args.num_sentences,
+                    "batch_size": args.batch_size,
+                    "results": results,
+                },
+                f,
+                indent=4,
+            )
+
+
+if __name__ == "__main__":
+    main()
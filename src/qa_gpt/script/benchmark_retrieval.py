@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from src.qa_gpt.core.controller.rag_controller import RAGController
+from src.qa_gpt.core.controller.rag_query_cache import rag_query_cache
+from src.qa_gpt.core.utils.benchmark_utils import (
+    PrecomputedVectorBackend,
+    exact_neighbors,
+    find_regressions,
+    latency_percentiles,
+    perturbed_queries,
+    recall_at_k,
+    synthetic_corpus,
+    synthetic_vectors,
+)
+from src.qa_gpt.core.utils.embedding_backends import (
+    EMBEDDING_BACKENDS,
+    get_embedding_backend,
+)
+from src.qa_gpt.core.utils.encoding_scheduler import encode_scheduled
+
+logger = logging.getLogger(__name__)
+
+
+def benchmark_index(
+    backend,
+    index_type: str,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    nprobe: int,
+    texts: list[str] | None = None,
+) -> dict:
+    """Build a RAG index of the vectors in a scratch folder and measure its searches."""
+    rag_query_cache.clear()  # Results of a previous run must not be served from the cache
+    with tempfile.TemporaryDirectory() as folder:
+        controller = RAGController(
+            model_name=backend.model_name,
+            rag_state_folder_path=folder,
+            file_id="benchmark",
+            embedding_backend=backend,
+            index_factory=index_type,
+        )
+        start_time = time.perf_counter()
+        with controller.bulk():
+            controller.add_vectors(vectors, ids=list(range(len(vectors))), texts=texts)
+        build_seconds = time.perf_counter() - start_time
+        index_bytes = controller.index_path.stat().st_size
+
+        if "IVF" in index_type:
+            faiss.ParameterSpace().set_index_parameter(controller.index, "nprobe", nprobe)
+
+        controller.search(vectors[0], k)  # Warm up
+        latencies = []
+        retrieved = []
+        for query in queries:
+            query_start = time.perf_counter()
+            results = controller.search(query, k)
+            latencies.append(time.perf_counter() - query_start)
+            retrieved.append([id_ for id_, _ in results])
+
+    latency = latency_percentiles(latencies)
+    return {
+        "build_seconds": build_seconds,
+        "index_bytes": index_bytes,
+        "search_p50_ms": latency["p50_ms"],
+        "search_p99_ms": latency["p99_ms"],
+        "search_mean_ms": latency["mean_ms"],
+        "recall_at_k": recall_at_k(retrieved, exact_neighbors(vectors, queries, k), k),
+    }
+
+
+def load_corpora(args) -> list[tuple]:
+    """Return (backend label, backend, corpus vectors, query vectors, texts, extra results)."""
+    max_size = max(args.corpus_sizes)
+    if args.vectors or args.synthetic_dimension:
+        if args.vectors:
+            vectors = np.load(args.vectors).astype("float32")[:max_size]
+            label = "precomputed"
+        else:
+            vectors = synthetic_vectors(max_size, args.synthetic_dimension, seed=args.seed)
+            label = "synthetic"
+        if args.queries:
+            queries = np.load(args.queries).astype("float32")[: args.num_queries]
+        else:
+            queries = perturbed_queries(vectors, args.num_queries, seed=args.seed + 1)
+        backend = PrecomputedVectorBackend(vectors.shape[1])
+        return [(label, backend, vectors, queries, None, {})]
+
+    texts = synthetic_corpus(max_size, seed=args.seed)
+    query_texts = [
+        " ".join(text.split()[:12]) for text in synthetic_corpus(args.num_queries, args.seed + 1)
+    ]
+    corpora = []
+    for name in args.backends:
+        backend = get_embedding_backend(args.model, name)
+        vectors, stats = encode_scheduled(backend, texts)
+        queries = backend.encode(query_texts, batch_size=32).astype("float32")
+        corpora.append(
+            (
+                name,
+                backend,
+                vectors,
+                queries,
+                texts,
+                {"model": args.model, "encode_texts_per_second": stats.texts_per_second},
+            )
+        )
+    return corpora
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure build time, size, search latency and recall of RAG index types"
+    )
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument(
+        "--index-types",
+        nargs="+",
+        default=["Flat", "HNSW32", "IVF64,Flat"],
+        help="FAISS index factory strings",
+    )
+    parser.add_argument("--nprobe", type=int, default=8, help="Probed lists of IVF indexes")
+    parser.add_argument(
+        "--model",
+        default="all-MiniLM-L6-v2",
+        help="Sentence transformer model name or local path",
+    )
+    parser.add_argument(
+        "--backends", nargs="+", default=["torch"], choices=list(EMBEDDING_BACKENDS)
+    )
+    parser.add_argument("--vectors", help="Precomputed corpus vectors (.npy), skips encoding")
+    parser.add_argument("--queries", help="Precomputed query vectors (.npy) for --vectors")
+    parser.add_argument(
+        "--synthetic-dimension",
+        type=int,
+        help="Use clustered random vectors of this dimension instead of a model",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional path of a JSON file to write the results to")
+    parser.add_argument(
+        "--baseline", help="Results JSON of a previous run, exits with 1 on regressions"
+    )
+    parser.add_argument("--max-recall-drop", type=float, default=0.02)
+    parser.add_argument("--max-latency-ratio", type=float, default=1.5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("src.qa_gpt.core.controller").setLevel(logging.WARNING)
+
+    results = []
+    for label, backend, vectors, queries, texts, extra in load_corpora(args):
+        for corpus_size in sorted(args.corpus_sizes):
+            if corpus_size > len(vectors):
+                logger.warning(f"Skipping corpus size {corpus_size}, only {len(vectors)} vectors")
+                continue
+            for index_type in args.index_types:
+                result = {
+                    "backend": label,
+                    "index_type": index_type,
+                    "corpus_size": corpus_size,
+                    "k": args.k,
+                    "num_queries": len(queries),
+                    **extra,
+                }
+                try:
+                    result.update(
+                        benchmark_index(
+                            backend,
+                            index_type,
+                            vectors[:corpus_size],
+                            queries,
+                            args.k,
+                            args.nprobe,
+                            texts[:corpus_size] if texts is not None else None,
+                        )
+                    )
+                    logger.info(
+                        f"{label} {index_type} n={corpus_size}: "
+                        f"build {result['build_seconds']:.2f}s, "
+                        f"{result['index_bytes'] / 1024:.0f} KiB, "
+                        f"p50 {result['search_p50_ms']:.3f} ms, "
+                        f"p99 {result['search_p99_ms']:.3f} ms, "
+                        f"recall@{args.k} {result['recall_at_k']:.3f}"
+                    )
+                except Exception as e:
+                    logger.error(f"{label} {index_type} n={corpus_size} failed: {e}")
+                    result["error"] = str(e)
+                results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = find_regressions(
+            results, baseline, args.max_recall_drop, args.max_latency_ratio
+        )
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import json
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+import pytest
+from pydantic import BaseModel
+
+from src.qa_gpt.chat.batch_api import (
+    BatchRequest,
+    BatchRequestError,
+    parse_batch_output,
+    response_format,
+    run_batch,
+)
+from src.qa_gpt.chat.llm_cache import LLMResponseCache
+from src.qa_gpt.core.objects.questions import MultipleChoiceQuestionSet
+
+
+class Answer(BaseModel):
+    text: str
+
+
+class BatchStandIn(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible files and batches API answering each request by its content."""
+
+    files: dict[str, bytes] = {}
+    batches: dict[str, dict] = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload: dict) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers["Content-Length"]))
+
+    def do_POST(self):
+        body = self._read_body()
+        if self.path == "/v1/files":
+            headers = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+            message = BytesParser(policy=HTTP).parsebytes(headers + body)
+            content = next(
+                part.get_payload(decode=True)
+                for part in message.iter_parts()
+                if part.get_param("name", header="content-disposition") == "file"
+            )
+            file_id = f"file-{len(self.files)}"
+            self.files[file_id] = content
+            self._send_json({"id": file_id, "object": "file", "purpose": "batch"})
+        elif self.path == "/v1/batches":
+            request = json.loads(body)
+            batch_id = f"batch-{len(self.batches)}"
+            self.batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"],
+                "completion_window": request["completion_window"],
+                "created_at": 0,
+                "status": "validating",
+            }
+            self._send_json(self.batches[batch_id])
+
+    def do_GET(self):
+        if self.path.startswith("/v1/batches/"):
+            batch = self.batches[self.path.rsplit("/", 1)[1]]
+            if batch["status"] == "validating":
+                batch["status"] = "in_progress"
+            else:
+                self._complete(batch)
+            self._send_json(batch)
+        elif self.path.endswith("/content"):
+            data = self.files[self.path.split("/")[3]]
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    def _complete(self, batch: dict) -> None:
+        lines = []
+        for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines():
+            request = json.loads(line)
+            question = request["body"]["messages"][-1]["content"]
+            if question == "fail":
+                response = {"status_code": 400, "body": {"error": {"message": "Bad request"}}}
+            else:
+                content = json.dumps({"text": question.upper()})
+                response = {
+                    "status_code": 200,
+                    "body": {"choices": [{"message": {"role": "assistant", "content": content}}]},
+                }
+            lines.append(json.dumps({"custom_id": request["custom_id"], "response": response}))
+        output_file_id = f"file-{len(self.files)}"
+        self.files[output_file_id] = ("\n".join(lines) + "\n").encode("utf-8")
+        batch.update(status="completed", output_file_id=output_file_id)
+
+
+@pytest.fixture
+def stand_in_client():
+    BatchStandIn.files = {}
+    BatchStandIn.batches = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BatchStandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield openai.AsyncOpenAI(
+        api_key="test", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1"
+    )
+    server.shutdown()
+    server.server_close()
+
+
+def make_request(custom_id: str, question: str) -> BatchRequest:
+    return BatchRequest(custom_id, [{"role": "user", "content": question}], Answer)
+
+
+@pytest.mark.asyncio
+async def test_run_batch_maps_results_by_custom_id(stand_in_client, tmp_path, monkeypatch):
+    """Test that a batch job is submitted, polled and its results parsed per request."""
+    cache = LLMResponseCache(tmp_path / "cache.sqlite", mode="read-write")
+    monkeypatch.setattr("src.qa_gpt.chat.batch_api.llm_response_cache", cache)
+    requests = [make_request("a", "first"), make_request("b", "fail"), make_request("c", "third")]
+
+    results = await run_batch(requests, client=stand_in_client, model="test", poll_seconds=0)
+
+    assert results["a"] == Answer(text="FIRST")
+    assert results["c"] == Answer(text="THIRD")
+    assert isinstance(results["b"], BatchRequestError)
+    input_lines = BatchStandIn.files["file-0"].decode("utf-8").splitlines()
+    assert [json.loads(line)["body"]["response_format"]["type"] for line in input_lines] == [
+        "json_schema"
+    ] * 3
+
+    # Successful responses are served to synchronous requests afterwards
+    key = cache.make_key("test", requests[0].messages, Answer)
+    assert cache.get(key, Answer) == Answer(text="FIRST")
+    assert len(cache) == 2
+
+
+def test_parse_batch_output_reports_missing_and_invalid():
+    """Test that unparseable and missing responses become errors of their requests."""
+    requests = [make_request("a", "first"), make_request("b", "second")]
+    output = json.dumps(
+        {
+            "custom_id": "a",
+            "response": {
+                "status_code": 200,
+                "body": {"choices": [{"message": {"content": '{"wrong": 1}'}}]},
+            },
+        }
+    )
+
+    results = parse_batch_output(output, requests)
+
+    assert isinstance(results["a"], BatchRequestError)
+    assert isinstance(results["b"], BatchRequestError)
+
+
+def test_response_format_is_strict():
+    """Test that every object of the response schema is closed and requires all properties."""
+    response = response_format(MultipleChoiceQuestionSet)
+    schema = response["json_schema"]["schema"]
+
+    assert response["type"] == "json_schema"
+    assert response["json_schema"]["name"] == "MultipleChoiceQuestionSet"
+    assert response["json_schema"]["strict"] is True
+    for obj in [schema, *schema["$defs"].values()]:
+        assert obj["additionalProperties"] is False
+        assert obj["required"] == list(obj["properties"])
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from src.qa_gpt.core.utils.benchmark_utils import (
+    exact_neighbors,
+    find_regressions,
+    latency_percentiles,
+    perturbed_queries,
+    recall_at_k,
+    synthetic_vectors,
+)
+
+
+def test_recall_at_k():
+    """Test that recall counts the exact neighbors among the retrieved results per query."""
+    exact = np.array([[0, 1], [2, 3]])
+    assert recall_at_k([[1, 0], [2, 9]], exact, k=2) == pytest.approx(0.75)
+    assert recall_at_k([], exact[:0], k=2) == 1.0
+
+
+def test_exact_neighbors_find_perturbed_source():
+    """Test that slightly perturbed corpus vectors find their source vector first."""
+    vectors = synthetic_vectors(200, 16, seed=1)
+    queries = perturbed_queries(vectors, 20, noise=0.001, seed=2)
+    sources = [int(np.argmin(np.linalg.norm(vectors - query, axis=1))) for query in queries]
+
+    neighbors = exact_neighbors(vectors, queries, k=3)
+    assert neighbors.shape == (20, 3)
+    assert neighbors[:, 0].tolist() == sources
+
+
+def test_latency_percentiles():
+    """Test that latencies in seconds are summarized in milliseconds."""
+    latency = latency_percentiles([0.001] * 99 + [0.1])
+    assert latency["p50_ms"] == pytest.approx(1.0)
+    assert latency["p99_ms"] > 1.0
+    assert latency["mean_ms"] == pytest.approx(1.99)
+
+
+def test_find_regressions():
+    """Test that recall drops and latency increases beyond the tolerances are reported."""
+
+    def result(index_type, recall, p99):
+        return {
+            "backend": "synthetic",
+            "index_type": index_type,
+            "corpus_size": 1000,
+            "k": 5,
+            "recall_at_k": recall,
+            "search_p99_ms": p99,
+        }
+
+    baseline = [
+        result("Flat", 1.0, 1.0),
+        result("HNSW32", 0.95, 1.0),
+        result("IVF64,Flat", 0.9, 1.0),
+    ]
+    results = [
+        result("Flat", 0.99, 1.2),
+        result("HNSW32", 0.9, 1.0),
+        result("IVF64,Flat", 0.9, 2.0),
+    ]
+
+    regressions = find_regressions(results, baseline, max_recall_drop=0.02, max_latency_ratio=1.5)
+    assert len(regressions) == 2
+    assert "HNSW32" in regressions[0] and "recall" in regressions[0]
+    assert "IVF64,Flat" in regressions[1] and "latency" in regressions[1]
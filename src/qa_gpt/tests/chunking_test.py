@@ -0,0 +1,111 @@
+from src.qa_gpt.core.objects.parsing import TextSection
+from src.qa_gpt.core.utils.chunking_utils import (
+    chunk_section,
+    chunk_sections,
+    sentence_chunks,
+    split_sentences,
+)
+from src.qa_gpt.core.utils.token_utils import estimate_tokens
+
+
+def _make_section(num_sentences: int, title: str = "Method") -> TextSection:
+    content = " ".join(
+        f"Sentence {i} explains one step of the proposed method." for i in range(num_sentences)
+    )
+    return TextSection(title=title, content=content, summary="Summary of the method")
+
+
+def test_short_section_is_single_chunk():
+    section = _make_section(2)
+    chunks = chunk_section(section, section_index=3)
+
+    assert len(chunks) == 1
+    assert chunks[0].text == section.content
+    assert chunks[0].section_index == 3
+    assert chunks[0].section_title == "Method"
+    assert str(chunks[0]) == f"Section: Method\nContent: {section.content}"
+
+
+def test_long_section_is_token_bounded():
+    section = _make_section(200)
+    max_tokens = 64
+    chunks = chunk_section(section, section_index=0, max_tokens=max_tokens, overlap_tokens=8)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert estimate_tokens(str(chunk)) <= max_tokens
+        assert section.content[chunk.start_char : chunk.end_char] == chunk.text
+    assert [chunk.chunk_index for chunk in chunks] == list(range(len(chunks)))
+
+    # Chunks cover the whole section from start to end
+    assert chunks[0].start_char == 0
+    assert chunks[-1].end_char == len(section.content)
+
+
+def test_chunks_overlap():
+    section = _make_section(50)
+    chunks = chunk_section(section, section_index=0, max_tokens=64, overlap_tokens=8)
+
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.start_char < previous.end_char
+
+
+def test_chunks_prefer_sentence_boundaries():
+    section = _make_section(50)
+    chunks = chunk_section(section, section_index=0, max_tokens=64, overlap_tokens=0)
+
+    for chunk in chunks:
+        assert chunk.text.endswith(".")
+
+
+def test_empty_section_falls_back_to_summary():
+    section = TextSection(title="Figure", content="", summary="A figure caption")
+    chunks = chunk_section(section, section_index=0)
+
+    assert len(chunks) == 1
+    assert chunks[0].text == "A figure caption"
+
+
+def test_chunk_sections_keeps_parent_pointers():
+    sections = [_make_section(100, title="Intro"), _make_section(1, title="Conclusion")]
+    chunks = chunk_sections(sections, max_tokens=64, overlap_tokens=8)
+
+    assert {chunk.section_index for chunk in chunks} == {0, 1}
+    assert chunks[-1].section_title == "Conclusion"
+    pointer = chunks[0].parent_pointer()
+    assert "text" not in pointer
+    assert pointer["section_index"] == 0
+    assert pointer["section_title"] == "Intro"
+
+
+def test_split_sentences():
+    section = TextSection(
+        title="Results",
+        content="Accuracy rose to 93.5 percent on the test set. See Fig. 2 for the curve! Done.",
+        summary="Summary",
+    )
+    sentences = split_sentences(section, section_index=1)
+
+    # The decimal point doesn't end a sentence and "Done." is merged as a short fragment
+    assert [sentence.text for sentence in sentences] == [
+        "Accuracy rose to 93.5 percent on the test set.",
+        "See Fig. 2 for the curve! Done.",
+    ]
+    for sentence in sentences:
+        assert section.content[sentence.start_char : sentence.end_char] == sentence.text
+        assert sentence.section_index == 1
+    assert [sentence.chunk_index for sentence in sentences] == [0, 1]
+
+
+def test_long_sentences_are_split():
+    section = TextSection(title="Long", content=" ".join(["word"] * 100), summary="Summary")
+    sentences = split_sentences(section, section_index=0, max_tokens=30)
+
+    assert [sentence.token_count for sentence in sentences] == [30, 30, 30, 10]
+
+
+def test_sentence_chunks_of_all_sections():
+    sentences = sentence_chunks([_make_section(3), _make_section(2, title="Results")])
+
+    assert [sentence.section_index for sentence in sentences] == [0, 0, 0, 1, 1]
+    assert sentences[3].section_title == "Results"
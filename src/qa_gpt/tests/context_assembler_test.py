@@ -0,0 +1,53 @@
+from src.qa_gpt.core.utils.context_assembler import SENTENCE_GAP, assemble_context
+
+
+class FakeSentenceController:
+    """Sentence index of two sections with sentences of two tokens each."""
+
+    def __init__(self):
+        self.text_store = {i: f"Sentence {i}" for i in range(8)}
+        self.metadata_store = {
+            i: {"section_index": 0 if i < 5 else 1, "section_title": "A" if i < 5 else "B"}
+            for i in range(8)
+        }
+
+    def get_text_by_index(self, index):
+        return self.text_store[index]
+
+    def get_metadata_by_index(self, index):
+        return self.metadata_store[index]
+
+
+def test_expands_hits_within_budget():
+    """Test that a hit grows into its surrounding sentences until the budget is used."""
+    context = assemble_context(FakeSentenceController(), [(2, 0.1)], token_budget=6)
+
+    assert context == "Section: A\nContent: Sentence 1 Sentence 2 Sentence 3"
+
+
+def test_windows_stay_in_their_section():
+    """Test that a window never crosses into the neighboring section."""
+    context = assemble_context(FakeSentenceController(), [(4, 0.1)], token_budget=100)
+
+    assert context == (
+        "Section: A\nContent: Sentence 0 Sentence 1 Sentence 2 Sentence 3 Sentence 4"
+    )
+
+
+def test_windows_are_grouped_by_section():
+    """Test that windows are rendered in reading order with gaps marked."""
+    context = assemble_context(
+        FakeSentenceController(), [(7, 0.1), (0, 0.2), (3, 0.3)], token_budget=6
+    )
+
+    assert context == (
+        f"Section: A\nContent: Sentence 0{SENTENCE_GAP}Sentence 3"
+        "\n\nSection: B\nContent: Sentence 7"
+    )
+
+
+def test_hits_over_budget_are_dropped():
+    """Test that lower ranked hits that don't fit the budget are left out."""
+    context = assemble_context(FakeSentenceController(), [(1, 0.1), (6, 0.2)], token_budget=3)
+
+    assert context == "Section: A\nContent: Sentence 1"
@@ -0,0 +1,72 @@
+import time
+from unittest.mock import MagicMock
+
+from src.qa_gpt.core.objects.summaries import MetaDataSummary, StandardSummary
+from src.qa_gpt.core.utils.context_pack_utils import (
+    build_context_pack,
+    context_pack_path,
+    get_packed_context,
+    save_context_pack,
+    summary_context_query,
+    summary_field_names,
+)
+
+
+def make_rag_controller():
+    rag_controller = MagicMock()
+    rag_controller.file_id = "file1"
+    rag_controller.index_uid = "uid"
+    rag_controller.index_version = 3
+    rag_controller.search_text.side_effect = lambda query, k: [(f"{query} clip", 0.1)] * k
+    return rag_controller
+
+
+def test_summary_field_names():
+    """Test that excluded fields have no field query."""
+    assert set(summary_field_names(StandardSummary)) == {
+        "motivation",
+        "conclusion",
+        "bullet_points",
+    }
+    assert "summary_type" not in summary_field_names(MetaDataSummary)
+
+
+def test_context_pack_round_trip(tmp_path):
+    """Test that precomputed contexts are read back by query and k."""
+    rag_controller = make_rag_controller()
+    context_pack = build_context_pack(rag_controller, [StandardSummary, MetaDataSummary])
+    save_context_pack(context_pack, context_pack_path("file1", tmp_path))
+
+    summary_query = summary_context_query(StandardSummary)
+    assert (
+        get_packed_context("file1", summary_query, 5, tmp_path)
+        == [(f"{summary_query} clip", 0.1)] * 5
+    )
+    assert get_packed_context("file1", "motivation", 2, tmp_path) == [("motivation clip", 0.1)] * 2
+    # Queries shared by several summary types are retrieved once
+    assert len(context_pack["contexts"]) == len(
+        {context["query"] for context in context_pack["contexts"]}
+    )
+
+
+def test_missing_context_pack(tmp_path):
+    """Test that a missing pack or query falls back to None."""
+    assert get_packed_context("file1", "motivation", 2, tmp_path) is None
+
+    context_pack = build_context_pack(make_rag_controller(), [StandardSummary])
+    save_context_pack(context_pack, context_pack_path("file1", tmp_path))
+    assert get_packed_context("file1", "motivation", 5, tmp_path) is None
+    assert get_packed_context("file1", "unknown", 2, tmp_path) is None
+
+
+def test_rewritten_context_pack_is_reread(tmp_path):
+    """Test that a rewritten pack isn't served from the read cache."""
+    path = context_pack_path("file1", tmp_path)
+    save_context_pack(build_context_pack(make_rag_controller(), [StandardSummary]), path)
+    assert get_packed_context("file1", "motivation", 2, tmp_path) is not None
+
+    time.sleep(0.01)
+    rag_controller = make_rag_controller()
+    rag_controller.search_text.side_effect = lambda query, k: [("new clip", 0.2)]
+    save_context_pack(build_context_pack(rag_controller, [StandardSummary]), path)
+    assert get_packed_context("file1", "motivation", 2, tmp_path) == [("new clip", 0.2)]
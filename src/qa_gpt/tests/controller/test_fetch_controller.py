@@ -1,10 +1,18 @@
+import asyncio
+import copy
+import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
 from src.qa_gpt.core.controller.fetch_controller import FetchController
+from src.qa_gpt.core.controller.llm_job_queue import JobPriority
 from src.qa_gpt.core.objects.materials import FileMeta
+from src.qa_gpt.core.objects.parsing import TextSection
+from src.qa_gpt.core.objects.summaries import StandardSummary
+from src.qa_gpt.core.utils.context_pack_utils import summary_context_query
 
 
 @pytest.fixture
@@ -18,8 +26,14 @@ def mock_material_controller():
 
 
 @pytest.fixture
-def mock_rag_controller():
-    return MagicMock()
+def mock_rag_controller(tmp_path):
+    controller = MagicMock()
+    controller.file_id = "file1"
+    controller.index_uid = "index_uid"
+    controller.index_version = 1
+    controller.context_pack_path = tmp_path / "file1_context_pack.json"
+    controller.search_text.return_value = [("Section: Section 1\nContent: Section 1 content", 0.5)]
+    return controller
 
 
 @pytest.fixture
@@ -33,7 +47,10 @@ def sample_file_meta():
         summaries={},
         question_comments={},
         parsing_results={
-            "sections": [{"content": "Section 1 content"}, {"content": "Section 2 content"}],
+            "sections": [
+                TextSection(title="Section 1", content="Section 1 content", summary="Summary 1"),
+                TextSection(title="Section 2", content="Section 2 content", summary="Summary 2"),
+            ],
             "images": [],
             "tables": [],
         },
@@ -64,10 +81,15 @@ async def test_build_rag_index_single_file(
         mock_rag_class.assert_called_once()
         assert mock_rag_class.call_args[1]["file_id"] == "file1"
 
-        # Check that texts were added to RAG index
-        mock_rag_controller.add_texts.assert_called_once_with(
-            ["{'content': 'Section 1 content'}", "{'content': 'Section 2 content'}"]
-        )
+        # Check that section chunks were added to RAG index with parent pointers
+        mock_rag_controller.add_texts.assert_called_once()
+        texts = mock_rag_controller.add_texts.call_args[0][0]
+        metadatas = mock_rag_controller.add_texts.call_args[1]["metadatas"]
+        assert texts == [
+            "Section: Section 1\nContent: Section 1 content",
+            "Section: Section 2\nContent: Section 2 content",
+        ]
+        assert [metadata["section_index"] for metadata in metadatas] == [0, 1]
 
         # Check that RAG state was saved
         mock_rag_controller.save_state.assert_called_once()
@@ -130,7 +152,10 @@ async def test_build_rag_index_process_all(
         summaries={},
         question_comments={},
         parsing_results={
-            "sections": [{"content": "Section 1 content"}, {"content": "Section 2 content"}],
+            "sections": [
+                TextSection(title="Section 1", content="Section 1 content", summary="Summary 1"),
+                TextSection(title="Section 2", content="Section 2 content", summary="Summary 2"),
+            ],
             "images": [],
             "tables": [],
         },
@@ -172,3 +197,391 @@ async def test_build_rag_index_error_handling(
 
         # Verify that the error was handled gracefully
         assert not Path("./rag_state/file1_rag_state.pkl").exists()
+
+
+@pytest.mark.asyncio
+async def test_build_rag_index_parallel(
+    fetch_controller, mock_material_controller, mock_rag_controller, sample_file_meta
+):
+    # Setup
+    fetch_controller.material_controller = mock_material_controller
+    sample_file_meta2 = FileMeta(
+        id=2,
+        file_name="test2.pdf",
+        file_suffix=".pdf",
+        file_path=Path("test2.pdf"),
+        mc_question_sets={},
+        summaries={},
+        question_comments={},
+        parsing_results={
+            "sections": [
+                TextSection(title="Section 1", content="Section 1 content", summary="Summary 1")
+            ],
+            "images": [],
+            "tables": [],
+        },
+        rag_state=None,
+    )
+    mock_material_controller.get_material_table.return_value = {
+        "file1": sample_file_meta,
+        "file2": sample_file_meta2,
+    }
+
+    # Run the workers as threads so they see the mocked RAGController
+    def thread_pool(max_workers, **kwargs):
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    with (
+        patch("src.qa_gpt.core.controller.fetch_controller.RAGController") as mock_rag_class,
+        patch("src.qa_gpt.core.controller.fetch_controller.ProcessPoolExecutor", thread_pool),
+    ):
+        mock_rag_class.return_value = mock_rag_controller
+
+        # Execute
+        await fetch_controller.build_rag_index(process_all=True, num_workers=2)
+
+        # Verify
+        assert mock_rag_class.call_count == 2
+        assert mock_rag_controller.add_texts.call_count == 2
+        assert mock_rag_controller.save_state.call_count == 2
+        assert sample_file_meta.rag_state is not None
+        assert sample_file_meta2.rag_state is not None
+        assert mock_material_controller.db_controller.save_data.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_build_rag_index_parallel_error_handling(
+    fetch_controller, mock_material_controller, sample_file_meta
+):
+    # Setup
+    fetch_controller.material_controller = mock_material_controller
+    mock_material_controller.get_material_table.return_value = {"file1": sample_file_meta}
+
+    def thread_pool(max_workers, **kwargs):
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    with (
+        patch("src.qa_gpt.core.controller.fetch_controller.RAGController") as mock_rag_class,
+        patch("src.qa_gpt.core.controller.fetch_controller.ProcessPoolExecutor", thread_pool),
+    ):
+        mock_rag_class.side_effect = Exception("Test error")
+
+        # Execute and verify no exception is raised
+        await fetch_controller.build_rag_index(file_id="file1", num_workers=2)
+
+        assert sample_file_meta.rag_state is None
+        mock_material_controller.db_controller.save_data.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_build_rag_index_parallel_save_error(
+    fetch_controller, mock_material_controller, sample_file_meta, tmp_path
+):
+    """Test that a failed material table update only drops the state of its own material."""
+    fetch_controller.material_controller = mock_material_controller
+    sample_file_meta2 = copy.copy(sample_file_meta)
+    sample_file_meta2.id = 2
+    mock_material_controller.get_material_table.return_value = {
+        "file1": sample_file_meta,
+        "file2": sample_file_meta2,
+    }
+
+    def build(file_id, *args):
+        state_path = tmp_path / f"{file_id}_rag_state.pkl"
+        state_path.write_bytes(b"state")
+        return state_path
+
+    def save_data(file_meta, target_path):
+        if file_meta.id == 1:
+            raise OSError("Disk full")
+
+    mock_material_controller.db_controller.save_data.side_effect = save_data
+
+    def thread_pool(max_workers, **kwargs):
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    with (
+        patch("src.qa_gpt.core.controller.fetch_controller.build_material_rag_index", build),
+        patch("src.qa_gpt.core.controller.fetch_controller.ProcessPoolExecutor", thread_pool),
+    ):
+        await fetch_controller.build_rag_index(process_all=True, num_workers=2)
+
+    assert not (tmp_path / "file1_rag_state.pkl").exists()
+    assert (tmp_path / "file2_rag_state.pkl").exists()
+    assert sample_file_meta2.rag_state == tmp_path / "file2_rag_state.pkl"
+    assert mock_material_controller.db_controller.save_data.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_build_rag_index_context_pack(
+    fetch_controller, mock_material_controller, mock_rag_controller, sample_file_meta
+):
+    # Setup
+    fetch_controller.material_controller = mock_material_controller
+    mock_material_controller.get_material_table.return_value = {"file1": sample_file_meta}
+
+    with patch("src.qa_gpt.core.controller.fetch_controller.RAGController") as mock_rag_class:
+        mock_rag_class.return_value = mock_rag_controller
+
+        # Execute
+        await fetch_controller.build_rag_index(file_id="file1")
+
+    # Verify the summary and field queries were precomputed
+    context_pack = json.loads(mock_rag_controller.context_pack_path.read_text())
+    queries = {(context["query"], context["k"]) for context in context_pack["contexts"]}
+    assert (summary_context_query(StandardSummary), 5) in queries
+    assert ("motivation", 2) in queries
+    assert ("bullet_points", 2) in queries
+    assert context_pack["index_version"] == 1
+
+
+@pytest.mark.asyncio
+async def test_build_rag_index_sentence_index(
+    mock_material_controller, mock_rag_controller, sample_file_meta
+):
+    # Setup
+    fetch_controller = FetchController(small_to_big=True)
+    fetch_controller.material_controller = mock_material_controller
+    mock_material_controller.get_material_table.return_value = {"file1": sample_file_meta}
+
+    with patch("src.qa_gpt.core.controller.fetch_controller.RAGController") as mock_rag_class:
+        mock_rag_class.return_value = mock_rag_controller
+
+        # Execute
+        await fetch_controller.build_rag_index(file_id="file1")
+
+        # Verify the sentence index was built with parent pointers
+        assert [call.kwargs["file_id"] for call in mock_rag_class.call_args_list] == [
+            "file1",
+            "file1_sentences",
+        ]
+        sentences = mock_rag_controller.add_texts.call_args_list[1][0][0]
+        metadatas = mock_rag_controller.add_texts.call_args_list[1][1]["metadatas"]
+        assert sentences == ["Section 1 content", "Section 2 content"]
+        assert [metadata["section_index"] for metadata in metadatas] == [0, 1]
+        assert fetch_controller.qa_controller.small_to_big
+
+
+@pytest.mark.asyncio
+async def test_build_rag_index_collapses_near_duplicates(
+    fetch_controller, mock_material_controller, mock_rag_controller, sample_file_meta
+):
+    # Setup a section repeated with a different case and trailing punctuation
+    boilerplate = "This work is licensed under a Creative Commons Attribution 4.0 License"
+    sample_file_meta.parsing_results["sections"] = [
+        TextSection(title="Section 1", content=boilerplate, summary="Summary 1"),
+        TextSection(title="Section 2", content="Section 2 content", summary="Summary 2"),
+        TextSection(title="Section 3", content=boilerplate.upper() + ".", summary="Summary 3"),
+    ]
+    fetch_controller.material_controller = mock_material_controller
+    mock_material_controller.get_material_table.return_value = {"file1": sample_file_meta}
+
+    with patch("src.qa_gpt.core.controller.fetch_controller.RAGController") as mock_rag_class:
+        mock_rag_class.return_value = mock_rag_controller
+
+        # Execute
+        await fetch_controller.build_rag_index(file_id="file1")
+
+    # Verify the duplicate was dropped and recorded on the kept chunk
+    texts = mock_rag_controller.add_texts.call_args[0][0]
+    metadatas = mock_rag_controller.add_texts.call_args[1]["metadatas"]
+    assert texts == [
+        f"Section: Section 1\nContent: {boilerplate}",
+        "Section: Section 2\nContent: Section 2 content",
+    ]
+    assert [duplicate["section_index"] for duplicate in metadatas[0]["duplicates"]] == [2]
+    assert "duplicates" not in metadatas[1]
+
+
+@pytest.mark.asyncio
+async def test_fetch_material_add_summary_passes_priority(
+    fetch_controller, mock_material_controller, sample_file_meta
+):
+    # Setup two materials missing all summaries
+    fetch_controller.material_controller = mock_material_controller
+    mock_material_controller.get_material_table.return_value = {
+        "file1": sample_file_meta,
+        "file2": sample_file_meta,
+    }
+    fetch_controller.qa_controller = MagicMock()
+
+    async def get_summaries_batch(file_ids, *args, on_result=None, **kwargs):
+        results = [MagicMock() for _ in file_ids]
+        for position, result in enumerate(results):
+            on_result(position, result)
+        return results
+
+    fetch_controller.qa_controller.get_summaries_batch = AsyncMock(side_effect=get_summaries_batch)
+
+    # Execute
+    await fetch_controller.fetch_material_add_summary(
+        process_all=True, priority=JobPriority.INTERACTIVE
+    )
+
+    # Verify both materials were submitted with the requested priority
+    calls = fetch_controller.qa_controller.get_summaries_batch.call_args_list
+    assert sorted(call.args[0][0] for call in calls) == ["file1", "file2"]
+    assert all(call.args[3] == JobPriority.INTERACTIVE for call in calls)
+    assert mock_material_controller.append_summary.call_count == 2 * len(
+        fetch_controller.summary_objects
+    )
+
+
+@pytest.mark.asyncio
+async def test_fetch_material_add_summary_bounds_materials_in_flight(
+    fetch_controller, mock_material_controller, sample_file_meta
+):
+    # Setup five materials missing all summaries, one of which fails
+    fetch_controller.material_controller = mock_material_controller
+    file_ids = [f"file{i}" for i in range(1, 6)]
+    mock_material_controller.get_material_table.return_value = {
+        file_id: sample_file_meta for file_id in file_ids
+    }
+    in_flight = set()
+    max_in_flight = 0
+    read_while_in_flight = []
+
+    def read_markdown_context(file_id, file_meta):
+        read_while_in_flight.append(len(in_flight))
+        return f"markdown of {file_id}"
+
+    async def get_summaries_batch(file_ids, *args, on_result=None, **kwargs):
+        nonlocal max_in_flight
+        in_flight.add(file_ids[0])
+        max_in_flight = max(max_in_flight, len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.discard(file_ids[0])
+        if file_ids[0] == "file2":
+            raise RuntimeError("API down")
+        return [MagicMock() for _ in file_ids]
+
+    fetch_controller._read_markdown_context = read_markdown_context
+    fetch_controller.qa_controller = MagicMock()
+    fetch_controller.qa_controller.get_summaries_batch = AsyncMock(side_effect=get_summaries_batch)
+
+    # Execute
+    with patch("src.qa_gpt.core.controller.fetch_controller.LLM_MAX_CONCURRENT_MATERIALS", 2):
+        await fetch_controller.fetch_material_add_summary(process_all=True)
+
+    # Verify every material ran, at most two at once, each markdown read only when its turn came
+    calls = fetch_controller.qa_controller.get_summaries_batch.call_args_list
+    assert sorted(call.args[0][0] for call in calls) == file_ids
+    assert max_in_flight == 2
+    assert len(read_while_in_flight) == len(file_ids)
+    assert all(count < 2 for count in read_while_in_flight)
+
+
+@pytest.mark.asyncio
+async def test_fetch_material_add_summary_records_storage_errors(
+    fetch_controller, mock_material_controller, sample_file_meta
+):
+    # Setup a material missing all summaries, whose first summary fails to be stored
+    fetch_controller.material_controller = mock_material_controller
+    mock_material_controller.get_material_table.return_value = {"file1": sample_file_meta}
+    mock_material_controller.append_summary.side_effect = [OSError("Disk full")] + [None] * len(
+        fetch_controller.summary_objects
+    )
+    fetch_controller.qa_controller = MagicMock()
+
+    async def get_summaries_batch(file_ids, *args, on_result=None, **kwargs):
+        results = [MagicMock() for _ in file_ids]
+        for position, result in enumerate(results):
+            on_result(position, result)
+        return results
+
+    fetch_controller.qa_controller.get_summaries_batch = AsyncMock(side_effect=get_summaries_batch)
+
+    # Execute
+    await fetch_controller.fetch_material_add_summary(file_id="file1")
+
+    # Verify the failure was recorded and the other summaries were still stored
+    mock_material_controller.record_generation_failure.assert_called_once()
+    assert mock_material_controller.append_summary.call_count == len(
+        fetch_controller.summary_objects
+    )
+
+
+@pytest.mark.asyncio
+async def test_fetch_material_batch_maps_results(
+    fetch_controller, mock_material_controller, sample_file_meta
+):
+    # Setup a material with a standard summary but no question sets or other summaries
+    standard_summary = MagicMock()
+    standard_summary.model_dump.return_value = {"motivation": "Why", "conclusion": "What"}
+    sample_file_meta.summaries = {"StandardSummary": standard_summary}
+    fetch_controller.material_controller = mock_material_controller
+    mock_material_controller.get_material_table.return_value = {"file1": sample_file_meta}
+    fetch_controller.qa_controller = MagicMock()
+    fetch_controller.qa_controller.build_summary_messages = AsyncMock(return_value=[])
+    fetch_controller.qa_controller.build_question_messages = AsyncMock(return_value=[])
+
+    async def fake_run_batch(requests, client=None, poll_seconds=60):
+        return {
+            request.custom_id: (
+                ValueError("failed") if "conclusion" in request.custom_id else MagicMock()
+            )
+            for request in requests
+        }
+
+    with patch(
+        "src.qa_gpt.core.controller.fetch_controller.run_batch", side_effect=fake_run_batch
+    ) as mock_run_batch:
+        await fetch_controller.fetch_material_batch(file_id="file1")
+
+    # Verify one batch held the missing summaries and the question sets of the standard summary
+    custom_ids = [request.custom_id for request in mock_run_batch.call_args.args[0]]
+    assert "file1:summary:TechnicalSummary" in custom_ids
+    assert "file1:summary:StandardSummary" not in custom_ids
+    assert "file1:questions:StandardSummary_motivation" in custom_ids
+    assert (
+        mock_material_controller.append_summary.call_count
+        == len(fetch_controller.summary_objects) - 1
+    )
+    # Failed requests are not stored, so the next run requests them again
+    prefixes = [
+        call.args[2] for call in mock_material_controller.append_mc_question_set.call_args_list
+    ]
+    assert "StandardSummary_motivation" in prefixes
+    assert "StandardSummary_conclusion" not in prefixes
+
+
+@pytest.mark.asyncio
+async def test_fetch_material_add_summary_retries_only_failures(
+    fetch_controller, mock_material_controller, sample_file_meta
+):
+    # Setup a material whose technical summary failed before and one that fails again now
+    fetch_controller.material_controller = mock_material_controller
+    mock_material_controller.get_material_table.return_value = {"file1": sample_file_meta}
+    mock_material_controller.get_generation_failures.return_value = {
+        "summary:TechnicalSummary": {"error": "ValueError: failed", "attempts": 1},
+        "summary:MetaDataSummary": {"error": "ValueError: failed", "attempts": 1},
+    }
+    error = ValueError("failed again")
+
+    async def get_summaries_batch(file_ids, summary_classes, *args, on_result=None, **kwargs):
+        results = [
+            error if cls.__name__ == "MetaDataSummary" else MagicMock() for cls in summary_classes
+        ]
+        for position, result in enumerate(results):
+            on_result(position, result)
+        return results
+
+    fetch_controller.qa_controller = MagicMock()
+    fetch_controller.qa_controller.get_summaries_batch = AsyncMock(side_effect=get_summaries_batch)
+
+    # Execute
+    await fetch_controller.fetch_material_add_summary(file_id="file1", only_failed=True)
+
+    # Verify only the recorded failures were requested, each result handled on its own
+    requested = fetch_controller.qa_controller.get_summaries_batch.call_args.args[1]
+    assert [cls.__name__ for cls in requested] == ["TechnicalSummary", "MetaDataSummary"]
+    assert fetch_controller.qa_controller.get_summaries_batch.call_args.args[3] == (
+        JobPriority.REGENERATION
+    )
+    assert mock_material_controller.append_summary.call_count == 1
+    mock_material_controller.clear_generation_failure.assert_called_once_with(
+        "file1", "summary:TechnicalSummary"
+    )
+    mock_material_controller.record_generation_failure.assert_called_once_with(
+        "file1", "summary:MetaDataSummary", error
+    )
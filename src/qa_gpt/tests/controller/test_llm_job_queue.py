@@ -0,0 +1,138 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.qa_gpt.core.controller.llm_job_queue import JobPriority, LLMJobQueue
+
+
+def recording_job(started: list, name: str, release: asyncio.Event | None = None):
+    async def job():
+        started.append(name)
+        if release is not None:
+            await release.wait()
+        return name
+
+    return job
+
+
+@pytest.mark.asyncio
+async def test_concurrency_cap():
+    """Test that no more than the cap of jobs run at once."""
+    queue = LLMJobQueue(max_concurrency=2)
+    running = 0
+    peak = 0
+
+    async def job():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return True
+
+    results = await asyncio.gather(*(queue.run(job, material_id=i % 3) for i in range(7)))
+
+    assert results == [True] * 7
+    assert peak == 2
+    assert queue.running == 0 and queue.num_waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_priority_then_material_turns():
+    """Test that waiting jobs start by priority and take turns across materials."""
+    queue = LLMJobQueue(max_concurrency=1)
+    started = []
+    release = asyncio.Event()
+
+    # Occupy the only slot so every other job has to wait
+    blocker = asyncio.create_task(queue.run(recording_job(started, "blocker", release)))
+    await asyncio.sleep(0)
+
+    jobs = [
+        ("a1", JobPriority.BACKFILL, "a"),
+        ("a2", JobPriority.BACKFILL, "a"),
+        ("a3", JobPriority.BACKFILL, "a"),
+        ("b1", JobPriority.BACKFILL, "b"),
+        ("r1", JobPriority.REGENERATION, "c"),
+        ("i1", JobPriority.INTERACTIVE, "d"),
+        ("r2", JobPriority.REGENERATION, "c"),
+    ]
+    tasks = [
+        asyncio.create_task(queue.run(recording_job(started, name), priority, material_id))
+        for name, priority, material_id in jobs
+    ]
+    await asyncio.sleep(0)
+    assert queue.num_waiting == len(jobs)
+
+    release.set()
+    await asyncio.gather(blocker, *tasks)
+    assert started == ["blocker", "i1", "r1", "r2", "a1", "b1", "a2", "a3"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiting_job_is_skipped():
+    """Test that a job cancelled while waiting never starts and doesn't hold a slot."""
+    queue = LLMJobQueue(max_concurrency=1)
+    started = []
+    release = asyncio.Event()
+
+    blocker = asyncio.create_task(queue.run(recording_job(started, "blocker", release)))
+    await asyncio.sleep(0)
+    cancelled = asyncio.create_task(queue.run(recording_job(started, "cancelled")))
+    waiting = asyncio.create_task(queue.run(recording_job(started, "waiting")))
+    await asyncio.sleep(0)
+
+    cancelled.cancel()
+    release.set()
+    await asyncio.gather(blocker, waiting)
+
+    assert started == ["blocker", "waiting"]
+    assert queue.running == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_job_releases_slot():
+    """Test that a failing job passes its error on and frees its slot."""
+    queue = LLMJobQueue(max_concurrency=1)
+
+    async def failing_job():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await queue.run(failing_job)
+    assert queue.running == 0
+    assert await queue.run(recording_job([], "next")) == "next"
+
+
+def test_jobs_of_concurrent_event_loops_share_the_cap():
+    """Test that loops of different threads wait for each other without losing jobs."""
+    queue = LLMJobQueue(max_concurrency=1)
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+    results = {}
+
+    async def job():
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        with lock:
+            running -= 1
+        return True
+
+    async def session(name: str):
+        jobs = (queue.run(job, material_id=name) for _ in range(3))
+        results[name] = await asyncio.wait_for(asyncio.gather(*jobs), timeout=5)
+
+    threads = [threading.Thread(target=asyncio.run, args=(session(name),)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"a": [True] * 3, "b": [True] * 3}
+    assert peak == 1
+    assert queue.running == 0 and queue.num_waiting == 0
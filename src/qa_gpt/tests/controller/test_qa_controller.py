@@ -0,0 +1,256 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from pydantic import BaseModel
+
+from src.qa_gpt.core.controller.qa_controller import QAController
+from src.qa_gpt.core.objects.questions import (
+    Choice,
+    MultipleChoiceQuestion,
+    MultipleChoiceQuestionSet,
+)
+from src.qa_gpt.core.objects.summaries import MetaDataSummary
+
+
+def make_question_set(label: str) -> MultipleChoiceQuestionSet:
+    choice = Choice(choice_description=label, answer=True, explanation=label)
+    question = MultipleChoiceQuestion(
+        question_description=label,
+        choice_1=choice,
+        choice_2=choice,
+        choice_3=choice,
+        choice_4=choice,
+    )
+    return MultipleChoiceQuestionSet(
+        question_1=question,
+        question_2=question,
+        question_3=question,
+        question_4=question,
+        question_5=question,
+    )
+
+
+@pytest.fixture
+def qa_controller():
+    controller = QAController()
+    controller.get_material_text = AsyncMock(
+        side_effect=lambda file_id, query, **_: f"{query} clip"
+    )
+    return controller
+
+
+@pytest.mark.asyncio
+async def test_question_requests_share_a_prompt_prefix(qa_controller):
+    """Test that question requests of a material differ only after the system prompt and paper."""
+    paper = "A long paper. " * 5000
+
+    messages = [
+        await qa_controller.build_question_messages("file1", field_name, field_value, paper)
+        for field_name, field_value in [("motivation", "short"), ("conclusion", "long " * 3000)]
+    ]
+
+    # The paper is cut to the same fixed budget regardless of the field parts
+    assert messages[0][:2] == messages[1][:2]
+    assert messages[0][1]["content"].startswith("Paper Context:")
+    assert "Motivation:" in messages[0][2]["content"]
+    assert "Conclusion:" in messages[1][2]["content"]
+
+
+@pytest.fixture
+def mock_summary_classes():
+    class NoteSummary(BaseModel):
+        note: str
+
+        @classmethod
+        def prompt(cls):
+            return "Write a note."
+
+        @classmethod
+        def get_rag_key_words(cls):
+            return ["note"]
+
+    return MetaDataSummary, NoteSummary
+
+
+@pytest.mark.asyncio
+async def test_get_questions_batch_multiplexes_groups(qa_controller):
+    """Test that fields of the same file and group share one request and are split back."""
+
+    async def respond(messages, res_obj, route_key=None):
+        if res_obj is MultipleChoiceQuestionSet:
+            return make_question_set("conclusion")  # The only field of its group
+        field_names = list(res_obj.model_fields)
+        return res_obj(**{name: make_question_set(name) for name in field_names})
+
+    with patch(
+        "src.qa_gpt.core.controller.qa_controller.get_chat_gpt_response_structure_async",
+        side_effect=respond,
+    ) as mock_response:
+        results = await qa_controller.get_questions_batch(
+            ["file1", "file1", "file1"],
+            ["motivation", "conclusion", "subject"],
+            ["value 1", "value 2", "value 3"],
+            ["paper", "paper", "paper"],
+            groups=["StandardSummary", "TechnicalSummary", "StandardSummary"],
+        )
+
+    assert [result.question_1.question_description for result in results] == [
+        "motivation",
+        "conclusion",
+        "subject",
+    ]
+    assert mock_response.call_count == 2
+    assert (
+        mock_response.call_args_list[0].kwargs["route_key"]
+        == (MultipleChoiceQuestionSet.__name__,) * 2
+    )
+    multiplexed_messages = mock_response.call_args_list[0].args[0]
+    multiplexed_prompt = multiplexed_messages[-1]["content"]
+    assert "".join(message["content"] for message in multiplexed_messages).count("paper") == 1
+    assert "motivation clip" in multiplexed_prompt and "subject clip" in multiplexed_prompt
+
+
+@pytest.mark.asyncio
+async def test_get_questions_batch_falls_back_to_single_fields(qa_controller):
+    """Test that a failed multiplexed request is retried one field at a time."""
+
+    async def respond(messages, res_obj, route_key=None):
+        if res_obj is not MultipleChoiceQuestionSet:
+            raise ValueError("Truncated structured output")
+        field_name = "motivation" if "Motivation:" in messages[-1]["content"] else "conclusion"
+        return make_question_set(field_name)
+
+    with patch(
+        "src.qa_gpt.core.controller.qa_controller.get_chat_gpt_response_structure_async",
+        side_effect=respond,
+    ) as mock_response:
+        results = await qa_controller.get_questions_batch(
+            ["file1", "file1"],
+            ["motivation", "conclusion"],
+            ["value 1", "value 2"],
+            groups=["StandardSummary", "StandardSummary"],
+        )
+
+    assert [result.question_1.question_description for result in results] == [
+        "motivation",
+        "conclusion",
+    ]
+    assert mock_response.call_count == 3
+
+
+def make_metadata(title: str) -> MetaDataSummary:
+    return MetaDataSummary(
+        paper_title=title, authors="Author", journal_name="Journal", publication_date="2024"
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_summaries_batch_combines_summary_types(qa_controller, mock_summary_classes):
+    """Test that summaries of a file come from one composite response as their own classes."""
+    first_class, second_class = mock_summary_classes
+
+    async def respond(messages, res_obj, route_key=None):
+        assert list(res_obj.model_fields) == [first_class.__name__, second_class.__name__]
+        return res_obj(
+            **{
+                first_class.__name__: make_metadata("first"),
+                second_class.__name__: second_class(note="second"),
+            }
+        )
+
+    with patch(
+        "src.qa_gpt.core.controller.qa_controller.get_chat_gpt_response_structure_async",
+        side_effect=respond,
+    ) as mock_response:
+        results = await qa_controller.get_summaries_batch(
+            ["file1", "file1"],
+            [first_class, second_class],
+            ["paper", "paper"],
+            combine=True,
+        )
+
+    assert mock_response.call_count == 1
+    assert mock_response.call_args.kwargs["route_key"] == ("MetaDataSummary", "NoteSummary")
+    assert type(results[0]) is first_class and results[0].paper_title == "first"
+    assert type(results[1]) is second_class and results[1].note == "second"
+    prompt = mock_response.call_args.args[0]
+    assert prompt[1]["content"].count("paper") == 1
+    assert "Instructions for MetaDataSummary" in prompt[0]["content"]
+
+
+@pytest.mark.asyncio
+async def test_get_summaries_batch_combined_falls_back(qa_controller, mock_summary_classes):
+    """Test that a failed combined request is retried one summary type at a time."""
+    first_class, second_class = mock_summary_classes
+
+    async def respond(messages, res_obj, route_key=None):
+        if res_obj is first_class:
+            return make_metadata("first")
+        if res_obj is second_class:
+            return second_class(note="second")
+        raise ValueError("Response exceeded the completion limit")
+
+    with patch(
+        "src.qa_gpt.core.controller.qa_controller.get_chat_gpt_response_structure_async",
+        side_effect=respond,
+    ) as mock_response:
+        results = await qa_controller.get_summaries_batch(
+            ["file1", "file1"], [first_class, second_class], combine=True
+        )
+
+    assert mock_response.call_count == 3
+    assert results[0].paper_title == "first" and results[1].note == "second"
+
+
+@pytest.mark.asyncio
+async def test_get_questions_batch_isolates_failures(qa_controller):
+    """Test that a failed field leaves the results of the other fields intact."""
+    stored = {}
+
+    async def respond(messages, res_obj, route_key=None):
+        if "Conclusion:" in messages[-1]["content"]:
+            raise ValueError("Server error")
+        return make_question_set("motivation")
+
+    with patch(
+        "src.qa_gpt.core.controller.qa_controller.get_chat_gpt_response_structure_async",
+        side_effect=respond,
+    ):
+        results = await qa_controller.get_questions_batch(
+            ["file1", "file1"],
+            ["motivation", "conclusion"],
+            ["value 1", "value 2"],
+            on_result=stored.__setitem__,
+        )
+
+    assert results[0].question_1.question_description == "motivation"
+    assert isinstance(results[1], ValueError)
+    assert stored == {0: results[0], 1: results[1]}
+
+
+@pytest.mark.asyncio
+async def test_get_questions_batch_isolates_on_result_errors(qa_controller):
+    """Test that a failure to store one result becomes its error and others are still stored."""
+    stored = {}
+
+    def store(position, result):
+        if position == 0:
+            raise OSError("Disk full")
+        stored[position] = result
+
+    async def respond(messages, res_obj, route_key=None):
+        return make_question_set("question")
+
+    with patch(
+        "src.qa_gpt.core.controller.qa_controller.get_chat_gpt_response_structure_async",
+        side_effect=respond,
+    ):
+        results = await qa_controller.get_questions_batch(
+            ["file1", "file1"],
+            ["motivation", "conclusion"],
+            ["value 1", "value 2"],
+            on_result=store,
+        )
+
+    assert isinstance(results[0], OSError)
+    assert stored == {1: results[1]}
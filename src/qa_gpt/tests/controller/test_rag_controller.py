@@ -1,10 +1,16 @@
+import asyncio
 import tempfile
+import time
 from pathlib import Path
+from unittest.mock import patch
 
 import numpy as np
 import pytest
 
 from src.qa_gpt.core.controller.rag_controller import RAGController
+from src.qa_gpt.core.controller.rag_index_pool import rag_index_pool
+from src.qa_gpt.core.controller.rag_query_cache import rag_query_cache
+from src.qa_gpt.core.utils.context_assembler import sentence_index_file_id
 
 
 @pytest.fixture
@@ -150,8 +156,8 @@ def test_persistence(temp_rag_folder, test_file_id):
     # Add some test data
     test_vectors = np.random.rand(5, 384).astype(np.float32)
     test_texts = ["text1", "text2", "text3", "text4", "text5"]
-    controller1.add_vectors(test_vectors)
-    controller1.add_texts(test_texts)
+    vector_ids = controller1.add_vectors(test_vectors)
+    text_ids = controller1.add_texts(test_texts)
 
     # Save state
     controller1.save_state(controller1.state_path)
@@ -167,8 +173,8 @@ def test_persistence(temp_rag_folder, test_file_id):
 
     # Verify vectors and texts match
     for i in range(5):
-        assert np.array_equal(controller2.get_vector_by_index(i), test_vectors[i])
-        assert controller2.get_text_by_index(i) == test_texts[i]
+        assert np.array_equal(controller2.get_vector_by_index(vector_ids[i]), test_vectors[i])
+        assert controller2.get_text_by_index(text_ids[i]) == test_texts[i]
 
 
 def test_gpu_detection(temp_rag_folder, test_file_id):
@@ -215,7 +221,7 @@ def test_add_texts(temp_rag_folder, test_file_id):
     # Check if texts were added
     assert rag_controller.index.ntotal == 3
     assert len(rag_controller.text_store) == 3
-    assert rag_controller.text_store == texts
+    assert list(rag_controller.text_store.values()) == texts
 
 
 def test_search_text(temp_rag_folder, test_file_id):
@@ -298,3 +304,494 @@ def test_empty_text_search(temp_rag_folder, test_file_id):
 
     results = rag_controller.search_text("test query", k=5)
     assert len(results) == 0
+
+
+def test_text_metadata_persistence(temp_rag_folder, test_file_id):
+    """Test that text metadata like parent section pointers is stored and persisted."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.add_texts(
+        ["chunk of section 0", "chunk of section 1"],
+        metadatas=[{"section_index": 0}, {"section_index": 1}],
+    )
+    controller.add_texts(["text without metadata"])
+    controller.save_state(controller.state_path)
+
+    loaded_controller = RAGController.from_file_id(
+        test_file_id, rag_state_folder_path=str(temp_rag_folder)
+    )
+    assert loaded_controller.get_metadata_by_index(1) == {"section_index": 1}
+    assert loaded_controller.get_metadata_by_index(2) == {}
+
+    with pytest.raises(ValueError):
+        controller.add_texts(["text"], metadatas=[])
+
+
+def test_stable_ids(temp_rag_folder, test_file_id):
+    """Test that IDs are stable across removals and reloads."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    ids = controller.add_texts(["text0", "text1", "text2"])
+    assert ids == [0, 1, 2]
+
+    controller.remove_texts([1])
+    new_ids = controller.add_texts(["text3"])
+    assert new_ids == [3]  # Removed IDs are never reused
+    controller.save_state(controller.state_path)
+
+    loaded_controller = RAGController.from_file_id(
+        test_file_id, rag_state_folder_path=str(temp_rag_folder)
+    )
+    assert loaded_controller.get_text_by_index(2) == "text2"
+    assert loaded_controller.get_text_by_index(3) == "text3"
+    assert loaded_controller.add_texts(["text4"]) == [4]
+
+    with pytest.raises(ValueError):
+        loaded_controller.add_texts(["duplicate"], ids=[0])
+
+
+def test_invalid_ids_are_rejected_before_changes(temp_rag_folder, test_file_id):
+    """Test that negative and non-integer IDs are rejected before anything is saved."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.add_texts(["text0"])
+
+    for ids in ([-5], [1.5], ["1"], [2**64]):
+        with pytest.raises(ValueError):
+            controller.add_texts(["invalid"], ids=ids)
+    with pytest.raises(ValueError):
+        controller.upsert([0, -1], ["text0 updated", "invalid"])
+
+    assert controller.index.ntotal == 1
+    assert not controller._dirty
+    loaded_controller = RAGController.load_state(controller.state_path)
+    assert loaded_controller.get_text_by_index(0) == "text0"
+    assert loaded_controller.add_texts(["text1"], ids=[np.int64(7)]) == [7]
+
+
+def test_remove_texts(temp_rag_folder, test_file_id):
+    """Test removing texts from the vector store."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    vectors = np.eye(4, 384, dtype=np.float32)
+    ids = controller.add_vectors(vectors, texts=["a", "b", "c", "d"])
+
+    assert controller.remove_texts([ids[0], 12345]) == 1
+    with pytest.raises(IndexError):
+        controller.get_text_by_index(ids[0])
+    with pytest.raises(IndexError):
+        controller.get_vector_by_index(ids[0])
+
+    # The removed vector is never returned, even though it is the exact match
+    results = controller.search(vectors[0], k=4)
+    assert len(results) == 3
+    assert ids[0] not in [id_ for id_, _ in results]
+
+
+def test_upsert(temp_rag_folder, test_file_id):
+    """Test replacing texts under existing IDs."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.add_texts(["old text", "kept text"], metadatas=[{"version": 1}, {"version": 1}])
+
+    assert controller.upsert([0, 7], ["new text", "inserted text"], [{"version": 2}, {}]) == [0, 7]
+    assert controller.get_text_by_index(0) == "new text"
+    assert controller.get_metadata_by_index(0) == {"version": 2}
+    assert controller.get_text_by_index(1) == "kept text"
+    assert controller.get_text_by_index(7) == "inserted text"
+    assert len(controller.search_text("new text", k=10)) == 3
+
+
+def test_compact(temp_rag_folder, test_file_id):
+    """Test that compaction drops removed vectors and keeps IDs."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.compact_ratio = 1.0  # Disable automatic compaction
+    vectors = np.random.rand(10, 384).astype(np.float32)
+    ids = controller.add_vectors(vectors)
+    controller.remove_texts(ids[:5])
+    assert controller.index.ntotal == 10
+
+    controller.compact()
+    assert controller.index.ntotal == 5
+    for i in range(5, 10):
+        np.testing.assert_array_almost_equal(controller.get_vector_by_index(ids[i]), vectors[i])
+
+
+def test_load_legacy_state(temp_rag_folder, test_file_id):
+    """Test loading a state saved with positional IDs and a plain flat index."""
+    import pickle
+
+    import faiss
+
+    temp_rag_folder.mkdir(exist_ok=True)
+    vectors = np.random.rand(2, 384).astype(np.float32)
+    legacy_index = faiss.IndexFlatL2(384)
+    legacy_index.add(vectors)
+    faiss.write_index(legacy_index, str(temp_rag_folder / f"{test_file_id}_rag_index.pkl"))
+    with open(temp_rag_folder / f"{test_file_id}_rag_state.pkl", "wb") as f:
+        pickle.dump(
+            {
+                "text_store": ["first", "second"],
+                "model_name": "all-MiniLM-L6-v2",
+                "file_id": test_file_id,
+                "rag_state_folder_path": str(temp_rag_folder),
+            },
+            f,
+        )
+
+    controller = RAGController.from_file_id(
+        test_file_id, rag_state_folder_path=str(temp_rag_folder)
+    )
+    assert controller.get_text_by_index(1) == "second"
+    np.testing.assert_array_almost_equal(controller.get_vector_by_index(1), vectors[1])
+    assert controller.add_texts(["third"]) == [2]
+
+    # The pickled texts were moved into the text store
+    with open(temp_rag_folder / f"{test_file_id}_rag_state.pkl", "rb") as f:
+        assert "text_store" not in pickle.load(f)
+    reloaded = RAGController.from_file_id(
+        test_file_id, rag_state_folder_path=str(temp_rag_folder), use_pool=False
+    )
+    assert [reloaded.get_text_by_index(i) for i in range(3)] == ["first", "second", "third"]
+
+
+def test_bulk_defers_persistence(temp_rag_folder, test_file_id):
+    """Test that a bulk session writes the index once at its end."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.flush()
+
+    with patch.object(controller, "_save_index", wraps=controller._save_index) as mock_save:
+        with controller.bulk():
+            for i in range(5):
+                controller.add_texts([f"text {i}"])
+            assert mock_save.call_count == 0
+        assert mock_save.call_count == 1
+
+        # Saving the state afterwards doesn't rewrite the unchanged index
+        controller.save_state(controller.state_path)
+        assert mock_save.call_count == 1
+
+    loaded_controller = RAGController.from_file_id(
+        test_file_id, rag_state_folder_path=str(temp_rag_folder)
+    )
+    assert loaded_controller.index.ntotal == 5
+    assert loaded_controller.get_text_by_index(4) == "text 4"
+
+
+def test_bulk_flush_threshold(temp_rag_folder, test_file_id):
+    """Test that a bulk session flushes when the change threshold is hit."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.flush_every_n_changes = 2
+
+    with patch.object(controller, "flush", wraps=controller.flush) as mock_flush:
+        with controller.bulk():
+            controller.add_texts(["text 0"])
+            assert mock_flush.call_count == 0
+            controller.add_texts(["text 1"])
+            assert mock_flush.call_count == 1
+        assert mock_flush.call_count == 2
+
+
+def test_bulk_does_not_flush_on_error(temp_rag_folder, test_file_id):
+    """Test that a failed bulk session leaves nothing persisted."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+
+    with pytest.raises(RuntimeError):
+        with controller.bulk():
+            controller.add_texts(["text 0"])
+            raise RuntimeError("Test error")
+
+    assert not controller.state_path.exists()
+    assert not controller.index_path.exists()
+
+
+def test_atomic_index_write(temp_rag_folder, test_file_id):
+    """Test that index and state are written without leaving temporary files."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.add_texts(["text 0"])
+
+    assert controller.index_path.exists()
+    assert controller.state_path.exists()
+    assert not list(temp_rag_folder.glob("*.tmp"))
+
+
+def test_failed_flush_keeps_changes(temp_rag_folder, test_file_id):
+    """Test that a failed index write raises and the changes are saved by the next flush."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    with controller.bulk():
+        controller.add_texts(["text 0"])
+        with patch("faiss.write_index", side_effect=RuntimeError("Disk full")):
+            with pytest.raises(RuntimeError):
+                controller.flush()
+        assert controller._dirty
+        assert not controller.state_path.exists()
+
+    loaded_controller = RAGController.load_state(controller.state_path)
+    assert loaded_controller.get_text_by_index(0) == "text 0"
+
+
+def test_incremental_changes_are_journaled(temp_rag_folder, test_file_id):
+    """Test that single changes append to the journal instead of rewriting the state file."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.add_texts(["text 0", "text 1"])
+    state_bytes = controller.state_path.read_bytes()
+
+    controller.add_texts(["text 2"])
+    controller.upsert([0], ["text 0 updated"])
+    controller.remove_texts([1])
+
+    assert controller.state_path.read_bytes() == state_bytes
+    loaded_controller = RAGController.load_state(controller.state_path)
+    assert loaded_controller.id_to_label == controller.id_to_label
+    assert loaded_controller.index_version == controller.index_version
+    assert loaded_controller.search_text("text 0 updated", k=1)[0][0] == "text 0 updated"
+    assert loaded_controller.add_texts(["text 3"]) == [3]
+
+    # An explicit save folds the journal into a self-contained state file
+    loaded_controller.save_state(loaded_controller.state_path)
+    assert not loaded_controller.state_path.with_suffix(".journal").exists()
+    assert RAGController.load_state(controller.state_path).id_to_label == (
+        loaded_controller.id_to_label
+    )
+
+
+def test_from_file_id_uses_pool(temp_rag_folder, test_file_id):
+    """Test that repeated loads of a file are served from the index pool."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.add_texts(["text 0", "text 1"])
+
+    with patch.object(RAGController, "load_state", wraps=RAGController.load_state) as mock_load:
+        first = RAGController.from_file_id(test_file_id, rag_state_folder_path=str(temp_rag_folder))
+        second = RAGController.from_file_id(
+            test_file_id, rag_state_folder_path=str(temp_rag_folder)
+        )
+        assert first is second
+        assert mock_load.call_count == 1
+
+    # Rewriting the index through another controller invalidates the pooled one
+    controller.add_texts(["text 2"])
+    third = RAGController.from_file_id(test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    assert third is not first
+    assert third.get_text_by_index(2) == "text 2"
+
+
+def test_pooled_controller_sees_changes_of_other_processes(temp_rag_folder, test_file_id):
+    """Test that a pooled controller is reloaded after another process saved changes."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.add_texts(["text 0", "text 1"])
+    pooled = RAGController.from_file_id(test_file_id, rag_state_folder_path=str(temp_rag_folder))
+
+    # A writer in another process can't reach the pool of this one
+    writer = RAGController.load_state(controller.state_path)
+    with patch.object(rag_index_pool, "peek", return_value=None):
+        for round_ in range(3):
+            writer.upsert([0, 1], [f"text 0 round {round_}", f"text 1 round {round_}"])
+            reloaded = RAGController.from_file_id(
+                test_file_id, rag_state_folder_path=str(temp_rag_folder)
+            )
+            assert reloaded is not pooled
+            assert reloaded.get_text_by_index(0) == f"text 0 round {round_}"
+            pooled = reloaded
+
+    assert (
+        RAGController.from_file_id(test_file_id, rag_state_folder_path=str(temp_rag_folder))
+        is pooled
+    )
+
+
+def test_mmap_index_copy_on_write(temp_rag_folder, test_file_id):
+    """Test that a memory-mapped index is copied before it is changed."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    vectors = np.random.rand(3, 384).astype(np.float32)
+    controller.add_vectors(vectors)
+
+    mapped_controller = RAGController.load_state(controller.state_path, mmap_index=True)
+    np.testing.assert_array_almost_equal(mapped_controller.get_vector_by_index(1), vectors[1])
+    assert mapped_controller.search(vectors[2], k=1)[0][0] == 2
+
+    # Mapped vectors don't count towards the memory of the controller until they are copied
+    loaded_controller = RAGController.load_state(controller.state_path)
+    assert mapped_controller._index_is_mapped
+    assert mapped_controller.memory_bytes() == loaded_controller.memory_bytes() - 3 * 384 * 4
+
+    mapped_controller.add_vectors(np.random.rand(1, 384).astype(np.float32))
+    assert mapped_controller.index.ntotal == 4
+    np.testing.assert_array_almost_equal(mapped_controller.get_vector_by_index(1), vectors[1])
+    assert mapped_controller.memory_bytes() > loaded_controller.memory_bytes()
+
+
+def test_search_text_query_cache(temp_rag_folder, test_file_id):
+    """Test that repeated searches are served from the query cache until the index changes."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.add_texts(["Neural networks learn features.", "Graphs have nodes."])
+    rag_query_cache.clear()
+
+    first = controller.search_text("neural networks", k=1)
+    with patch.object(controller.embedding_backend, "encode") as mock_encode:
+        second = controller.search_text("neural networks", k=1)
+        mock_encode.assert_not_called()
+
+    assert second == first
+    assert rag_query_cache.hits == 1
+    assert rag_query_cache.misses == 1
+
+    # A change bumps the index version, so the next search misses
+    controller.add_texts(["Neural networks neural networks."])
+    controller.search_text("neural networks", k=1)
+    assert rag_query_cache.misses == 2
+
+    # A freshly loaded controller of the same version shares the cached results
+    loaded = RAGController.from_file_id(
+        test_file_id, rag_state_folder_path=str(temp_rag_folder), use_pool=False
+    )
+    assert loaded.index_version == controller.index_version
+    loaded.search_text("neural networks", k=1)
+    assert rag_query_cache.hits == 2
+
+
+def test_search_query_cache(temp_rag_folder, test_file_id):
+    """Test that vector searches are cached per query vector and k."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    vectors = np.random.rand(3, controller.dimension).astype("float32")
+    controller.add_vectors(vectors)
+    rag_query_cache.clear()
+
+    first = controller.search(vectors[0], k=2)
+    assert controller.search(vectors[0], k=2) == first
+    controller.search(vectors[0], k=1)
+    controller.search(vectors[1], k=2)
+
+    assert rag_query_cache.hits == 1
+    assert rag_query_cache.misses == 3
+
+
+def test_rebuilt_index_does_not_reuse_cache(temp_rag_folder, test_file_id):
+    """Test that an index rebuilt from scratch to the same version doesn't hit old results."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.add_texts(["Old text about physics."])
+    controller.search_text("physics", k=1)
+
+    controller.index_path.unlink()
+    controller.state_path.unlink()
+    rebuilt = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    rebuilt.add_texts(["New text about physics."])
+
+    assert rebuilt.index_version == controller.index_version
+    assert rebuilt.search_text("physics", k=1)[0][0] == "New text about physics."
+
+
+def test_flush_drops_stale_context_pack(temp_rag_folder, test_file_id):
+    """Test that changing the index removes the context pack precomputed from it."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.add_texts(["First text."])
+    controller.context_pack_path.write_text("{}")
+
+    controller.add_texts(["Second text."])
+
+    assert not controller.context_pack_path.exists()
+
+
+@pytest.mark.asyncio
+async def test_aretrieve_does_not_block_event_loop(temp_rag_folder, test_file_id):
+    """Test that retrieval runs off the event loop while other coroutines keep running."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.add_texts(["The quick brown fox jumps over the lazy dog"])
+
+    def slow_search_text(self, query_text, k=5):
+        time.sleep(0.3)
+        return [("slow result", 0.0)]
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker_task = asyncio.create_task(ticker())
+    with patch.object(RAGController, "search_text", slow_search_text):
+        results = await RAGController.aretrieve(
+            test_file_id, "fox", k=1, rag_state_folder_path=str(temp_rag_folder)
+        )
+    ticker_task.cancel()
+
+    assert results == [("slow result", 0.0)]
+    assert ticks > 10  # The event loop kept running during the blocking search
+
+
+@pytest.mark.asyncio
+async def test_asearch_text(temp_rag_folder, test_file_id):
+    """Test that async search returns the same results as sync search."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.add_texts(["The quick brown fox", "All that glitters is not gold"])
+
+    assert await controller.asearch_text("fox", k=2) == controller.search_text("fox", k=2)
+
+
+@pytest.mark.asyncio
+async def test_aretrieve_context(temp_rag_folder, test_file_id):
+    """Test that sentence hits are expanded within their parent section."""
+    controller = RAGController(
+        file_id=sentence_index_file_id(test_file_id), rag_state_folder_path=str(temp_rag_folder)
+    )
+    controller.add_texts(
+        ["Transformers use attention.", "Attention weighs tokens.", "Graphs have nodes."],
+        metadatas=[
+            {"section_index": 0, "section_title": "Method"},
+            {"section_index": 0, "section_title": "Method"},
+            {"section_index": 1, "section_title": "Related Work"},
+        ],
+    )
+
+    context = await RAGController.aretrieve_context(
+        test_file_id, "transformers", k=1, token_budget=20, rag_state_folder_path=temp_rag_folder
+    )
+
+    assert (
+        context == "Section: Method\nContent: Transformers use attention. Attention weighs tokens."
+    )
+
+
+@pytest.mark.asyncio
+async def test_aretrieve_context_without_sentence_index(temp_rag_folder, test_file_id):
+    """Test that a missing sentence index raises so callers can fall back to chunks."""
+    temp_rag_folder.mkdir(exist_ok=True)
+    with pytest.raises(ValueError):
+        await RAGController.aretrieve_context(
+            test_file_id, "query", k=1, token_budget=20, rag_state_folder_path=temp_rag_folder
+        )
+
+
+def test_trained_index_factory(temp_rag_folder, test_file_id):
+    """Test that a trained index type is trained on the first vectors and kept on reload."""
+    controller = RAGController(
+        file_id=test_file_id,
+        rag_state_folder_path=str(temp_rag_folder),
+        index_factory="IVF4,Flat",
+    )
+    vectors = np.random.rand(200, controller.dimension).astype("float32")
+    ids = controller.add_vectors(vectors)
+    assert controller.index.is_trained
+    assert controller.search(vectors[7], k=1)[0][0] == ids[7]
+
+    # The state remembers the index type, so a rebuild after removals trains a new IVF index
+    controller.save_state(controller.state_path)
+    loaded_controller = RAGController.load_state(controller.state_path)
+    assert loaded_controller.index_factory == "IVF4,Flat"
+    loaded_controller.remove_texts(ids[:100])
+    assert loaded_controller.index.ntotal == 100
+    assert loaded_controller.index.is_trained
+
+
+def test_trained_index_factory_with_few_vectors(temp_rag_folder, test_file_id):
+    """Test that an index with fewer vectors than IVF lists falls back to exact search."""
+    controller = RAGController(
+        file_id=test_file_id,
+        rag_state_folder_path=str(temp_rag_folder),
+        index_factory="IVF64,Flat",
+    )
+    ids = controller.add_texts(["Neural networks learn features.", "Graphs have nodes."])
+
+    assert controller.index.is_trained
+    assert controller.search_text("Graphs have nodes.", k=1)[0][0] == "Graphs have nodes."
+    loaded_controller = RAGController.load_state(controller.state_path)
+    assert loaded_controller.search_text("Graphs have nodes.", k=1)[0][0] == "Graphs have nodes."
+    loaded_controller.remove_texts(ids[:1])
+    loaded_controller.compact()
+    assert loaded_controller.index.ntotal == 1
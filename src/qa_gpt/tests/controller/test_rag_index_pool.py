@@ -0,0 +1,90 @@
+from pathlib import Path
+
+import pytest
+
+from src.qa_gpt.core.controller.rag_index_pool import RAGIndexPool
+
+
+class FakeController:
+    def __init__(self, size: int):
+        self.size = size
+
+    def memory_bytes(self) -> int:
+        return self.size
+
+
+@pytest.fixture
+def pool():
+    return RAGIndexPool(max_bytes=100)
+
+
+def test_get_loads_once(pool, tmp_path):
+    """Test that a pooled controller is loaded once and then served from the pool."""
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return FakeController(10)
+
+    first = pool.get("file1", tmp_path, loader)
+    second = pool.get("file1", tmp_path, loader)
+
+    assert first is second
+    assert len(loads) == 1
+    assert pool.hits == 1
+    assert pool.misses == 1
+
+
+def test_keys_include_folder(pool, tmp_path):
+    """Test that the same file ID in different folders gets different entries."""
+    first = pool.get("file1", tmp_path / "a", lambda: FakeController(10))
+    second = pool.get("file1", tmp_path / "b", lambda: FakeController(10))
+
+    assert first is not second
+    assert len(pool) == 2
+
+
+def test_lru_eviction(pool, tmp_path):
+    """Test that least recently used entries are evicted over the memory budget."""
+    pool.get("file1", tmp_path, lambda: FakeController(40))
+    pool.get("file2", tmp_path, lambda: FakeController(40))
+    pool.get("file1", tmp_path, lambda: FakeController(40))  # file1 is now most recently used
+    pool.get("file3", tmp_path, lambda: FakeController(40))
+
+    assert pool.peek("file1", tmp_path) is not None
+    assert pool.peek("file2", tmp_path) is None
+    assert pool.peek("file3", tmp_path) is not None
+    assert pool.evictions == 1
+    assert pool.total_bytes == 80
+
+
+def test_oversized_entry_is_kept(pool, tmp_path):
+    """Test that the most recent entry is kept even if it alone exceeds the budget."""
+    controller = pool.get("file1", tmp_path, lambda: FakeController(1000))
+
+    assert pool.peek("file1", tmp_path) is controller
+
+
+def test_invalidate(pool, tmp_path):
+    """Test that an invalidated entry is reloaded on the next get."""
+    first = pool.get("file1", Path(tmp_path), lambda: FakeController(10))
+    pool.invalidate("file1", str(tmp_path))
+    second = pool.get("file1", tmp_path, lambda: FakeController(10))
+
+    assert first is not second
+    assert pool.misses == 2
+
+
+def test_stale_entry_is_reloaded(pool, tmp_path):
+    """Test that an entry failing the freshness check is replaced by a reloaded one."""
+    stale = pool.get("file1", tmp_path, lambda: FakeController(10))
+    fresh = pool.get(
+        "file1",
+        tmp_path,
+        lambda: FakeController(10),
+        is_current=lambda controller: controller is not stale,
+    )
+
+    assert fresh is not stale
+    assert pool.peek("file1", tmp_path) is fresh
+    assert pool.misses == 2
@@ -0,0 +1,167 @@
+import tempfile
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from src.qa_gpt.core.controller.rag_controller import RAGController
+from src.qa_gpt.core.controller.rag_migration_controller import RAGMigrationController
+from src.qa_gpt.core.utils.rag_pointer_utils import rag_file_lock, read_rag_pointer
+
+TARGET_MODEL = "paraphrase-MiniLM-L3-v2"
+
+
+@pytest.fixture
+def temp_rag_folder():
+    """Create a temporary folder for RAG state files."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        yield Path(tmp_dir)
+
+
+@pytest.fixture
+def test_file_id():
+    return "test_file_123"
+
+
+@pytest.fixture
+def live_controller(temp_rag_folder, test_file_id):
+    """Create a saved generation 0 index with a removed entry."""
+    controller = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    controller.add_texts(
+        ["Neural networks learn features.", "Graphs have nodes.", "Removed text."],
+        metadatas=[{"section_index": 0}, {"section_index": 1}, {"section_index": 2}],
+    )
+    controller.remove_texts([2])
+    return controller
+
+
+def test_migrate_file(temp_rag_folder, test_file_id, live_controller):
+    """Test that a migration builds a new generation and flips the pointer to it."""
+    pooled = RAGController.from_file_id(test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    migration = RAGMigrationController(TARGET_MODEL, rag_state_folder_path=str(temp_rag_folder))
+
+    state_path = migration.migrate_file(test_file_id)
+
+    assert state_path == temp_rag_folder / f"{test_file_id}.g1_rag_state.pkl"
+    assert read_rag_pointer(test_file_id, temp_rag_folder)["model_name"] == TARGET_MODEL
+
+    migrated = RAGController.from_file_id(test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    assert migrated is not pooled
+    assert migrated.model_name == TARGET_MODEL
+    assert migrated.generation == 1
+    assert migrated.get_text_by_index(1) == "Graphs have nodes."
+    assert migrated.get_metadata_by_index(1) == {"section_index": 1}
+    assert 2 not in migrated.text_store
+    assert migrated.add_texts(["New text."]) == [3]
+
+    # The previous generation is kept for readers that loaded it before the flip
+    assert live_controller.state_path.exists()
+    assert not migration.needs_migration(test_file_id)
+    assert migration.migrate_file(test_file_id) is None
+
+
+def test_rebuild_after_migration_uses_migrated_model(
+    temp_rag_folder, test_file_id, live_controller
+):
+    """Test that an index built for a migrated file embeds with the model of its pointer."""
+    RAGMigrationController(TARGET_MODEL, rag_state_folder_path=str(temp_rag_folder)).migrate_file(
+        test_file_id
+    )
+
+    rebuilt = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    assert rebuilt.generation == 1
+    assert rebuilt.model_name == TARGET_MODEL
+    rebuilt.add_texts(["Rebuilt text."])
+
+    reloaded = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    assert reloaded.model_name == TARGET_MODEL
+    assert reloaded.search_text("Rebuilt text.", k=1)[0][0] == "Rebuilt text."
+
+
+def test_migration_removes_older_generations(temp_rag_folder, test_file_id, live_controller):
+    """Test that a second migration removes the generation before the previous one."""
+    RAGMigrationController(TARGET_MODEL, rag_state_folder_path=str(temp_rag_folder)).migrate_file(
+        test_file_id
+    )
+    RAGMigrationController(
+        "all-MiniLM-L6-v2", rag_state_folder_path=str(temp_rag_folder)
+    ).migrate_file(test_file_id)
+
+    assert read_rag_pointer(test_file_id, temp_rag_folder)["generation"] == 2
+    assert not live_controller.state_path.exists()
+    assert not live_controller.index_path.exists()
+    assert not any(temp_rag_folder.glob(f"{test_file_id}_rag_texts*"))
+    assert (temp_rag_folder / f"{test_file_id}.g1_rag_state.pkl").exists()
+
+
+def test_migration_rebuilds_on_live_change(temp_rag_folder, test_file_id, live_controller):
+    """Test that changes saved to the live index during a migration aren't lost."""
+    migration = RAGMigrationController(TARGET_MODEL, rag_state_folder_path=str(temp_rag_folder))
+    build_generation = migration._build_generation
+    calls = []
+
+    def build_with_concurrent_change(file_id, controller):
+        new_controller = build_generation(file_id, controller)
+        if not calls:
+            live_controller.add_texts(["Added while migrating."])
+        calls.append(1)
+        return new_controller
+
+    with patch.object(migration, "_build_generation", side_effect=build_with_concurrent_change):
+        migration.migrate_file(test_file_id)
+
+    assert len(calls) == 2
+    migrated = RAGController.from_file_id(test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    assert "Added while migrating." in migrated.text_store.values()
+
+
+def test_migration_rebuilds_on_change_after_loading(temp_rag_folder, test_file_id, live_controller):
+    """Test that a save right after the live index was loaded for migration isn't lost."""
+    migration = RAGMigrationController(TARGET_MODEL, rag_state_folder_path=str(temp_rag_folder))
+    load_state = RAGController.load_state
+    loads = []
+
+    def load_then_change(state_path, **kwargs):
+        controller = load_state(state_path, **kwargs)
+        if not loads:
+            live_controller.add_texts(["Added after loading."])
+        loads.append(1)
+        return controller
+
+    with patch.object(RAGController, "load_state", side_effect=load_then_change):
+        migration.migrate_file(test_file_id)
+
+    migrated = RAGController.from_file_id(test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    assert "Added after loading." in migrated.text_store.values()
+
+
+def test_saves_wait_for_the_pointer_flip(temp_rag_folder, test_file_id, live_controller):
+    """Test that the live index isn't saved while a migration checks it and flips the pointer."""
+    saver = threading.Thread(target=live_controller.add_texts, args=(["Saved later."],))
+
+    with rag_file_lock(test_file_id, temp_rag_folder):
+        saver.start()
+        saver.join(timeout=0.2)
+        assert saver.is_alive()
+    saver.join(timeout=5)
+
+    assert not saver.is_alive()
+    reloaded = RAGController(file_id=test_file_id, rag_state_folder_path=str(temp_rag_folder))
+    assert "Saved later." in reloaded.text_store.values()
+
+
+def test_rate_limit(temp_rag_folder, test_file_id, live_controller):
+    """Test that re-embedding sleeps to respect the texts per second limit."""
+    migration = RAGMigrationController(
+        TARGET_MODEL,
+        rag_state_folder_path=str(temp_rag_folder),
+        max_texts_per_second=10,
+        batch_size=1,
+    )
+
+    with patch("src.qa_gpt.core.controller.rag_migration_controller.time.sleep") as mock_sleep:
+        migration.migrate_file(test_file_id)
+
+    assert mock_sleep.call_count == 2
+    assert all(0 < call.args[0] <= 0.2 for call in mock_sleep.call_args_list)
@@ -0,0 +1,54 @@
+import pytest
+
+from src.qa_gpt.core.controller.rag_query_cache import RAGQueryCache
+
+
+@pytest.fixture
+def cache():
+    return RAGQueryCache(max_entries=2)
+
+
+def test_hit_and_miss_counters(cache):
+    """Test that lookups are counted as hits and misses."""
+    assert cache.get(("file1", 0, "query", 5)) is None
+    cache.put(("file1", 0, "query", 5), [("text", 0.1)])
+
+    assert cache.get(("file1", 0, "query", 5)) == [("text", 0.1)]
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_results_are_copied(cache):
+    """Test that callers can't modify the cached results."""
+    results = [("text", 0.1)]
+    cache.put("key", results)
+    results.append(("other", 0.2))
+
+    cached_results = cache.get("key")
+    cached_results.clear()
+
+    assert cache.get("key") == [("text", 0.1)]
+
+
+def test_lru_eviction(cache):
+    """Test that the least recently used results are evicted over capacity."""
+    cache.put("a", [1])
+    cache.put("b", [2])
+    cache.get("a")
+    cache.put("c", [3])
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == [1]
+    assert cache.get("c") == [3]
+
+
+def test_clear(cache):
+    """Test that clearing drops the results and resets the counters."""
+    cache.put("a", [1])
+    cache.get("a")
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.hits == 0
+    assert cache.misses == 0
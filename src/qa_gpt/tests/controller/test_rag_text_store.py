@@ -0,0 +1,96 @@
+import pytest
+
+from src.qa_gpt.core.controller.rag_text_store import MetadataStore, TextStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TextStore(tmp_path / "file1_rag_texts")
+
+
+def test_save_and_reopen(store, tmp_path):
+    """Test that saved texts are read back by ID from a reopened store."""
+    store[0] = "first"
+    store[5] = "sixth ü"
+    store.save()
+
+    reopened = TextStore(tmp_path / "file1_rag_texts")
+    assert len(reopened) == 2
+    assert reopened[5] == "sixth ü"
+    assert list(reopened) == [0, 5]
+    assert 1 not in reopened
+    with pytest.raises(KeyError):
+        reopened[1]
+
+
+def test_unsaved_changes_overlay_saved_texts(store):
+    """Test that replaced and removed entries are visible before they are saved."""
+    store.update({0: "first", 1: "second"})
+    store.save()
+
+    store[1] = "replaced"
+    del store[0]
+    store[2] = "third"
+
+    assert store.is_dirty
+    assert dict(store) == {1: "replaced", 2: "third"}
+    with pytest.raises(KeyError):
+        del store[0]
+
+
+def test_append_only_until_compaction(store, tmp_path):
+    """Test that saves append to the data file and compact it once dead texts dominate."""
+    store.update({0: "a" * 10, 1: "b" * 10})
+    store.save()
+    data_path = tmp_path / "file1_rag_texts.0.bin"
+    assert data_path.stat().st_size == 20
+
+    store[2] = "c" * 10
+    store.save()
+    assert data_path.stat().st_size == 30
+
+    # Dead texts now outweigh the live ones
+    reader = TextStore(tmp_path / "file1_rag_texts")
+    del store[0]
+    del store[1]
+    store.save()
+
+    assert (tmp_path / "file1_rag_texts.1.bin").stat().st_size == 10
+    assert dict(TextStore(tmp_path / "file1_rag_texts")) == {2: "c" * 10}
+    # A reader of the previous records still finds their data file
+    assert reader[0] == "a" * 10
+
+    # The next compaction removes it
+    store[3] = "d" * 10
+    store.save()
+    del store[2]
+    del store[3]
+    store[4] = "e"
+    store.save()
+    assert not data_path.exists()
+    assert (tmp_path / "file1_rag_texts.1.bin").exists()
+    assert dict(TextStore(tmp_path / "file1_rag_texts")) == {4: "e"}
+
+
+def test_clear(store, tmp_path):
+    """Test that clearing a saved store drops its texts on the next save."""
+    store[0] = "first"
+    store.save()
+
+    store.clear()
+    store[3] = "new"
+    store.save()
+
+    assert dict(TextStore(tmp_path / "file1_rag_texts")) == {3: "new"}
+
+
+def test_metadata_store(tmp_path):
+    """Test that metadata dictionaries round-trip through JSON."""
+    store = MetadataStore(tmp_path / "file1_rag_metadata")
+    store[0] = {"section_index": 1, "section_title": "Intro"}
+    store.save()
+
+    assert MetadataStore(tmp_path / "file1_rag_metadata")[0] == {
+        "section_index": 1,
+        "section_title": "Intro",
+    }
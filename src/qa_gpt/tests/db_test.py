@@ -104,7 +104,41 @@ def test_local_material_controller_output():
         db_path.unlink()
 
 
+def test_material_controller_generation_failures():
+    test_db_name = "test_failure_db"
+    test_archive_name = "test_archive"
+    db_path = Path(f"{LOCAL_DB_FOLDER}/{test_db_name}.pkl")
+    if db_path.exists():
+        db_path.unlink()
+
+    test_local_db_controller = LocalDatabaseController(db_name=test_db_name)
+    test_material_controller = MaterialController(
+        db_controller=test_local_db_controller, archive_name=test_archive_name
+    )
+    task_key = "questions:StandardSummary_motivation"
+
+    test_material_controller.record_generation_failure("1", task_key, ValueError("first"))
+    test_material_controller.record_generation_failure("1", task_key, ValueError("second"))
+
+    # Failure records persist across controller instances
+    reloaded_controller = MaterialController(
+        db_controller=LocalDatabaseController(db_name=test_db_name),
+        archive_name=test_archive_name,
+    )
+    failures = reloaded_controller.get_generation_failures("1")
+    assert failures[task_key]["attempts"] == 2
+    assert failures[task_key]["error"] == "ValueError: second"
+    assert reloaded_controller.get_generation_failures("2") == {}
+
+    reloaded_controller.clear_generation_failure("1", task_key)
+    reloaded_controller.clear_generation_failure("1", task_key)  # Clearing twice is harmless
+    assert reloaded_controller.get_generation_failures("1") == {}
+
+    db_path.unlink()
+
+
 if __name__ == "__main__":
     test_local_db()
     test_local_material_controller_input()
     test_local_material_controller_output()
+    test_material_controller_generation_failures()
@@ -0,0 +1,44 @@
+import pytest
+
+from src.qa_gpt.core.utils.dedup_utils import (
+    find_near_duplicates,
+    jaccard_similarity,
+    shingles,
+)
+
+
+def test_shingles_ignore_case_and_punctuation():
+    """Test that shingles are word n-grams independent of case and punctuation."""
+    assert shingles("The quick, brown fox jumps!", shingle_size=3) == {
+        "the quick brown",
+        "quick brown fox",
+        "brown fox jumps",
+    }
+    assert shingles("Short text.", shingle_size=3) == {"short text"}
+
+
+def test_jaccard_similarity():
+    """Test the Jaccard similarity of shingle sets."""
+    assert jaccard_similarity({"a", "b"}, {"b", "c"}) == pytest.approx(1 / 3)
+    assert jaccard_similarity(set(), set()) == 1.0
+
+
+def test_find_near_duplicates_groups_similar_texts():
+    """Test that near duplicates map to the first text of their group and others to themselves."""
+    base = " ".join(f"word{i}" for i in range(60))
+    texts = [
+        base,
+        "A completely different paragraph about retrieval augmented generation.",
+        base.replace("word30", "changed"),  # 5 of 56 shingles differ
+        base.upper(),
+        " ".join(f"other{i}" for i in range(60)),
+    ]
+
+    assert find_near_duplicates(texts, threshold=0.8) == [0, 1, 0, 0, 4]
+    assert find_near_duplicates(texts, threshold=1.0) == [0, 1, 2, 0, 4]
+
+
+def test_find_near_duplicates_rejects_uneven_bands():
+    """Test that the signature length must split evenly into bands."""
+    with pytest.raises(ValueError):
+        find_near_duplicates(["text"], num_perm=10, num_bands=3)
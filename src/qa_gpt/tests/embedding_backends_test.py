@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from src.qa_gpt.core.utils.embedding_backends import (
+    OnnxEmbeddingBackend,
+    SentenceTransformerBackend,
+    get_embedding_backend,
+    pool_token_embeddings,
+)
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+# Minimum cosine similarity between ONNX and torch vectors of the same text
+FP32_TOLERANCE = 0.9999
+INT8_TOLERANCE = 0.98
+
+TEST_TEXTS = [
+    "The quick brown fox jumps over the lazy dog",
+    "A journey of a thousand miles begins with a single step",
+    "We propose a retrieval augmented method to generate questions from papers.",
+    "short",
+]
+
+
+def _cosine_similarities(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def test_mean_pooling_ignores_padding():
+    token_embeddings = np.array([[[1.0, 1.0], [3.0, 3.0], [100.0, 100.0]]])
+    attention_mask = np.array([[1, 1, 0]])
+
+    pooled = pool_token_embeddings(token_embeddings, attention_mask, "mean")
+    np.testing.assert_array_almost_equal(pooled, [[2.0, 2.0]])
+
+
+def test_cls_and_max_pooling():
+    token_embeddings = np.array([[[1.0, 5.0], [3.0, 2.0], [100.0, 100.0]]])
+    attention_mask = np.array([[1, 1, 0]])
+
+    np.testing.assert_array_almost_equal(
+        pool_token_embeddings(token_embeddings, attention_mask, "cls"), [[1.0, 5.0]]
+    )
+    np.testing.assert_array_almost_equal(
+        pool_token_embeddings(token_embeddings, attention_mask, "max"), [[3.0, 5.0]]
+    )
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        get_embedding_backend(MODEL_NAME, "unknown")
+
+
+@pytest.mark.parametrize("quantize, tolerance", [(False, FP32_TOLERANCE), (True, INT8_TOLERANCE)])
+def test_onnx_vectors_match_torch(tmp_path, quantize, tolerance):
+    """Test that ONNX vectors stay compatible with indexes built by the torch backend."""
+    pytest.importorskip("onnxruntime")
+
+    torch_backend = SentenceTransformerBackend(MODEL_NAME)
+    onnx_backend = OnnxEmbeddingBackend(MODEL_NAME, quantize=quantize, cache_folder=str(tmp_path))
+
+    torch_vectors = torch_backend.encode(TEST_TEXTS)
+    onnx_vectors = onnx_backend.encode(TEST_TEXTS, batch_size=3)
+
+    assert onnx_vectors.shape == torch_vectors.shape
+    assert onnx_vectors.dtype == np.float32
+    assert _cosine_similarities(torch_vectors, onnx_vectors).min() >= tolerance
+
+    # Nearest neighbours of the torch vectors are unchanged
+    similarities = onnx_vectors @ torch_vectors.T
+    assert (similarities.argmax(axis=1) == np.arange(len(TEST_TEXTS))).all()
+
+
+def test_onnx_single_text(tmp_path):
+    pytest.importorskip("onnxruntime")
+
+    onnx_backend = OnnxEmbeddingBackend(MODEL_NAME, cache_folder=str(tmp_path))
+    vector = onnx_backend.encode("A single query")
+
+    assert vector.shape == (onnx_backend.get_sentence_embedding_dimension(),)
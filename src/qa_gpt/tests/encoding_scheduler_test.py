@@ -0,0 +1,62 @@
+import numpy as np
+
+from src.qa_gpt.core.utils.embedding_backends import EmbeddingBackend
+from src.qa_gpt.core.utils.encoding_scheduler import encode_scheduled, plan_batches
+
+
+class FakeBackend(EmbeddingBackend):
+    """Encodes a text into [number of words, first letter] and records the batches."""
+
+    model_name = "fake"
+
+    def __init__(self):
+        self.batches = []
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return 2
+
+    def encode(self, texts, batch_size=32):
+        self.batches.append(list(texts))
+        return np.array([[len(text.split()), ord(text[0])] for text in texts], dtype="float32")
+
+    def count_tokens(self, texts):
+        return [len(text.split()) for text in texts]
+
+
+def test_plan_batches_respects_token_budget():
+    """Test that batches are sorted by length and fit the padded token budget."""
+    token_counts = [10, 100, 12, 90, 11, 300]
+    batches = plan_batches(token_counts, token_budget=200, max_batch_size=8)
+
+    assert batches == [[5], [1, 3], [2, 4, 0]]
+    for batch in batches[1:]:
+        assert max(token_counts[i] for i in batch) * len(batch) <= 200
+
+
+def test_plan_batches_max_batch_size():
+    """Test that short texts are capped by the batch size."""
+    batches = plan_batches([1] * 10, token_budget=1000, max_batch_size=4)
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+
+
+def test_encode_scheduled_restores_order():
+    """Test that embeddings come back in input order with padding stats."""
+    backend = FakeBackend()
+    texts = ["a b", "b " * 50, "c", "d " * 48, "e f g"]
+
+    embeddings, stats = encode_scheduled(backend, texts, token_budget=100)
+
+    np.testing.assert_array_equal(embeddings[:, 1], [ord(text[0]) for text in texts])
+    np.testing.assert_array_equal(embeddings[:, 0], backend.count_tokens(texts))
+    assert len(backend.batches) == stats.num_batches == 2
+    assert stats.real_tokens == 104
+    assert stats.padded_tokens == 50 * 2 + 3 * 3
+    assert stats.padding_efficiency > stats.arrival_padding_efficiency
+
+
+def test_encode_scheduled_empty():
+    """Test that encoding no texts returns an empty array."""
+    embeddings, stats = encode_scheduled(FakeBackend(), [])
+    assert embeddings.shape == (0, 2)
+    assert stats.num_batches == 0
+    assert stats.padding_efficiency == 1.0
@@ -0,0 +1,140 @@
+from unittest.mock import patch
+
+import pytest
+from pydantic import BaseModel
+
+from src.qa_gpt.chat import chat
+from src.qa_gpt.chat.llm_cache import LLMCacheMiss, LLMResponseCache
+
+
+class Answer(BaseModel):
+    text: str
+
+
+class OtherAnswer(BaseModel):
+    text: str
+    score: int
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+MESSAGES = [{"role": "user", "content": "question"}]
+
+
+def test_key_covers_model_messages_schema_and_params():
+    """Test that every input that changes the response changes the key."""
+    key = LLMResponseCache.make_key("model-a", MESSAGES, Answer)
+
+    assert key == LLMResponseCache.make_key("model-a", [dict(MESSAGES[0])], Answer)
+    assert key != LLMResponseCache.make_key("model-b", MESSAGES, Answer)
+    assert key != LLMResponseCache.make_key(
+        "model-a", [{"role": "user", "content": "other"}], Answer
+    )
+    assert key != LLMResponseCache.make_key("model-a", MESSAGES, OtherAnswer)
+    assert key != LLMResponseCache.make_key("model-a", MESSAGES)
+    assert key != LLMResponseCache.make_key("model-a", MESSAGES, Answer, {"temperature": 0.5})
+
+
+def test_cache_round_trip_and_ttl(tmp_path):
+    """Test that responses persist across cache instances until they expire."""
+    clock = FakeClock()
+    path = tmp_path / "cache.sqlite"
+    cache = LLMResponseCache(path, mode="read-write", ttl_seconds=60, clock=clock)
+    key = cache.make_key("model", MESSAGES, Answer)
+
+    assert cache.get(key, Answer) is None
+    cache.put(key, Answer(text="cached"))
+    cache.close()
+
+    reopened = LLMResponseCache(path, mode="read-write", ttl_seconds=60, clock=clock)
+    assert reopened.get(key, Answer) == Answer(text="cached")
+    assert (reopened.hits, reopened.misses) == (1, 0)
+
+    clock.now += 61
+    assert reopened.get(key, Answer) is None
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """Test that the least recently read responses are evicted over the size limit."""
+    clock = FakeClock()
+    entry_size = len(Answer(text="0").model_dump_json())
+    cache = LLMResponseCache(
+        tmp_path / "cache.sqlite", mode="read-write", max_bytes=2 * entry_size, clock=clock
+    )
+    keys = [cache.make_key("model", MESSAGES, Answer, {"n": i}) for i in range(3)]
+
+    cache.put(keys[0], Answer(text="0"))
+    clock.now += 1
+    cache.put(keys[1], Answer(text="1"))
+    clock.now += 1
+    cache.get(keys[0], Answer)  # Now the second entry is the least recently used
+    clock.now += 1
+    cache.put(keys[2], Answer(text="2"))
+
+    assert len(cache) == 2
+    assert cache.get(keys[0], Answer) is not None
+    assert cache.get(keys[1], Answer) is None
+
+
+def test_replay_mode_is_read_only(tmp_path):
+    """Test that replay mode serves recorded responses and raises on a miss."""
+    path = tmp_path / "cache.sqlite"
+    recorder = LLMResponseCache(path, mode="read-write")
+    key = recorder.make_key("model", MESSAGES, Answer)
+    recorder.put(key, Answer(text="recorded"))
+    recorder.close()
+
+    replay = LLMResponseCache(path, mode="replay")
+    assert replay.get(key, Answer) == Answer(text="recorded")
+    replay.put(replay.make_key("model", [], Answer), Answer(text="new"))  # Ignored
+    with pytest.raises(LLMCacheMiss):
+        replay.get(replay.make_key("model", [], Answer), Answer)
+
+    with pytest.raises(LLMCacheMiss):
+        LLMResponseCache(tmp_path / "missing.sqlite", mode="replay").get(key, Answer)
+
+
+def test_off_mode_stores_nothing(tmp_path):
+    """Test that a disabled cache neither reads nor writes the database."""
+    path = tmp_path / "cache.sqlite"
+    cache = LLMResponseCache(path, mode="off")
+    key = cache.make_key("model", MESSAGES, Answer)
+
+    cache.put(key, Answer(text="ignored"))
+
+    assert cache.get(key, Answer) is None
+    assert not path.exists()
+
+
+@pytest.mark.asyncio
+async def test_structured_request_can_bypass_the_cache(tmp_path):
+    """Test that a request without the cache asks the model and refreshes the cached response."""
+    cache = LLMResponseCache(tmp_path / "cache.sqlite", mode="read-write")
+    answers = iter([Answer(text="first"), Answer(text="second")])
+
+    async def request(messages, res_obj, route):
+        return next(answers)
+
+    with (
+        patch.object(chat, "llm_response_cache", cache),
+        patch.object(chat, "_request_chat_gpt_response_structure_async", side_effect=request),
+    ):
+        assert await chat.get_chat_gpt_response_structure_async(MESSAGES, Answer) == Answer(
+            text="first"
+        )
+        assert await chat.get_chat_gpt_response_structure_async(MESSAGES, Answer) == Answer(
+            text="first"
+        )
+        regenerated = await chat.get_chat_gpt_response_structure_async(
+            MESSAGES, Answer, use_cache=False
+        )
+        assert regenerated == Answer(text="second")
+        assert await chat.get_chat_gpt_response_structure_async(MESSAGES, Answer) == Answer(
+            text="second"
+        )
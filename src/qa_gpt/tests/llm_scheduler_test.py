@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+
+from src.qa_gpt.chat.llm_scheduler import LLMScheduler, TokenBucket
+from src.qa_gpt.core.objects.questions import MultipleChoiceQuestionSet
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_waits_for_refill():
+    """Test that reservations beyond the balance wait for the refill, in order."""
+    clock = FakeClock()
+    bucket = TokenBucket(capacity=10, refill_per_second=2, clock=clock)
+
+    assert bucket.reserve(8) == 0
+    assert bucket.reserve(4) == pytest.approx(1.0)  # 2 short, refilled after 1 second
+    assert bucket.reserve(2) == pytest.approx(2.0)  # Queued behind the previous reservation
+
+    clock.now = 10.0
+    assert bucket.balance == 10  # Refill is capped at the capacity
+    assert bucket.reserve(50) == pytest.approx(0.0)  # Oversized requests are capped
+
+
+def test_scheduler_enforces_both_budgets():
+    """Test that the tighter of the request and token budgets sets the wait."""
+    clock = FakeClock()
+    scheduler = LLMScheduler(
+        requests_per_minute=2, tokens_per_minute=6000, max_completion_tokens=100, clock=clock
+    )
+
+    assert scheduler.reserve(1000) == 0
+    assert scheduler.reserve(1000) == 0
+    assert scheduler.reserve(1000) == pytest.approx(30.0)  # 1 request per 30 seconds
+
+    clock.now = 60.0
+    assert scheduler.reserve(6000) == 0
+    assert scheduler.reserve(3000) == pytest.approx(30.0)  # 100 tokens per second
+
+
+def test_scheduler_settle_refunds_unused_tokens():
+    """Test that settling with the actual usage returns the unused reservation."""
+    clock = FakeClock()
+    scheduler = LLMScheduler(requests_per_minute=100, tokens_per_minute=1000, clock=clock)
+
+    scheduler.reserve(1000)
+    scheduler.settle(1000, used_tokens=400)
+    assert scheduler.token_bucket.balance == pytest.approx(600)
+    assert scheduler.reserve(600) == 0
+
+
+def test_estimate_request_tokens_includes_schema_and_completion():
+    """Test that the estimate covers the messages, the response schema and the completion."""
+    scheduler = LLMScheduler(max_completion_tokens=100)
+    messages = [{"role": "user", "content": "one two three"}]
+
+    plain = scheduler.estimate_request_tokens(messages)
+    structured = scheduler.estimate_request_tokens(messages, MultipleChoiceQuestionSet)
+    assert plain == 3 + 4 + 100
+    assert structured > plain
+
+
+@pytest.mark.asyncio
+async def test_acquire_starts_requests_as_budget_allows():
+    """Test that requests within the budget start immediately and the rest are paced."""
+    scheduler = LLMScheduler(requests_per_minute=600, tokens_per_minute=10**6)
+    # Drain the burst so requests are paced at 10 per second
+    scheduler.request_bucket.reserve(scheduler.request_bucket.capacity)
+
+    start = time.monotonic()
+    await asyncio.gather(*(scheduler.acquire(10) for _ in range(3)))
+    elapsed = time.monotonic() - start
+    assert 0.25 <= elapsed < 1.0
+
+
+def test_scheduler_records_cached_prompt_tokens():
+    """Test that settled requests accumulate the prompt tokens served from the prompt cache."""
+    scheduler = LLMScheduler(requests_per_minute=60, tokens_per_minute=60000, clock=FakeClock())
+
+    scheduler.settle(5000, 1500, prompt_tokens=1200, cached_tokens=0)
+    scheduler.settle(5000, 1500, prompt_tokens=1200, cached_tokens=1024)
+    scheduler.settle(5000, None)
+
+    assert scheduler.prompt_tokens == 2400
+    assert scheduler.cached_tokens == 1024
+    assert scheduler.cached_token_ratio == pytest.approx(1024 / 2400)
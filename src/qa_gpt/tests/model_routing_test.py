@@ -0,0 +1,92 @@
+import json
+from unittest.mock import patch
+
+import pytest
+from pydantic import BaseModel
+
+from src.qa_gpt.chat import chat
+from src.qa_gpt.chat.llm_cache import LLMResponseCache
+from src.qa_gpt.chat.model_routing import ModelRoute, ModelRoutingPolicy
+
+
+class Answer(BaseModel):
+    text: str
+
+
+def test_route_falls_back_from_field_to_class_to_default():
+    """Test that the most specific route of a key is picked."""
+    policy = ModelRoutingPolicy.from_config(
+        {
+            "default": {"model": "base"},
+            "MultipleChoiceQuestionSet": {"model": "small", "max_tokens": 800},
+            "MultipleChoiceQuestionSet.methodology": {"model": "large"},
+        }
+    )
+
+    assert policy.route("MultipleChoiceQuestionSet.methodology").model == "large"
+    assert policy.route("MultipleChoiceQuestionSet.motivation") == ModelRoute("small", 800)
+    assert policy.route("TechnicalSummary").model == "base"
+    assert policy.route(None).model == "base"
+    assert ModelRoute("small", 800).params == {"max_completion_tokens": 800}
+    assert ModelRoute("base").params == {}
+
+
+def test_combined_request_gets_the_limit_of_all_parts():
+    """Test that a request combining several responses has room for each of them."""
+    policy = ModelRoutingPolicy.from_config(
+        {
+            "default": {"model": "base"},
+            "MultipleChoiceQuestionSet": {
+                "model": "small",
+                "max_tokens": 800,
+                "escalate_to": "large",
+            },
+            "MetaDataSummary": {"model": "tiny", "max_tokens": 256},
+        }
+    )
+
+    assert policy.route(("MultipleChoiceQuestionSet",) * 3) == ModelRoute("small", 2400, "large")
+    assert policy.route(("MetaDataSummary", "TechnicalSummary")) == ModelRoute("tiny")
+
+
+def test_routes_file_overrides_defaults(tmp_path):
+    """Test that a routes file replaces single routes without code changes."""
+    routes_file = tmp_path / "routes.json"
+    routes_file.write_text(json.dumps({"MetaDataSummary": {"model": "tiny", "max_tokens": 256}}))
+
+    policy = ModelRoutingPolicy.load(str(routes_file))
+
+    assert policy.route("MetaDataSummary") == ModelRoute("tiny", 256)
+    assert policy.route("StandardSummary") == policy.default
+
+
+@pytest.mark.asyncio
+async def test_structured_request_escalates_on_parsing_failure(tmp_path):
+    """Test that a failed structured response is retried once with the stronger model."""
+    policy = ModelRoutingPolicy.from_config(
+        {"default": {"model": "small", "max_tokens": 100, "escalate_to": "large"}}
+    )
+    models = []
+
+    async def request(messages, res_obj, route):
+        models.append((route.model, route.max_tokens))
+        if route.model == "small":
+            raise chat.StructuredOutputRefusal("Output was cut off")
+        return Answer(text="done")
+
+    cache = LLMResponseCache(tmp_path / "cache.sqlite", mode="read-write")
+    with (
+        patch.object(chat, "model_routing_policy", policy),
+        patch.object(chat, "llm_response_cache", cache),
+        patch.object(chat, "_request_chat_gpt_response_structure_async", side_effect=request),
+    ):
+        messages = [{"role": "user", "content": "question"}]
+        assert await chat.get_chat_gpt_response_structure_async(messages, Answer) == Answer(
+            text="done"
+        )
+        # The escalated response is served from the cache under the original route
+        assert await chat.get_chat_gpt_response_structure_async(messages, Answer) == Answer(
+            text="done"
+        )
+
+    assert models == [("small", 100), ("large", None)]
@@ -0,0 +1,51 @@
+from src.qa_gpt.core.utils.prompt_budget import (
+    PromptPart,
+    fit_prompt_parts,
+    truncate_to_tokens,
+)
+from src.qa_gpt.core.utils.token_utils import estimate_tokens
+
+
+def test_truncate_to_tokens():
+    """Test that texts are cut at a token boundary."""
+    assert truncate_to_tokens("one, two three", 2) == "one,"
+    assert truncate_to_tokens("one two", 5) == "one two"
+    assert truncate_to_tokens("one two", 0) == ""
+
+
+def test_fit_prompt_parts_in_priority_order():
+    """Test that higher priority parts are kept whole and the rest fills the remaining budget."""
+    field_value = "field " * 10
+    clips = "clip " * 20
+    paper = "paper " * 1000
+
+    fitted = fit_prompt_parts(
+        [PromptPart("field", field_value), PromptPart("clips", clips), PromptPart("paper", paper)],
+        token_budget=100,
+    )
+
+    assert fitted["field"] == field_value
+    assert fitted["clips"] == clips
+    assert estimate_tokens(fitted["paper"]) == 70
+    assert paper.startswith(fitted["paper"])
+
+
+def test_fit_prompt_parts_drops_untruncatable_part():
+    """Test that a part that must stay whole is dropped and smaller parts still fit."""
+    fitted = fit_prompt_parts(
+        [
+            PromptPart("table", "cell " * 50, truncatable=False),
+            PromptPart("clips", "clip " * 5),
+        ],
+        token_budget=20,
+    )
+
+    assert fitted == {"table": "", "clips": "clip " * 5}
+
+
+def test_fit_prompt_parts_logs_usage(caplog):
+    """Test that the estimated tokens before and after budgeting are logged."""
+    with caplog.at_level("INFO"):
+        fit_prompt_parts([PromptPart("paper", "word " * 50)], 10, request_name="test request")
+
+    assert "test request: 50 -> 10" in caplog.text
@@ -20,6 +20,14 @@ from src.qa_gpt.core.objects.summaries import (
 )
 
 
+def report_results(results: list, on_result) -> list:
+    """Report results as they would be by QAController, position by position."""
+    if on_result is not None:
+        for position, result in enumerate(results):
+            on_result(position, result)
+    return results
+
+
 @pytest.fixture
 def test_pdf_folder(tmp_path):
     # Create a test PDF folder with a sample PDF
@@ -94,8 +102,8 @@ async def test_fetch_material_add_summary_flow(
     )
 
     # Setup mock to return coroutines for async functions
-    async def mock_get_summaries_batch(*args, **kwargs):
-        return [technical_summary, innovation_summary]
+    async def mock_get_summaries_batch(*args, on_result=None, **kwargs):
+        return report_results([technical_summary, innovation_summary], on_result)
 
     mock_qa_controller.get_summaries_batch.side_effect = mock_get_summaries_batch
 
@@ -174,8 +182,10 @@ async def test_fetch_material_add_sets_flow(
     )
 
     # Setup mock to return coroutines for async functions
-    async def mock_get_questions_batch(*args, **kwargs):
-        return [question_set] * len(args[0])  # Return a question set for each file path
+    async def mock_get_questions_batch(*args, on_result=None, **kwargs):
+        return report_results(
+            [question_set] * len(args[0]), on_result
+        )  # Return a question set for each file path
 
     mock_qa_controller.get_questions_batch.side_effect = mock_get_questions_batch
 
@@ -286,11 +296,13 @@ async def test_full_script_flow(
     )
 
     # Setup mocks to return coroutines for async functions
-    async def mock_get_summaries_batch(*args, **kwargs):
-        return [standard_summary, technical_summary, innovation_summary]
+    async def mock_get_summaries_batch(*args, on_result=None, **kwargs):
+        return report_results([standard_summary, technical_summary, innovation_summary], on_result)
 
-    async def mock_get_questions_batch(*args, **kwargs):
-        return [question_set] * len(args[0])  # Return a question set for each file path
+    async def mock_get_questions_batch(*args, on_result=None, **kwargs):
+        return report_results(
+            [question_set] * len(args[0]), on_result
+        )  # Return a question set for each file path
 
     mock_qa_controller.get_summaries_batch.side_effect = mock_get_summaries_batch
     mock_qa_controller.get_questions_batch.side_effect = mock_get_questions_batch
@@ -364,8 +376,8 @@ async def test_fetch_material_add_summary_single_file(
     )
 
     # Setup mock to return coroutines for async functions
-    async def mock_get_summaries_batch(*args, **kwargs):
-        return [technical_summary, innovation_summary, metadata_summary]
+    async def mock_get_summaries_batch(*args, on_result=None, **kwargs):
+        return report_results([technical_summary, innovation_summary, metadata_summary], on_result)
 
     mock_qa_controller.get_summaries_batch.side_effect = mock_get_summaries_batch
 
@@ -451,8 +463,10 @@ async def test_fetch_material_add_sets_single_file(
     )
 
     # Setup mock to return coroutines for async functions
-    async def mock_get_questions_batch(*args, **kwargs):
-        return [question_set] * len(args[0])  # Return a question set for each file path
+    async def mock_get_questions_batch(*args, on_result=None, **kwargs):
+        return report_results(
+            [question_set] * len(args[0]), on_result
+        )  # Return a question set for each file path
 
     mock_qa_controller.get_questions_batch.side_effect = mock_get_questions_batch
 
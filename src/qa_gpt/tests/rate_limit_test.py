@@ -221,3 +221,19 @@ async def test_all_error_types():
         result = await test_func(error)
         assert result == "success"
         assert attempts == 3
+
+
+@pytest.mark.asyncio
+async def test_async_function_no_retry_errors():
+    """Test that errors listed in no_retry are raised without retrying."""
+    attempts = 0
+
+    @handle_openai_errors(max_retries=3, wait_time=0.1, no_retry=(CustomError,))
+    async def test_func():
+        nonlocal attempts
+        attempts += 1
+        raise CustomError("Same result on every attempt")
+
+    with pytest.raises(CustomError):
+        await test_func()
+    assert attempts == 1